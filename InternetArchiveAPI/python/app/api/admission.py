@@ -0,0 +1,336 @@
+"""
+Admission control of API requests: per-route concurrency limits, bounded
+wait queues and load shedding
+"""
+import os
+import math
+import time
+import asyncio
+import itertools
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Tuple
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from ..utils.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_REJECTIONS, ADMISSION_WAIT
+
+
+@dataclass
+class AdmissionPolicy:
+    """
+    How the requests of a route are admitted
+    """
+    # Waiting requests of a lower priority are admitted first
+    priority: int
+    # Requests of the route running at once
+    concurrency: int
+    # Requests of the route waiting at once, beyond which they are rejected
+    queue_size: int
+
+
+class AdmissionRejectedError(Exception):
+    """
+    Raised when a request is shed instead of waiting for a slot
+    """
+
+    def __init__(self, route: str, reason: str, retry_after: float):
+        super().__init__(f"{route} is overloaded ({reason})")
+        self.route = route
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RouteState:
+    """
+    Running and waiting requests of a route
+    """
+
+    def __init__(self, route: str, policy: AdmissionPolicy):
+        self.route = route
+        self.policy = policy
+        self.in_flight = 0
+        # (arrival order, future resolved once admitted)
+        self.waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        # Moving average of the seconds a request holds its slot, None until one completes
+        self.service_time: Optional[float] = None
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "deadline": 0, "timeout": 0}
+
+    def estimated_wait(self) -> float:
+        """
+        Estimate the seconds a new request would wait for a slot of the route,
+        from the requests ahead of it and the time each one holds a slot
+        """
+        if self.service_time is None:
+            return 0.0
+        return (len(self.waiters) + 1) / self.policy.concurrency * self.service_time
+
+
+class AdmissionController:
+    """
+    Admits requests under a limit of requests running at once, both per route
+    and for the whole worker.
+
+    A request finding its route or the worker at its limit waits in the
+    bounded queue of its route. When a slot is freed, the waiting request of
+    the lowest priority route is admitted first, in arrival order within a
+    priority, so cheap routes overtake heavy ones. A request is rejected
+    without waiting when the queue of its route is full or when its estimated
+    wait exceeds the deadline, and after waiting for the deadline.
+    """
+    # Configuration, overridable through environment variables
+    ENABLED = os.getenv("ARCHIVE_ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+    MAX_CONCURRENCY = int(os.getenv("ARCHIVE_ADMISSION_MAX_CONCURRENCY", "64"))
+    LIGHT_CONCURRENCY = int(os.getenv("ARCHIVE_ADMISSION_LIGHT_CONCURRENCY", "32"))
+    HEAVY_CONCURRENCY = int(os.getenv("ARCHIVE_ADMISSION_HEAVY_CONCURRENCY", "16"))
+    QUEUE_SIZE = int(os.getenv("ARCHIVE_ADMISSION_QUEUE_SIZE", "32"))
+    DEADLINE = float(os.getenv("ARCHIVE_ADMISSION_DEADLINE", "5"))
+    # Weight of the latest request in the moving average of the service time
+    SERVICE_TIME_WEIGHT = 0.2
+
+    CHEAP = AdmissionPolicy(0, MAX_CONCURRENCY, QUEUE_SIZE)
+    LIGHT = AdmissionPolicy(1, LIGHT_CONCURRENCY, QUEUE_SIZE)
+    HEAVY = AdmissionPolicy(2, HEAVY_CONCURRENCY, QUEUE_SIZE)
+    # Policies keyed by route template, routes not listed are LIGHT and
+    # routes mapped to None are not limited
+    POLICIES: Dict[str, Optional[AdmissionPolicy]] = {
+        "/": CHEAP,
+        "/metrics": CHEAP,
+        "/api/v1/cache/stats": CHEAP,
+        "/api/v1/upstream/stats": CHEAP,
+        "/api/v1/admission/stats": CHEAP,
+        "/api/v1/explore": LIGHT,
+        "/api/v1/collections/{collection_id}": LIGHT,
+        "/api/v1/collections/{collection_id}/items": LIGHT,
+        "/api/v1/thumbnails/{identifier}": LIGHT,
+        "/api/v1/collections/{collection_id}/items:stream": HEAVY,
+        "/api/v1/videos/{video_id}": HEAVY,
+        "/api/v1/videos:batch": HEAVY,
+        # Long-lived streams are limited by the media proxy itself
+        "/api/v1/videos/{video_id}/play/{file:path}": None,
+    }
+
+    def __init__(self,
+                 max_concurrency: Optional[int] = None,
+                 deadline: Optional[float] = None,
+                 policies: Optional[Dict[str, Optional[AdmissionPolicy]]] = None):
+        """
+        Args:
+            max_concurrency: Requests of every route running at once
+            deadline: Longest wait in seconds for a slot, estimated or actual
+            policies: Admission policies keyed by route template, merged over POLICIES
+        """
+        self.max_concurrency = max_concurrency or self.MAX_CONCURRENCY
+        self.deadline = deadline if deadline is not None else self.DEADLINE
+        self.policies = {**self.POLICIES, **(policies or {})}
+        self.in_flight = 0
+        self._routes: Dict[str, RouteState] = {}
+        self._order = itertools.count()
+
+    def policy(self, route: str) -> Optional[AdmissionPolicy]:
+        return self.policies.get(route, self.LIGHT)
+
+    def _state(self, route: str, policy: AdmissionPolicy) -> RouteState:
+        state = self._routes.get(route)
+        if state is None:
+            state = self._routes[route] = RouteState(route, policy)
+        return state
+
+    def _start(self, state: RouteState) -> None:
+        state.in_flight += 1
+        state.admitted += 1
+        self.in_flight += 1
+        ADMISSION_IN_FLIGHT.inc(state.route)
+
+    def _reject(self, state: RouteState, reason: str, retry_after: float) -> AdmissionRejectedError:
+        state.rejected[reason] += 1
+        ADMISSION_REJECTIONS.inc(state.route, reason)
+        return AdmissionRejectedError(state.route, reason, max(1.0, retry_after))
+
+    def _forget(self, state: RouteState, waiter: Tuple[int, asyncio.Future]) -> None:
+        """
+        Remove a request that stops waiting before being admitted
+        """
+        state.waiters.remove(waiter)
+        ADMISSION_QUEUED.dec(state.route)
+        waiter[1].cancel()
+
+    def _dispatch(self) -> None:
+        """
+        Admit waiting requests while there are free slots, lowest priority
+        first, then in arrival order
+        """
+        while self.in_flight < self.max_concurrency:
+            best: Optional[RouteState] = None
+            for state in self._routes.values():
+                if not state.waiters or state.in_flight >= state.policy.concurrency:
+                    continue
+                if best is None or (state.policy.priority, state.waiters[0][0]) < (best.policy.priority, best.waiters[0][0]):
+                    best = state
+            if best is None:
+                return
+            _, future = best.waiters.popleft()
+            ADMISSION_QUEUED.dec(best.route)
+            self._start(best)
+            future.set_result(None)
+
+    async def acquire(self, route: str) -> bool:
+        """
+        Wait for a slot to serve a request of a route
+
+        Args:
+            route: The route template of the request
+
+        Returns:
+            Whether a slot was taken and must be released, False for routes
+            that are not limited
+
+        Raises:
+            AdmissionRejectedError: If the request is shed
+        """
+        policy = self.policy(route)
+        if policy is None:
+            return False
+        state = self._state(route, policy)
+        # Waiting requests are admitted as soon as a slot frees, so any request
+        # still waiting is blocked by limits that block this one too
+        if state.in_flight < policy.concurrency and self.in_flight < self.max_concurrency and not state.waiters:
+            self._start(state)
+            return True
+
+        estimated_wait = state.estimated_wait()
+        if len(state.waiters) >= policy.queue_size:
+            raise self._reject(state, "queue_full", estimated_wait)
+        if estimated_wait > self.deadline:
+            raise self._reject(state, "deadline", estimated_wait)
+
+        waiter = (next(self._order), asyncio.get_running_loop().create_future())
+        state.waiters.append(waiter)
+        ADMISSION_QUEUED.inc(route)
+        started_at = time.perf_counter()
+        try:
+            await asyncio.wait((waiter[1],), timeout=self.deadline)
+        except BaseException:
+            if waiter[1].done():
+                # Admitted just as the request was cancelled
+                self.release(route)
+            else:
+                self._forget(state, waiter)
+            raise
+        ADMISSION_WAIT.observe(route, value=time.perf_counter() - started_at)
+        if not waiter[1].done():
+            self._forget(state, waiter)
+            raise self._reject(state, "timeout", state.estimated_wait())
+        return True
+
+    def release(self, route: str, elapsed: Optional[float] = None) -> None:
+        """
+        Free the slot of a request and admit the next waiting ones
+
+        Args:
+            route: The route template of the request
+            elapsed: Seconds the request held its slot, to estimate waits
+        """
+        state = self._routes[route]
+        state.in_flight -= 1
+        self.in_flight -= 1
+        ADMISSION_IN_FLIGHT.dec(route)
+        if elapsed is not None:
+            if state.service_time is None:
+                state.service_time = elapsed
+            else:
+                state.service_time += self.SERVICE_TIME_WEIGHT * (elapsed - state.service_time)
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the running and waiting requests, admissions and rejections of
+        each route
+        """
+        return {
+            "enabled": True,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queued": sum(len(state.waiters) for state in self._routes.values()),
+            "deadline": self.deadline,
+            "routes": {
+                route: {
+                    "priority": state.policy.priority,
+                    "in_flight": state.in_flight,
+                    "concurrency": state.policy.concurrency,
+                    "queued": len(state.waiters),
+                    "queue_size": state.policy.queue_size,
+                    "admitted": state.admitted,
+                    "rejected": dict(state.rejected),
+                    "service_time": state.service_time,
+                    "estimated_wait": state.estimated_wait()
+                }
+                for route, state in self._routes.items()
+            }
+        }
+
+
+# Shared by the middleware and the statistics endpoint
+admission_controller = AdmissionController()
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware admitting each request through the AdmissionController of
+    its route template, and answering shed requests with 503 Service
+    Unavailable and a Retry-After header.
+
+    The route is matched here, before the router runs, and stored in the
+    scope so that requests shed before reaching the router are still
+    labelled by route in the metrics.
+    """
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        """
+        Args:
+            app: The wrapped ASGI application
+            controller: The admission controller, defaults to the shared one
+        """
+        self.app = app
+        self.controller = controller or admission_controller
+
+    @staticmethod
+    def _match(scope: Dict[str, Any]) -> Optional[Any]:
+        """
+        Find the route a request is dispatched to, or None when it matches none
+        """
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+        return None
+
+    async def __call__(self, scope: Dict[str, Any], receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = self._match(scope)
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+        scope.setdefault("route", route)
+
+        try:
+            admitted = await self.controller.acquire(route.path)
+        except AdmissionRejectedError as e:
+            response = JSONResponse(
+                {"detail": str(e)},
+                status_code=503,
+                headers={"Retry-After": str(math.ceil(e.retry_after))}
+            )
+            await response(scope, receive, send)
+            return
+        if not admitted:
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route.path, time.perf_counter() - started_at)
@@ -0,0 +1,172 @@
+"""
+HTTP caching of API responses: strong ETags, Cache-Control and conditional GETs
+"""
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from ..core.cache import ResponseCache
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+@dataclass
+class CachePolicy:
+    """
+    How the responses of a route are cached by clients
+    """
+    # Seconds clients and shared caches may reuse a response, None for "no-store"
+    max_age: Optional[int]
+    # Seconds an ETag is trusted to still match the current representation,
+    # so a matching conditional request is answered without running the route
+    validate_for: float = 0.0
+
+    @property
+    def cache_control(self) -> bytes:
+        if self.max_age is None:
+            return b"no-store"
+        return f"public, max-age={self.max_age}".encode("latin-1")
+
+
+def entity_tag(body: bytes) -> bytes:
+    """
+    Build the strong ETag of a response body from its content hash
+    """
+    return b'"' + hashlib.blake2b(body, digest_size=16).hexdigest().encode("ascii") + b'"'
+
+
+def matches(if_none_match: bytes, etag: bytes) -> bool:
+    """
+    Check an If-None-Match header against an ETag, with the weak comparison
+    the header calls for
+
+    Args:
+        if_none_match: The header value, "*" or a comma-separated list of ETags
+        etag: The ETag of the current representation
+
+    Returns:
+        Whether the client already holds the current representation
+    """
+    if if_none_match.strip() == b"*":
+        return True
+    return any(tag.strip().removeprefix(b"W/") == etag.removeprefix(b"W/") for tag in if_none_match.split(b","))
+
+
+class HttpCachingMiddleware:
+    """
+    ASGI middleware adding a strong ETag and a per-route Cache-Control header
+    to successful GET responses, and answering conditional requests whose
+    If-None-Match matches with 304 Not Modified.
+
+    The ETag of each URL is remembered for the `validate_for` period of its
+    route, which follows the upstream cache TTL of the data the route is
+    built from: within it, a matching conditional request is answered with
+    304 before the route runs, so neither upstream data nor serialization is
+    needed. Later, the route runs and the ETag of the new body is compared.
+    """
+    # Configuration, overridable through environment variables
+    MAX_AGE_EXPLORE = int(os.getenv("ARCHIVE_MAX_AGE_EXPLORE", "60"))
+    MAX_AGE_COLLECTION = int(os.getenv("ARCHIVE_MAX_AGE_COLLECTION", "300"))
+    MAX_AGE_VIDEO = int(os.getenv("ARCHIVE_MAX_AGE_VIDEO", "3600"))
+    # Thumbnails carry their own ETag, the content hash of the image, so they have no policy here
+    MAX_AGE_THUMBNAIL = int(os.getenv("ARCHIVE_MAX_AGE_THUMBNAIL", "604800"))
+    # Number of URLs whose ETag is remembered
+    ETAG_CACHE_SIZE = int(os.getenv("ARCHIVE_ETAG_CACHE_SIZE", "10000"))
+    POLICIES = {
+        "/api/v1/explore": CachePolicy(MAX_AGE_EXPLORE, ResponseCache.TTLS["search"]),
+        "/api/v1/collections/{collection_id}": CachePolicy(MAX_AGE_COLLECTION, ResponseCache.TTLS["search"]),
+        "/api/v1/collections/{collection_id}/items": CachePolicy(MAX_AGE_COLLECTION, ResponseCache.TTLS["search"]),
+        "/api/v1/videos/{video_id}": CachePolicy(MAX_AGE_VIDEO, ResponseCache.TTLS["metadata"]),
+        "/api/v1/cache/stats": CachePolicy(None),
+        "/api/v1/upstream/stats": CachePolicy(None),
+        "/api/v1/admission/stats": CachePolicy(None),
+        "/metrics": CachePolicy(None),
+    }
+
+    def __init__(self,
+                 app,
+                 policies: Optional[Dict[str, CachePolicy]] = None,
+                 etag_cache_size: Optional[int] = None):
+        """
+        Args:
+            app: The wrapped ASGI application
+            policies: Cache policies keyed by route template, merged over POLICIES
+            etag_cache_size: Maximum number of URLs whose ETag is remembered
+        """
+        self.app = app
+        self.policies = {**self.POLICIES, **(policies or {})}
+        self.etag_cache_size = etag_cache_size if etag_cache_size is not None else self.ETAG_CACHE_SIZE
+        # URL -> (ETag, headers of a 304, time the ETag stops being trusted, route)
+        self._etags: "OrderedDict[bytes, Tuple[bytes, Headers, float, Any]]" = OrderedDict()
+
+    def _remember(self, url: bytes, etag: bytes, headers: Headers, policy: CachePolicy, route: Any) -> None:
+        if policy.validate_for <= 0 or self.etag_cache_size <= 0:
+            return
+        self._etags[url] = (etag, headers, time.monotonic() + policy.validate_for, route)
+        self._etags.move_to_end(url)
+        while len(self._etags) > self.etag_cache_size:
+            self._etags.popitem(last=False)
+
+    @staticmethod
+    async def _send_not_modified(send, headers: Headers) -> None:
+        await send({"type": "http.response.start", "status": 304, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def __call__(self, scope: Dict[str, Any], receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        url = scope["path"].encode("utf-8") + b"?" + scope.get("query_string", b"")
+        if_none_match = dict(scope["headers"]).get(b"if-none-match")
+        if if_none_match is not None:
+            remembered = self._etags.get(url)
+            if remembered is not None:
+                etag, headers, valid_until, route = remembered
+                if time.monotonic() < valid_until:
+                    if matches(if_none_match, etag):
+                        # Label the request with its route as if the router had run
+                        scope["route"] = route
+                        await self._send_not_modified(send, headers)
+                        return
+                else:
+                    del self._etags[url]
+
+        start_message: Optional[Dict[str, Any]] = None
+        policy: Optional[CachePolicy] = None
+        chunks: List[bytes] = []
+
+        async def caching_send(message: Dict[str, Any]) -> None:
+            nonlocal start_message, policy
+            if message["type"] == "http.response.start":
+                route_policy = self.policies.get(getattr(scope.get("route"), "path", None))
+                headers = message.get("headers", [])
+                if route_policy is None or message["status"] != 200 or any(name.lower() == b"etag" for name, _ in headers):
+                    await send(message)
+                elif route_policy.max_age is None:
+                    await send({**message, "headers": [*headers, (b"cache-control", route_policy.cache_control)]})
+                else:
+                    # The body is needed to compute the ETag before the headers are sent
+                    policy = route_policy
+                    start_message = message
+                return
+            if start_message is None:
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            etag = entity_tag(body)
+            validators = [(b"etag", etag), (b"cache-control", policy.cache_control)]
+            self._remember(url, etag, validators, policy, scope.get("route"))
+            if if_none_match is not None and matches(if_none_match, etag):
+                await self._send_not_modified(send, validators)
+                return
+            await send({**start_message, "headers": [*start_message.get("headers", []), *validators]})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, caching_send)
@@ -0,0 +1,197 @@
+"""
+Response compression negotiated on Accept-Encoding
+"""
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from ..utils.compression import Codec, available_codecs, negotiate
+
+Headers = List[Tuple[bytes, bytes]]
+
+# Media types worth compressing; images and video are already compressed
+COMPRESSIBLE_TYPES = (b"application/json", b"application/x-ndjson", b"text/")
+
+
+class CompressedBodyCache:
+    """
+    LRU cache of compressed bodies keyed by their strong ETag and coding,
+    bounded by total compressed bytes
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._bodies: "OrderedDict[Tuple[bytes, str], bytes]" = OrderedDict()
+
+    def get(self, etag: bytes, coding: str) -> Optional[bytes]:
+        body = self._bodies.get((etag, coding))
+        if body is not None:
+            self._bodies.move_to_end((etag, coding))
+        return body
+
+    def set(self, etag: bytes, coding: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        previous = self._bodies.pop((etag, coding), None)
+        if previous is not None:
+            self.total_bytes -= len(previous)
+        self._bodies[(etag, coding)] = body
+        self.total_bytes += len(body)
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._bodies.popitem(last=False)
+            self.total_bytes -= len(evicted)
+
+
+def _coded_etag(etag: bytes, coding: str) -> bytes:
+    """
+    Derive the ETag of an encoded representation, which differs from the
+    unencoded one as strong ETags identify exact bytes
+    """
+    weak, tag = (b"W/", etag[2:]) if etag.startswith(b"W/") else (b"", etag)
+    return weak + tag[:-1] + b"-" + coding.encode("ascii") + b'"'
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing JSON and text responses with the best coding
+    the client accepts (brotli, zstd or gzip), when they are larger than a
+    threshold.
+
+    Compressed bodies of responses with a strong ETag are kept in a bounded
+    cache, so a hot response is compressed once rather than on every request.
+    Encoded responses get their own ETag, suffixed with the coding, and the
+    suffix is removed from If-None-Match before it reaches the application.
+    Streamed responses are compressed chunk by chunk.
+    """
+    # Configuration, overridable through environment variables
+    MIN_SIZE = int(os.getenv("ARCHIVE_COMPRESSION_MIN_SIZE", "1024"))
+    CACHE_BYTES = int(os.getenv("ARCHIVE_COMPRESSION_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+    def __init__(self,
+                 app,
+                 min_size: Optional[int] = None,
+                 cache_bytes: Optional[int] = None,
+                 codecs: Optional[Dict[str, Codec]] = None):
+        """
+        Args:
+            app: The wrapped ASGI application
+            min_size: Smallest body in bytes that is compressed
+            cache_bytes: Maximum size of the compressed bodies kept, 0 disables the cache
+            codecs: The codecs in order of preference, the installed ones by default
+        """
+        self.app = app
+        self.min_size = min_size if min_size is not None else self.MIN_SIZE
+        self.codecs = codecs if codecs is not None else available_codecs()
+        cache_bytes = cache_bytes if cache_bytes is not None else self.CACHE_BYTES
+        self.cache = CompressedBodyCache(cache_bytes) if cache_bytes > 0 else None
+
+    def _strip_codings(self, if_none_match: bytes) -> Tuple[bytes, Dict[bytes, bytes]]:
+        """
+        Remove the coding suffixes from the ETags of an If-None-Match header
+
+        Returns:
+            The header with unencoded ETags, and the ETags the client sent
+            keyed by their unencoded form
+        """
+        sent: Dict[bytes, bytes] = {}
+        tags = []
+        for tag in (tag.strip() for tag in if_none_match.split(b",")):
+            stripped = tag
+            for coding in self.codecs:
+                suffix = b"-" + coding.encode("ascii") + b'"'
+                if tag.endswith(suffix):
+                    stripped = tag[:-len(suffix)] + b'"'
+                    break
+            sent[stripped] = tag
+            tags.append(stripped)
+        return b", ".join(tags), sent
+
+    async def __call__(self, scope: Dict[str, Any], receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        accept_encoding = request_headers.get(b"accept-encoding", b"").decode("latin-1")
+        coding = negotiate(accept_encoding, self.codecs)
+        sent_etags: Dict[bytes, bytes] = {}
+        if b"if-none-match" in request_headers:
+            if_none_match, sent_etags = self._strip_codings(request_headers[b"if-none-match"])
+            headers = [(name, value) for name, value in scope["headers"] if name != b"if-none-match"]
+            # Changed in place, as the outer middleware read the route the router stores in the scope
+            scope["headers"] = [*headers, (b"if-none-match", if_none_match)]
+
+        start_message: Optional[Dict[str, Any]] = None
+        streaming = False
+        stream = None
+
+        async def compressing_send(message: Dict[str, Any]) -> None:
+            nonlocal start_message, streaming, stream
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                content_type = next((value for name, value in headers if name.lower() == b"content-type"), b"")
+                if message["status"] == 304:
+                    # Answer with the ETag the client holds, encoded or not
+                    headers = [
+                        (name, sent_etags.get(value, value) if name.lower() == b"etag" else value)
+                        for name, value in headers
+                    ]
+                    await send({**message, "headers": [*headers, (b"vary", b"Accept-Encoding")]})
+                elif not content_type.startswith(COMPRESSIBLE_TYPES) or any(name.lower() == b"content-encoding" for name, _ in headers):
+                    await send(message)
+                else:
+                    start_message = {**message, "headers": [*headers, (b"vary", b"Accept-Encoding")]}
+                return
+            if start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if not streaming:
+                if not more_body:
+                    await self._send_whole(send, start_message, body, coding)
+                    return
+                # Streamed response: the total size is unknown, so it is always compressed
+                streaming = True
+                headers = start_message["headers"]
+                if coding is not None:
+                    stream = self.codecs[coding].stream()
+                    headers = [
+                        (name, value) for name, value in headers if name.lower() not in (b"content-length", b"etag")
+                    ] + [(b"content-encoding", coding.encode("ascii"))]
+                await send({**start_message, "headers": headers})
+            if stream is not None:
+                body = stream.write(body)
+                if not more_body:
+                    body += stream.close()
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
+
+    async def _send_whole(self, send, start_message: Dict[str, Any], body: bytes, coding: Optional[str]) -> None:
+        """
+        Send a response whose body came in one message, compressed when large enough
+        """
+        headers: Headers = start_message["headers"]
+        if coding is None or len(body) < self.min_size:
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        etag = next((value for name, value in headers if name.lower() == b"etag"), None)
+        cacheable = self.cache is not None and etag is not None and not etag.startswith(b"W/")
+        compressed = self.cache.get(etag, coding) if cacheable else None
+        if compressed is None:
+            compressed = self.codecs[coding].compress(body)
+            if cacheable:
+                self.cache.set(etag, coding, compressed)
+        headers = [
+            (name, value) for name, value in headers if name.lower() not in (b"content-length", b"etag")
+        ]
+        headers.append((b"content-encoding", coding.encode("ascii")))
+        headers.append((b"content-length", str(len(compressed)).encode("ascii")))
+        if etag is not None:
+            headers.append((b"etag", _coded_etag(etag, coding)))
+        await send({**start_message, "headers": headers})
+        await send({"type": "http.response.body", "body": compressed})
@@ -0,0 +1,78 @@
+"""
+Request metrics and Server-Timing instrumentation of the API
+"""
+import time
+from typing import Any, Dict, Optional
+from ..utils import timing
+from ..utils.metrics import (
+    REQUEST_DURATION, REQUESTS, REQUESTS_IN_FLIGHT, RESPONSE_SIZE,
+    CACHE_LOOKUPS, CACHE_HIT_RATIO, CACHE_ENTRIES, CACHE_BYTES, COALESCED_REQUESTS, UPSTREAM_CIRCUIT_OPEN
+)
+
+
+class InstrumentationMiddleware:
+    """
+    ASGI middleware recording the latency, status and response size of every
+    request, labelled by route template, and optionally adding a
+    Server-Timing header with the time spent in each stage of the request.
+    """
+
+    def __init__(self, app, server_timing: Optional[bool] = None):
+        """
+        Args:
+            app: The wrapped ASGI application
+            server_timing: Whether responses carry a Server-Timing header,
+                defaults to ARCHIVE_SERVER_TIMING
+        """
+        self.app = app
+        self.server_timing = server_timing if server_timing is not None else timing.ENABLED
+
+    async def __call__(self, scope: Dict[str, Any], receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        request_timing = timing.start() if self.server_timing else None
+        status = 500
+        size = 0
+
+        async def instrumented_send(message: Dict[str, Any]) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if request_timing is not None:
+                    headers = [*message.get("headers", []), (b"server-timing", request_timing.header().encode("latin-1"))]
+                    message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, instrumented_send)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            REQUEST_DURATION.observe(method, route_path, value=time.perf_counter() - started_at)
+            REQUESTS.inc(method, route_path, str(status))
+            RESPONSE_SIZE.observe(route_path, value=size)
+
+
+def update_service_metrics(service) -> None:
+    """
+    Copy the counters of the ArchiveService components into the metrics
+    """
+    if service.cache is not None:
+        stats = service.cache.stats()
+        for result in ("hits", "disk_hits", "stale_hits", "misses"):
+            CACHE_LOOKUPS.set(result, value=stats[result])
+        CACHE_HIT_RATIO.set(value=stats["hit_ratio"])
+        CACHE_ENTRIES.set(value=stats["entries"])
+        CACHE_BYTES.set(value=stats["bytes"])
+    COALESCED_REQUESTS.set(value=service.single_flight.coalesced)
+    for upstream, upstream_stats in service.http_client.stats()["upstreams"].items():
+        UPSTREAM_CIRCUIT_OPEN.set(upstream, value=1 if upstream_stats["circuit"]["state"] == "open" else 0)
@@ -0,0 +1,70 @@
+"""
+Fast JSON responses for the Internet Archive API
+"""
+import os
+from typing import Any
+import anyio
+import orjson
+from fastapi.responses import FileResponse, JSONResponse
+from ..models.video import LazyMetadata
+from ..utils import timing
+
+
+def encode_default(obj: Any) -> Any:
+    """
+    Encode objects orjson does not handle natively, such as models exposing to_dict().
+    LazyMetadata is written from its raw JSON without being decoded.
+    """
+    if isinstance(obj, LazyMetadata):
+        return orjson.Fragment(obj.raw)
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode content, including model objects, to JSON bytes
+    """
+    return orjson.dumps(content, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ModelResponse(JSONResponse):
+    """
+    JSON response encoded with orjson.
+
+    Models (dataclasses or objects with to_dict()) are encoded directly,
+    without being converted to dictionaries first. Handlers return this
+    response instead of plain data, so FastAPI skips re-validating and
+    re-encoding the generic `Dict[str, Any]` response models.
+    """
+
+    def render(self, content: Any) -> bytes:
+        with timing.stage("serialize"):
+            return dumps(content)
+
+
+class FileSendResponse(FileResponse):
+    """
+    File response handed to the server to send when it supports the ASGI
+    path send or zero-copy send extensions, so the server can use sendfile()
+    and the body never goes through Python. Otherwise the file is read and
+    sent in chunks like a FileResponse.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        extensions = scope.get("extensions") or {}
+        if self.send_header_only or not ("http.response.pathsend" in extensions or "http.response.zerocopysend" in extensions):
+            await super().__call__(scope, receive, send)
+            return
+
+        if self.stat_result is None:
+            self.set_stat_headers(await anyio.to_thread.run_sync(os.stat, self.path))
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+        else:
+            with open(self.path, "rb") as file:
+                await send({"type": "http.response.zerocopysend", "file": file})
+        if self.background is not None:
+            await self.background()
@@ -1,60 +1,149 @@
 """
 FastAPI router for the Internet Archive API
 """
-from fastapi import APIRouter, HTTPException, Query
+import os
+import math
+import asyncio
+import httpx
+from fastapi import APIRouter, HTTPException, Query, Body, Request, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from typing import List, Dict, Any, Optional
 from ..core.archive_service import ArchiveService
+from ..core.cache import ResponseCache
+from ..core.search_index import SearchIndex
+from ..core.thumbnails import ThumbnailStore
+from ..core.media_proxy import StreamsExhaustedError
+from ..core.refresher import CacheRefresher
 from ..models.film import Film
 from ..models.collection import Collection
 from ..models.video import Video, VideoPlaybackUrl
+from ..utils.fields import parse_fields, project
+from ..utils.http_client import is_unavailable, retry_after_of
+from ..utils import timing
+from .responses import FileSendResponse, ModelResponse, dumps
+from .caching import CachePolicy, HttpCachingMiddleware, matches
+from .admission import AdmissionController, admission_controller
 
 router = APIRouter(prefix="/api/v1", tags=["archive"])
 
-archive_service = ArchiveService()
+archive_service = ArchiveService(
+    cache=ResponseCache(),
+    search_index=SearchIndex() if SearchIndex.PATH else None,
+    thumbnails=ThumbnailStore() if ThumbnailStore.PATH else None
+)
+# Started with the application, kept here so its counters can be reported
+refresher = CacheRefresher(archive_service) if CacheRefresher.ENABLED else None
+# Maximum number of identifiers accepted by the batch video details endpoint
+BATCH_MAX_IDS = int(os.getenv("ARCHIVE_BATCH_MAX_IDS", "300"))
+
+
+def fields_query(description: str = "Comma-separated fields to return"):
+    """
+    Declare the optional `fields` query parameter of an endpoint
+    """
+    return Query(None, description=description, max_length=2000)
+
+
+def parse_projection(fields: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Parse the `fields` query parameter, rejecting invalid fields with a 400
+    """
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def upstream_error(error: Exception, detail: str) -> HTTPException:
+    """
+    Convert a failure to reach upstream into an HTTP error: 503 with a
+    Retry-After hint when upstream is throttling or unavailable, 500 otherwise
+    """
+    if is_unavailable(error):
+        retry_after = retry_after_of(error)
+        headers = {"Retry-After": str(max(1, math.ceil(retry_after)))} if retry_after is not None else None
+        return HTTPException(status_code=503, detail=f"{detail}: {str(error)}", headers=headers)
+    return HTTPException(status_code=500, detail=f"{detail}: {str(error)}")
+
+
+def build_video(video_details: Dict[str, Any]) -> Video:
+    """
+    Create a Video object from the details returned by the ArchiveService
+    """
+    with timing.stage("build"):
+        playback_urls = []
+        for url_data in video_details.get("playback_urls", []):
+            playback_urls.append(VideoPlaybackUrl(
+                format=url_data.get("format", "Unknown"),
+                url=url_data.get("url", "")
+            ))
+    
+        return Video(
+            identifier=video_details.get("identifier", ""),
+            title=video_details.get("title", ""),
+            description=video_details.get("description", None),
+            creator=video_details.get("creator", None),
+            date=video_details.get("date", None),
+            subject=video_details.get("subject", []),
+            collection=video_details.get("collection", []),
+            thumbnail_url=video_details.get("thumbnail_url", None),
+            playback_urls=playback_urls,
+            metadata=video_details.get("metadata", {})
+        )
 
 
 @router.get("/explore", response_model=Dict[str, Any])
 async def explore(
     collection: str = Query("*", description="The collection to search for"),
+    mediatype: str = Query("*", description="The media type to search for, \"movies\" is answered from the local index once harvested"),
     page: int = Query(1, ge=1, description="Page number"),
     rows: int = Query(10, ge=1, le=100, description="Rows per page"),
-    sort: str = Query("stars desc", description="Sort criteria")
+    sort: str = Query("stars desc", description="Sort criteria"),
+    fields: Optional[str] = fields_query("Comma-separated fields of the documents to return, any advancedsearch field")
 ):
     """
     Get a list of film collections for exploration
     """
+    projection = parse_projection(fields)
     try:
-        collections_response = archive_service.search_collections(
+        collections_response = await archive_service.search_collections(
             collection=collection,
+            mediatype=mediatype,
             page=page, 
             rows=rows, 
-            sort=sort
+            sort=sort,
+            fields=fields
         )
-        return collections_response
+        if projection is not None:
+            collections_response = {**collections_response, "docs": project(collections_response["docs"], projection)}
+        return ModelResponse(collections_response)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch collections: {str(e)}")
+        raise upstream_error(e, "Failed to fetch collections")
 
 
 @router.get("/collections/{collection_id}", response_model=Dict[str, Any])
 async def get_collection(
     collection_id: str,
     film_rows: int = Query(10, ge=1, le=100, description="Number of films to include"),
-    page: int = Query(1, ge=1, description="Page number for films")
+    page: int = Query(1, ge=1, description="Page number for films"),
+    fields: Optional[str] = fields_query("Comma-separated fields to return, films.<field> for fields of the films")
 ):
     """
     Get a collection by its identifier, including its films.
     Use film_rows to limit the number of films returned.
     Use page to paginate through the films in the collection.
     """
+    projection = parse_projection(fields)
     try:
-        collection = archive_service.get_collection_with_films(collection_id, film_rows=film_rows, page=page)
+        collection = await archive_service.get_collection_with_films(collection_id, film_rows=film_rows, page=page, fields=fields)
         if not collection:
             raise HTTPException(status_code=404, detail=f"Collection with ID {collection_id} not found")
-        return collection.to_dict()
+        return ModelResponse(project(collection, projection))
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch collection: {str(e)}")
+        raise upstream_error(e, "Failed to fetch collection")
 
 
 @router.get("/collections/{collection_id}/items", response_model=List[Dict[str, Any]])
@@ -62,51 +151,226 @@ async def get_collection_items(
     collection_id: str,
     page: int = Query(1, ge=1, description="Page number"),
     rows: int = Query(10, ge=1, le=100, description="Rows per page"),
-    sort: str = Query("stars desc", description="Sort criteria")
+    sort: str = Query("stars desc", description="Sort criteria"),
+    q: Optional[str] = Query(None, description="Free-text query the videos must match"),
+    fields: Optional[str] = fields_query()
 ):
     """
     Get videos (items) within a specific collection
     """
+    projection = parse_projection(fields)
+    try:
+        films = await archive_service.search_films_by_collection(
+            collection_id, page=page, rows=rows, sort=sort, query=q, fields=fields
+        )
+        return ModelResponse(project(films, projection))
+    except Exception as e:
+        raise upstream_error(e, "Failed to fetch items")
+
+
+@router.get("/collections/{collection_id}/items:stream")
+async def stream_collection_items(
+    collection_id: str,
+    cursor: Optional[str] = Query(None, description="Cursor returned by a previous stream to resume from"),
+    page_size: int = Query(1000, ge=100, le=10000, description="Items fetched from upstream per page"),
+    fields: Optional[str] = fields_query()
+):
+    """
+    Stream every video (item) of a collection as newline-delimited JSON.
+    Each page of items is followed by a {"next_cursor": ...} line that can be
+    passed back as `cursor` to resume after that page.
+    """
+    projection = parse_projection(fields)
+    pages = archive_service.iter_collection_films(collection_id, cursor=cursor, page_size=page_size, fields=fields)
     try:
-        films = archive_service.search_films_by_collection(collection_id, page=page, rows=rows, sort=sort)
-        return [film.to_dict() for film in films]
+        first_page = await pages.__anext__()
+    except StopAsyncIteration:
+        first_page = None
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch items: {str(e)}")
+        raise upstream_error(e, "Failed to stream items")
+
+    async def lines():
+        if first_page is None:
+            return
+        try:
+            page = first_page
+            while True:
+                films, next_cursor = page
+                for film in films:
+                    yield dumps(project(film, projection)) + b"\n"
+                yield dumps({"next_cursor": next_cursor}) + b"\n"
+                page = await pages.__anext__()
+        except StopAsyncIteration:
+            pass
+        except Exception as e:
+            yield dumps({"error": f"Failed to stream items: {str(e)}"}) + b"\n"
+        finally:
+            await pages.aclose()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 @router.get("/videos/{video_id}", response_model=Dict[str, Any])
-async def get_video_details(video_id: str):
+async def get_video_details(
+    video_id: str,
+    fields: Optional[str] = fields_query("Comma-separated fields to return, metadata.<field> for fields of the metadata")
+):
     """
     Get detailed information about a specific video
     """
+    projection = parse_projection(fields)
     try:
-        video_details = archive_service.get_video_details(video_id)
+        video_details = await archive_service.get_video_details(video_id, fields=fields)
         if not video_details:
             raise HTTPException(status_code=404, detail=f"Video with ID {video_id} not found")
         
-        # Create a Video object from the details
-        playback_urls = []
-        for url_data in video_details.get("playback_urls", []):
-            playback_urls.append(VideoPlaybackUrl(
-                format=url_data.get("format", "Unknown"),
-                url=url_data.get("url", "")
-            ))
-        
-        video = Video(
-            identifier=video_details.get("identifier", ""),
-            title=video_details.get("title", ""),
-            description=video_details.get("description", None),
-            creator=video_details.get("creator", None),
-            date=video_details.get("date", None),
-            subject=video_details.get("subject", []),
-            collection=video_details.get("collection", []),
-            thumbnail_url=video_details.get("thumbnail_url", None),
-            playback_urls=playback_urls,
-            metadata=video_details.get("metadata", {})
-        )
-        
-        return video.to_dict()
+        return ModelResponse(project(build_video(video_details), projection))
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch video details: {str(e)}") 
\ No newline at end of file
+        raise upstream_error(e, "Failed to fetch video details") 
+
+
+@router.get("/videos/{video_id}/play/{file:path}")
+async def play_video(request: Request, video_id: str, file: str):
+    """
+    Stream a file of a video from archive.org, forwarding Range requests so
+    players can seek
+    """
+    try:
+        stream = await archive_service.open_playback(
+            video_id, file, range_header=request.headers.get("range"), if_range=request.headers.get("if-range")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except StreamsExhaustedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"File {file} of video {video_id} not found")
+        raise upstream_error(e, "Failed to stream video")
+    except Exception as e:
+        raise upstream_error(e, "Failed to stream video")
+
+    # Closing again after the body is exhausted is a no-op, but releases the
+    # stream when the client leaves before it starts
+    return StreamingResponse(stream.body, status_code=stream.status, headers=stream.headers, background=BackgroundTask(stream.aclose))
+
+
+@router.post("/videos:batch", response_model=Dict[str, Any])
+async def get_videos_details_batch(
+    ids: List[str] = Body(..., embed=True, min_length=1, description="Identifiers of the videos"),
+    fields: Optional[str] = fields_query("Comma-separated fields of the videos to return, as for /videos/{video_id}")
+):
+    """
+    Get detailed information about several videos in one request.
+    Videos are fetched concurrently; a video that is missing or fails to load
+    is reported in `errors` without failing the rest of the batch.
+    """
+    if len(ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"A batch accepts at most {BATCH_MAX_IDS} identifiers")
+    
+    projection = parse_projection(fields)
+    details_by_id = await archive_service.get_videos_details(ids, fields=fields)
+    
+    results = {}
+    errors = {}
+    for video_id, video_details in details_by_id.items():
+        if isinstance(video_details, Exception):
+            error = upstream_error(video_details, "Failed to fetch video details")
+            errors[video_id] = {"status": error.status_code, "detail": error.detail}
+        elif not video_details:
+            errors[video_id] = {"status": 404, "detail": f"Video with ID {video_id} not found"}
+        else:
+            results[video_id] = project(build_video(video_details), projection)
+    
+    return ModelResponse({
+        "requested": len(details_by_id),
+        "results": results,
+        "errors": errors
+    })
+
+
+@router.get("/thumbnails/{identifier}")
+async def get_thumbnail(
+    request: Request,
+    identifier: str,
+    file: Optional[str] = Query(None, max_length=500, description="Image file of the item, the item's thumbnail by default"),
+    width: Optional[int] = Query(None, ge=1, le=4096, description="Width the thumbnail is displayed at"),
+    format: Optional[str] = Query(None, pattern="^(webp|jpeg)$", description="Format of the thumbnail, WebP when accepted by default")
+):
+    """
+    Get the thumbnail of an item, resized to the smallest width bucket at
+    least `width` wide, from the local thumbnail store
+    """
+    if archive_service.thumbnails is None:
+        return RedirectResponse(archive_service.source_thumbnail_url(identifier, file))
+    if format is None and "image/webp" in request.headers.get("accept", ""):
+        format = "webp"
+    try:
+        thumbnail = await archive_service.get_thumbnail(identifier, file=file, width=width, format=format)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"No thumbnail for {identifier}")
+        raise upstream_error(e, "Failed to fetch thumbnail")
+    except Exception as e:
+        raise upstream_error(e, "Failed to fetch thumbnail")
+
+    headers = {
+        "ETag": thumbnail.etag,
+        "Cache-Control": CachePolicy(HttpCachingMiddleware.MAX_AGE_THUMBNAIL).cache_control.decode("latin-1"),
+        "Vary": "Accept"
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and matches(if_none_match.encode("latin-1"), thumbnail.etag.encode("ascii")):
+        return Response(status_code=304, headers=headers)
+    return FileSendResponse(thumbnail.path, media_type=thumbnail.media_type, headers=headers)
+
+
+@router.get("/cache/stats", response_model=Dict[str, Any])
+async def get_cache_stats():
+    """
+    Get the upstream response cache counters (hits, misses, evictions and size),
+    the queries coalesced with an identical one in flight, the counters of
+    the pages prefetched into the cache and of the hot queries refreshed in
+    it, of the item file classifications, of the thumbnail store and of the
+    local search index
+    """
+    cache = {"enabled": True, **archive_service.cache.stats()} if archive_service.cache is not None else {"enabled": False}
+    return {
+        **cache,
+        "coalescing": archive_service.single_flight.stats(),
+        "prefetch": archive_service.prefetcher.stats() if archive_service.prefetcher is not None else {"enabled": False},
+        "refresh": refresher.stats() if refresher is not None else {"enabled": False},
+        "file_classifier": archive_service.file_classifier.stats(),
+        "thumbnails": archive_service.thumbnails.stats() if archive_service.thumbnails is not None else {"enabled": False},
+        # Counting the indexed items scans the index, so it runs in a thread
+        "search_index": await asyncio.to_thread(archive_service.search_index.stats) if archive_service.search_index is not None else {"enabled": False}
+    }
+
+
+@router.get("/upstream/stats", response_model=Dict[str, Any])
+async def get_upstream_stats():
+    """
+    Get the upstream retry counter, the rate limiter and circuit breaker state
+    of each upstream, the hedging counters of item metadata requests and the
+    counters of the streamed item files
+    """
+    return {
+        **archive_service.http_client.stats(),
+        "hedging": archive_service.hedger.stats() if archive_service.hedger is not None else {"enabled": False},
+        "streams": archive_service.media.stats()
+    }
+
+
+@router.get("/admission/stats", response_model=Dict[str, Any])
+async def get_admission_stats():
+    """
+    Get the running and waiting requests of each route, and the requests
+    admitted and shed by reason
+    """
+    if not AdmissionController.ENABLED:
+        return {"enabled": False}
+    return admission_controller.stats()
@@ -2,16 +2,35 @@
 Service for interacting with the Internet Archive API
 """
 import os
-from typing import List, Dict, Any, Optional
+import time
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, Set, Awaitable, AsyncIterator, Tuple, Callable
+from urllib.parse import quote, quote_plus
+import orjson
 from dotenv import load_dotenv
-from ..utils.http_client import HttpClient
+from ..utils.http_client import HttpClient, is_unavailable
+from ..utils.hedging import Hedger
+from ..utils import timing
+from ..utils.fields import parse_fields, join_fields, selects, search_fields
+from .cache import ResponseCache, normalize_key
+from .singleflight import SingleFlight
+from .refresher import HotQueryTracker
+from .prefetcher import PagePrefetcher
+from .thumbnails import Thumbnail, ThumbnailStore
+from .media_proxy import MediaProxy, ProxiedStream
+from .search_index import SearchIndex
+from .file_classifier import FileClassifier
 from ..models.film import Film
 from ..models.collection import Collection
+from ..models.video import LazyMetadata
 
 # Load environment variables
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 class ArchiveService:
     """
@@ -19,16 +38,342 @@ class ArchiveService:
     """
     # Get base URL from environment variable, with fallback to default value
     BASE_URL = os.getenv("ARCHIVE_API_BASE_URL", "https://archive.org/advancedsearch.php")
+    # Cursor-based scrape API used to walk whole collections
+    SCRAPE_URL = os.getenv("ARCHIVE_SCRAPE_URL", "https://archive.org/services/search/v1/scrape")
+    # Maximum number of video details fetched at once by batch requests
+    BATCH_CONCURRENCY = int(os.getenv("ARCHIVE_BATCH_CONCURRENCY", "16"))
+    # Limits for multi-identifier lookups, keeping the advancedsearch URL short enough
+    LOOKUP_CHUNK_SIZE = int(os.getenv("ARCHIVE_LOOKUP_CHUNK_SIZE", "100"))
+    LOOKUP_MAX_QUERY_LENGTH = int(os.getenv("ARCHIVE_LOOKUP_MAX_QUERY_LENGTH", "1500"))
+    # Metadata API, whose sub-paths (e.g. /metadata/{id}/files) return a single part of an item
+    METADATA_URL = os.getenv("ARCHIVE_METADATA_URL", "https://archive.org/metadata")
+    # Item images: the thumbnail service and the files of an item
+    IMG_URL = os.getenv("ARCHIVE_IMG_URL", "https://archive.org/services/img")
+    DOWNLOAD_URL = os.getenv("ARCHIVE_DOWNLOAD_URL", "https://archive.org/download")
+    # Public base URL of the API, so proxied URLs work for clients on another origin
+    PUBLIC_URL = os.getenv("ARCHIVE_PUBLIC_URL", "http://localhost:8000").rstrip("/")
+    # Base of the thumbnail URLs handed out when thumbnails are proxied
+    THUMBNAIL_URL = os.getenv("ARCHIVE_THUMBNAIL_URL", f"{PUBLIC_URL}/api/v1/thumbnails")
+    # Playback URLs point at the streaming proxy under this base when enabled
+    PLAYBACK_PROXY = os.getenv("ARCHIVE_PLAYBACK_PROXY", "false").lower() in ("1", "true", "yes")
+    PLAYBACK_URL = os.getenv("ARCHIVE_PLAYBACK_URL", f"{PUBLIC_URL}/api/v1/videos")
+    # Fields returned by searches and basic lookups
+    DEFAULT_FIELDS = "identifier,title,description"
+    VIDEO_FIELDS = "identifier,title,description,creator,date,subject,publicdate,addeddate,mediatype,collection"
+    # Fields derived from the identifier rather than requested upstream
+    DERIVED_FIELDS = ("thumbnail_url",)
+    
+    def __init__(self,
+                 http_client: Optional[HttpClient] = None,
+                 cache: Optional[ResponseCache] = None,
+                 search_index: Optional[SearchIndex] = None,
+                 file_classifier: Optional[FileClassifier] = None,
+                 hedger: Optional[Hedger] = None,
+                 prefetcher: Optional[PagePrefetcher] = None,
+                 thumbnails: Optional[ThumbnailStore] = None,
+                 media: Optional[MediaProxy] = None):
+        self.http_client = http_client or HttpClient()
+        self.cache = cache
+        self.search_index = search_index
+        self.file_classifier = file_classifier or FileClassifier()
+        # Item metadata requests have a long latency tail and are optionally hedged
+        self.hedger = hedger or (Hedger() if Hedger.ENABLED else None)
+        # Clients page through searches in order, so the next page is optionally fetched ahead
+        self.prefetcher = prefetcher or (PagePrefetcher() if PagePrefetcher.ENABLED else None)
+        # Thumbnails are served through the API from this store when it is set
+        self.thumbnails = thumbnails
+        # Item files are streamed through the API with the same pooled connections
+        self.media = media or MediaProxy(self.http_client)
+        self.single_flight = SingleFlight()
+        self.hot_queries = HotQueryTracker()
+        self._background: Set[asyncio.Future] = set()
+
+    async def aclose(self) -> None:
+        """
+        Cancel background refreshes and release the pooled upstream connections
+        """
+        for task in list(self._background):
+            task.cancel()
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        await self.http_client.aclose()
+        if self.cache is not None:
+            self.cache.close()
+        if self.search_index is not None:
+            self.search_index.close()
+
+    async def _fetch(self,
+                     endpoint: str,
+                     url: str,
+                     params: Optional[Dict[str, Any]] = None,
+                     record: bool = True) -> Dict[str, Any]:
+        """
+        Fetch an upstream response, answering from the cache when possible.
+        Expired entries still in their stale period are served immediately
+        and revalidated in the background, and older entries are served when
+        upstream is unavailable.
+        
+        Args:
+            endpoint: The upstream endpoint kind ("search", "lookup" or "metadata")
+            url: The URL to request
+            params: Optional query parameters
+            record: Whether the query counts towards the hot queries, False
+                for fetches the service starts itself so they do not keep
+                their own queries hot
+            
+        Returns:
+            The response as a dictionary
+        """
+        key = normalize_key(url, params)
+        if self.cache is not None:
+            if record:
+                self.hot_queries.record(key, endpoint, url, params)
+            hit = self.cache.lookup(endpoint, key)
+            if hit is not None:
+                value, fresh = hit
+                if not fresh:
+                    self._run_in_background(self.refresh(endpoint, key, url, params))
+                return value
+        
+        try:
+            return await self.refresh(endpoint, key, url, params)
+        except Exception as e:
+            if self.cache is None or not is_unavailable(e):
+                raise
+            hit = self.cache.lookup(endpoint, key, if_error=True)
+            if hit is None:
+                raise
+            logger.warning("Upstream unavailable, serving a stale response for %s: %s", key, e)
+            return hit[0]
+    
+    async def refresh(self, endpoint: str, key: str, url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Fetch a response from upstream and store it in the cache.
+        Concurrent identical queries share a single upstream request, and a
+        cached response with upstream validators is revalidated with a
+        conditional request, renewing it without a new body when unchanged.
+        
+        Args:
+            endpoint: The upstream endpoint kind ("search", "lookup" or "metadata")
+            key: The normalized query key
+            url: The URL to request
+            params: Optional query parameters
+            
+        Returns:
+            The response as a dictionary
+        """
+        async def fetch() -> Dict[str, Any]:
+            validators = self.cache.validators(key) if self.cache is not None else None
+
+            def get() -> Awaitable[Tuple[Optional[Dict[str, Any]], Dict[str, str]]]:
+                return self.http_client.get_conditional(url, params=params, validators=validators)
+
+            if endpoint == "metadata" and self.hedger is not None:
+                response, validators = await self.hedger.run(get)
+            else:
+                response, validators = await get()
+            if response is None:
+                cached = self.cache.revalidate(endpoint, key, validators)
+                if cached is not None:
+                    return cached
+                # The entry was evicted meanwhile, so the body is needed after all
+                response, validators = await self.http_client.get_conditional(url, params=params)
+            response = self._compact(endpoint, url, response)
+            if self.cache is not None:
+                self.cache.set(endpoint, key, response, validators)
+            return response
+        
+        if self.cache is not None and self.cache.shared_locks:
+            return await self.single_flight.do(key, lambda: self._fetch_across_workers(key, fetch))
+        return await self.single_flight.do(key, fetch)
+    
+    async def _fetch_across_workers(self, key: str, fetch: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Fetch a key in a single one of the workers sharing the disk cache tier.
+        The worker taking the key's lock fetches it, and the others wait for
+        the value it stores rather than fetching it again. Waiting workers
+        poll with reads, and only try to take the lock once it is released.
+        
+        Args:
+            key: The normalized query key
+            fetch: Coroutine function fetching the response and storing it in the cache
+            
+        Returns:
+            The response as a dictionary
+        """
+        expires_at = self.cache.expiry(key)
+        deadline = time.monotonic() + self.cache.lock_timeout
+        while self.cache.locked(key) or not await self.cache.acquire(key):
+            if time.monotonic() >= deadline:
+                logger.warning("Shared cache lock wait timed out for %s", key)
+                return await fetch()
+            await asyncio.sleep(self.cache.LOCK_POLL_INTERVAL)
+            value = self.cache.updated_value(key, expires_at)
+            if value is not None:
+                self.cache.shared_waits += 1
+                return value
+        try:
+            # Another worker may have stored the key between the lookup and the lock
+            value = self.cache.updated_value(key, expires_at)
+            if value is not None:
+                self.cache.shared_waits += 1
+                return value
+            return await fetch()
+        finally:
+            self.cache.release(key)
+    
+    @staticmethod
+    def _compact(endpoint: str, url: str, response: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Reduce an upstream response to what the service uses before it is cached.
+        Item metadata only keeps its files, and its metadata object is kept as
+        JSON text which is decoded lazily, if at all. Sub-path reads, which
+        wrap a single part in "result", are stored under that part's name.
+        """
+        if endpoint != "metadata":
+            return response
+        if "result" in response:
+            response = {url.rstrip("/").rsplit("/", 1)[-1]: response["result"]}
+        
+        compacted = {}
+        if "files" in response:
+            compacted["files"] = response["files"]
+        if "metadata" in response:
+            compacted["metadata_json"] = orjson.dumps(response["metadata"]).decode("utf-8")
+        return compacted
+    
+    def _run_in_background(self, coroutine: Awaitable[Any]) -> None:
+        """
+        Run a coroutine without waiting for it, logging its failure
+        """
+        task = asyncio.ensure_future(coroutine)
+        self._background.add(task)
+        
+        def done(finished: asyncio.Future) -> None:
+            self._background.discard(finished)
+            if not finished.cancelled() and finished.exception() is not None:
+                logger.warning("Background revalidation failed: %s", finished.exception())
+        
+        task.add_done_callback(done)
+    
+    def source_thumbnail_url(self, identifier: str, file: Optional[str] = None) -> str:
+        """
+        Get the upstream URL of the thumbnail of an item: one of its files,
+        or the image the thumbnail service picks for it
+        """
+        if file:
+            return f"{self.DOWNLOAD_URL}/{identifier}/{quote(file)}"
+        return f"{self.IMG_URL}/{identifier}"
+    
+    def thumbnail_url(self, identifier: str, file: Optional[str] = None) -> str:
+        """
+        Get the thumbnail URL handed to clients, pointing at the thumbnail
+        proxy when thumbnails are stored locally and at upstream otherwise
+        """
+        if self.thumbnails is None:
+            return self.source_thumbnail_url(identifier, file)
+        url = f"{self.THUMBNAIL_URL}/{identifier}"
+        return f"{url}?file={quote_plus(file)}" if file else url
     
-    def __init__(self):
-        self.http_client = HttpClient()
+    async def get_thumbnail(self,
+                            identifier: str,
+                            file: Optional[str] = None,
+                            width: Optional[int] = None,
+                            format: Optional[str] = None) -> Thumbnail:
+        """
+        Get the thumbnail of an item from the thumbnail store, fetching it
+        once from upstream
+        
+        Args:
+            identifier: The identifier of the item
+            file: Optional image file of the item, the thumbnail service's image by default
+            width: Optional width the thumbnail is displayed at
+            format: Optional format of the thumbnail, "webp" or "jpeg"
+            
+        Returns:
+            The stored thumbnail or resized variant
+            
+        Raises:
+            ValueError: If the file name leaves the item, or the image is too large
+        """
+        if file is not None and ".." in file.split("/"):
+            raise ValueError(f"Invalid file name: {file}")
+        url = self.source_thumbnail_url(identifier, file)
+        return await self.thumbnails.get(
+            url, lambda: self.http_client.get_bytes(url, max_bytes=self.thumbnails.MAX_SOURCE_BYTES), width, format
+        )
+    
+    def playback_url(self, video_id: str, file: str) -> str:
+        """
+        Get the URL a file of a video is played from, the streaming proxy
+        when it is enabled and upstream otherwise
+        """
+        if self.PLAYBACK_PROXY:
+            return f"{self.PLAYBACK_URL}/{video_id}/play/{quote(file)}"
+        return f"{self.DOWNLOAD_URL}/{video_id}/{quote(file)}"
+    
+    async def open_playback(self,
+                            video_id: str,
+                            file: str,
+                            range_header: Optional[str] = None,
+                            if_range: Optional[str] = None) -> ProxiedStream:
+        """
+        Start streaming a file of a video from upstream
+        
+        Args:
+            video_id: The identifier of the video
+            file: The name of the file in the item
+            range_header: The Range header of the client request
+            if_range: The If-Range header of the client request
+            
+        Returns:
+            The stream, whose body must be consumed or closed
+            
+        Raises:
+            ValueError: If the file name leaves the item
+        """
+        if not file or ".." in file.split("/"):
+            raise ValueError(f"Invalid file name: {file}")
+        url = f"{self.DOWNLOAD_URL}/{video_id}/{quote(file)}"
+        return await self.media.open(url, range_header, if_range)
+    
+    def _search_url(self, params: Dict[str, Any]) -> str:
+        """
+        Build an advancedsearch URL, joining the parameters manually to keep
+        the format upstream expects
+        """
+        url_params = "&".join([f"{k}={v}" for k, v in params.items()])
+        return f"{self.BASE_URL}?{url_params}"
     
-    def search_collections(self, 
+    def _prefetch_next_page(self, params: Dict[str, Any], num_found: int) -> None:
+        """
+        Fetch the page after the one requested in the background when its
+        pagination session is read in order, so it is already in the cache
+        when the client asks for it
+        
+        Args:
+            params: The advancedsearch parameters of the requested page
+            num_found: The number of documents matching the query
+        """
+        if self.prefetcher is None or self.cache is None:
+            return
+        page = params["page"]
+        session = self._search_url({k: v for k, v in params.items() if k != "page"})
+        next_url = self._search_url({**params, "page": page + 1})
+        wanted = page * params["rows"] < num_found
+        if wanted:
+            remaining = self.cache.expires_in(normalize_key(next_url))
+            wanted = remaining is None or remaining <= 0
+        if self.prefetcher.observe(session, page, wanted):
+            self._run_in_background(self.prefetcher.prefetch(session, page + 1, lambda: self._fetch("search", next_url, record=False)))
+    
+    async def search_collections(self, 
                         collection: str = "*", 
                         mediatype: str = "*", 
                         page: int = 1, 
                         rows: int = 10, 
-                        sort: str = "stars desc") -> Dict[str, Any]:
+                        sort: str = "stars desc",
+                        fields: Optional[str] = None) -> Dict[str, Any]:
         """
         Search for film collections
         
@@ -38,6 +383,8 @@ class ArchiveService:
             page: The page number to fetch
             rows: The number of rows to fetch per page
             sort: The sorting criteria
+            fields: Optional comma-separated fields of the documents to fetch,
+                any advancedsearch field can be requested
             
         Returns:
             A dictionary with the complete response including collections
@@ -45,11 +392,17 @@ class ArchiveService:
         # Use exactly the same query that works with curl, but with flexible parameters
         sort_param = sort.replace(" ", "+")  # "stars desc" >> "stars+desc"
         
-        print(f"Searching: collection:({collection}) AND mediatype:({mediatype}) with sort={sort_param}, rows={rows}, page={page}")
+        logger.debug("search_collections collection=%s mediatype=%s sort=%s rows=%d page=%d", collection, mediatype, sort_param, rows, page)
+        
+        projection = parse_fields(fields)
+        if projection is None:
+            fl = self.DEFAULT_FIELDS
+        else:
+            fl = search_fields(projection, [name for name in projection if name not in self.DERIVED_FIELDS])
         
         params = {
             "q": f"collection:({collection}) AND mediatype:({mediatype})",
-            "fl": "identifier,title,description",
+            "fl": fl,
             "rows": rows,
             "page": page,
             "output": "json",
@@ -57,32 +410,36 @@ class ArchiveService:
         }
         
         # Manually construct the URL to ensure the correct format
-        url_params = "&".join([f"{k}={v}" for k, v in params.items()])
-        full_url = f"{self.BASE_URL}?{url_params}"
-        print(f"Full URL: {full_url}")
+        full_url = self._search_url(params)
+        logger.debug("search_collections url=%s", full_url)
         
-        api_response = self.http_client.get(full_url)
+        api_response = await self._search_locally(collection, mediatype, page, rows, sort, fields=fl)
+        if api_response is None:
+            api_response = await self._fetch("search", full_url)
+            if api_response:
+                self._prefetch_next_page(params, api_response.get("response", {}).get("numFound", 0))
         
         # Verify if we received a valid response
         if not api_response:
-            print("Empty API response")
+            logger.info("search_collections empty upstream response collection=%s mediatype=%s", collection, mediatype)
             return {
                 "response": {
                     "numFound": 0,
                     "start": 0,
                     "qin": f"collection:({collection}) AND mediatype:({mediatype})",
-                    "fields": "identifier,title,description",
+                    "fields": fl,
                     "rows": rows,
                     "description": "No results found",
                     "docs": []
                 }
             }
         
-        # Process the response to add thumbnails to the documents
-        if "response" in api_response and "docs" in api_response["response"]:
-            docs = api_response["response"]["docs"]
-            for doc in docs:
-                doc["thumbnail_url"] = f"https://archive.org/services/img/{doc.get('identifier')}"
+        # Process the response to add thumbnails to copies of the documents,
+        # leaving the (possibly cached) upstream response untouched
+        docs = [
+            {**doc, "thumbnail_url": self.thumbnail_url(doc.get("identifier"))}
+            for doc in api_response.get("response", {}).get("docs", [])
+        ]
         
         # Get the original query parameters
         original_params = api_response.get("responseHeader", {}).get("params", {})
@@ -92,20 +449,75 @@ class ArchiveService:
             "response": {
                 **api_response.get("response", {}),
                 "qin": original_params.get("qin", f"collection:({collection}) AND mediatype:({mediatype})"),
-                "fields": original_params.get("fields", "identifier,title,description"),
+                "fields": original_params.get("fields", fl),
                 "rows": rows,
                 "description": f"Explore results for all collections of videos in Internet Archive API: Collection=({collection}) and MediaType=({mediatype})"
             }
         }
         
         resp = formatted_response["response"]
-        docs = resp.pop("docs", [])
+        resp.pop("docs", None)
         ordered_response = {k: resp[k] for k in resp}
         ordered_response["docs"] = docs
 
         return ordered_response
     
-    def search_films_by_collection(self, collection_id: str, page: int = 1, rows: int = 10, sort: str = "stars desc") -> List[Film]:
+    async def _search_locally(self,
+                              collection: str,
+                              mediatype: str,
+                              page: int,
+                              rows: int,
+                              sort: str,
+                              text: Optional[str] = None,
+                              fields: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Answer a collection search from the local search index
+        
+        Args:
+            collection: The collection to search in
+            mediatype: The media type to filter by
+            page: The page number to fetch
+            rows: The number of rows to fetch per page
+            sort: The sorting criteria
+            text: Optional free-text query
+            fields: The comma-separated fields requested
+            
+        Returns:
+            A response shaped like the advancedsearch one, or None if the index
+            is disabled or cannot answer the query
+        """
+        if self.search_index is None:
+            return None
+        # The index only stores the default fields of the documents it returns
+        if fields is not None and not set(fields.split(",")) <= set(self.DEFAULT_FIELDS.split(",")):
+            return None
+        
+        # Full-text matches and sorts over large collections take a while, so
+        # the query runs in a thread instead of blocking the event loop
+        result = await asyncio.to_thread(
+            self.search_index.search, collection, mediatype=mediatype, page=page, rows=rows, sort=sort, text=text
+        )
+        if result is None:
+            return None
+        
+        num_found, docs = result
+        return {
+            "responseHeader": {
+                "params": {
+                    "qin": f"collection:({collection}) AND mediatype:({mediatype})",
+                    "fields": fields or self.DEFAULT_FIELDS
+                }
+            },
+            "response": {"numFound": num_found, "start": (page - 1) * rows, "docs": docs}
+        }
+    
+    async def search_films_by_collection(self,
+                                         collection_id: str,
+                                         page: int = 1,
+                                         rows: int = 10,
+                                         sort: str = "stars desc",
+                                         query: Optional[str] = None,
+                                         fields: Optional[str] = None) -> List[Film]:
         """
         Search for films within a specific collection
         
@@ -114,38 +526,171 @@ class ArchiveService:
             page: The page number to fetch
             rows: The number of rows to fetch per page
             sort: The sorting criteria
+            query: Optional free-text query the films must match
+            fields: Optional comma-separated fields of the films to fetch
             
         Returns:
             A list of Film objects
         """
+        q = f"collection:({collection_id}) AND mediatype:(movies)"
+        if query and query.strip():
+            q += f" AND ({quote_plus(query.strip())})"
+        
+        fl = search_fields(parse_fields(fields), self.DEFAULT_FIELDS.split(","))
         params = {
-            "q": f"collection:({collection_id}) AND mediatype:(movies)",
-            "fl": "identifier,title,description",
+            "q": q,
+            "fl": fl,
             "rows": rows,
             "page": page,
             "output": "json",
             "sort": sort.replace(" ", "+")
         }
         
-        url_params = "&".join([f"{k}={v}" for k, v in params.items()])
-        full_url = f"{self.BASE_URL}?{url_params}"
+        full_url = self._search_url(params)
         
-        response = self.http_client.get(full_url)
+        response = await self._search_locally(collection_id, "movies", page, rows, sort, text=query, fields=fl)
+        if response is None:
+            response = await self._fetch("search", full_url)
+            self._prefetch_next_page(params, response.get("response", {}).get("numFound", 0))
         header_params = response.get("responseHeader", {}).get("params", {})
         results = response.get("response", {}).get("docs", [])
 
-        print(f"Header Params: {header_params}")
+        logger.debug("search_films_by_collection collection=%s header_params=%s", collection_id, header_params)
 
         films = []
-        for result in results:
-            film = Film.from_dict(result)
-            # Add thumbnail URL
-            film.thumbnail_url = f"https://archive.org/services/img/{film.identifier}"
-            films.append(film)
+        with timing.stage("build"):
+            for result in results:
+                film = Film.from_dict(result)
+                # Add thumbnail URL
+                film.thumbnail_url = self.thumbnail_url(film.identifier)
+                films.append(film)
             
         return films
     
-    def get_collection_with_films(self, collection_id: str, film_rows: int = 10, page: int = 1) -> Optional[Collection]:
+    async def fetch_documents_page(self,
+                                   query: str,
+                                   cursor: Optional[str] = None,
+                                   page_size: int = 1000,
+                                   fields: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Fetch one page of raw documents matching a query
+        
+        The scrape API is used by default. Cursors of the form "page:N" page
+        through advancedsearch instead, which is the fallback when the scrape
+        API cannot be used.
+        
+        Args:
+            query: The advancedsearch query
+            cursor: The cursor of the page, None for the first page
+            page_size: The number of items per page
+            fields: The comma-separated list of fields to return, the default fields if None
+            
+        Returns:
+            The documents of the page and the cursor of the next page, or None at the end
+        """
+        fields = fields or self.DEFAULT_FIELDS
+        if cursor is None or not cursor.startswith("page:"):
+            params = {
+                "q": query,
+                "fields": fields,
+                "count": page_size
+            }
+            if cursor:
+                params["cursor"] = cursor
+            try:
+                response = await self.http_client.get(self.SCRAPE_URL, params=params)
+                return response.get("items", []), response.get("cursor")
+            except Exception:
+                if cursor:
+                    raise
+                logger.warning("Scrape API unavailable for %s, falling back to advancedsearch paging", query)
+                cursor = "page:1"
+        
+        page = int(cursor[len("page:"):])
+        params = {
+            "q": query,
+            "fl": fields,
+            "rows": page_size,
+            "page": page,
+            "sort": "identifier asc",
+            "output": "json"
+        }
+        response = await self.http_client.get(self.BASE_URL, params=params)
+        docs = response.get("response", {}).get("docs", [])
+        num_found = response.get("response", {}).get("numFound", 0)
+        next_cursor = f"page:{page + 1}" if docs and page * page_size < num_found else None
+        return docs, next_cursor
+    
+    async def _fetch_films_page(self,
+                                collection_id: str,
+                                cursor: Optional[str],
+                                page_size: int,
+                                fields: Optional[str] = None) -> Tuple[List[Film], Optional[str]]:
+        """
+        Fetch one page of a collection walk as Film objects
+        
+        Args:
+            collection_id: The identifier of the collection
+            cursor: The cursor of the page, None for the first page
+            page_size: The number of items per page
+            fields: Optional comma-separated fields of the films to fetch
+            
+        Returns:
+            The films of the page and the cursor of the next page, or None at the end
+        """
+        query = f"collection:({collection_id}) AND mediatype:(movies)"
+        fl = search_fields(parse_fields(fields), self.DEFAULT_FIELDS.split(","))
+        docs, next_cursor = await self.fetch_documents_page(query, cursor, page_size, fields=fl)
+        
+        films = []
+        with timing.stage("build"):
+            for doc in docs:
+                film = Film.from_dict(doc)
+                film.thumbnail_url = self.thumbnail_url(film.identifier)
+                films.append(film)
+        return films, next_cursor
+    
+    async def iter_collection_films(self,
+                                    collection_id: str,
+                                    cursor: Optional[str] = None,
+                                    page_size: int = 1000,
+                                    fields: Optional[str] = None) -> AsyncIterator[Tuple[List[Film], Optional[str]]]:
+        """
+        Walk every film of a collection page by page
+        
+        The next page is requested while the current one is being consumed,
+        and at most two pages are held in memory at any time.
+        
+        Args:
+            collection_id: The identifier of the collection
+            cursor: The cursor to resume from, None to start at the beginning
+            page_size: The number of items per page
+            fields: Optional comma-separated fields of the films to fetch
+            
+        Yields:
+            The films of each page with the cursor that resumes after it
+        """
+        films, next_cursor = await self._fetch_films_page(collection_id, cursor, page_size, fields)
+        while True:
+            prefetch = None
+            if next_cursor:
+                prefetch = asyncio.ensure_future(self._fetch_films_page(collection_id, next_cursor, page_size, fields))
+            try:
+                if films:
+                    yield films, next_cursor
+            except BaseException:
+                if prefetch is not None:
+                    prefetch.cancel()
+                raise
+            if prefetch is None:
+                return
+            films, next_cursor = await prefetch
+    
+    async def get_collection_with_films(self,
+                                        collection_id: str,
+                                        film_rows: int = 10,
+                                        page: int = 1,
+                                        fields: Optional[str] = None) -> Optional[Collection]:
         """
         Get a collection by its identifier and include its films
         
@@ -153,26 +698,40 @@ class ArchiveService:
             collection_id: The identifier of the collection
             film_rows: The number of films to include
             page: The page number for films pagination
+            fields: Optional comma-separated fields of the collection to fetch,
+                with "films.<field>" selecting fields of its films. The films
+                are not searched when they are not selected.
             
         Returns:
             A Collection object with films, or None if not found
         """
-
+        projection = parse_fields(fields)
         params = {
             "q": f"identifier:({collection_id})",
-            "fl": "identifier,title,description",
+            "fl": search_fields(projection, self.DEFAULT_FIELDS.split(",")),
             "rows": 1,
             "output": "json"
         }
         
-        response = self.http_client.get(self.BASE_URL, params=params)
+        async def search_films() -> List[Film]:
+            if not selects(projection, "films"):
+                return []
+            film_fields = join_fields(projection["films"]) if projection is not None else None
+            return await self.search_films_by_collection(collection_id, page=page, rows=film_rows, fields=film_fields)
+        
+        # The collection lookup and the films search are independent, so issue them concurrently
+        response, films = await asyncio.gather(
+            self._fetch("lookup", self.BASE_URL, params=params),
+            search_films()
+        )
         results = response.get("response", {}).get("docs", [])
         
         if not results:
             return None
         
         collection_data = results[0]
-        collection = Collection.from_dict(collection_data)
+        with timing.stage("build"):
+            collection = Collection.from_dict(collection_data)
         
         # Get the original query parameters
         header_params = response.get("responseHeader", {}).get("params", {})
@@ -183,72 +742,230 @@ class ArchiveService:
         collection.page     = page
 
         # Add thumbnail URL for the collection
-        collection.thumbnail_url = f"https://archive.org/services/img/{collection.identifier}"
+        collection.thumbnail_url = self.thumbnail_url(collection.identifier)
 
-        # Now get the films for this collection, using the specified page
-        films = self.search_films_by_collection(collection_id, page=page, rows=film_rows)
+        # Attach the films fetched for the requested page
         collection.films = films
         
         return collection
         
-    def get_video_details(self, video_id: str) -> Optional[Dict[str, Any]]:
+    async def get_video_details(self, video_id: str, fields: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Get detailed information about a specific video
         
         Args:
             video_id: The identifier of the video
+            fields: Optional comma-separated fields of the video to fetch,
+                with "metadata.<field>" selecting fields of its metadata
             
         Returns:
             A dictionary with video details, or None if not found
         """
+        projection = parse_fields(fields)
+        
         # First, get the basic metadata for the video
         params = {
             "q": f"identifier:({video_id})",
-            "fl": "identifier,title,description,creator,date,subject,publicdate,addeddate,mediatype,collection",
+            "fl": search_fields(projection, self.VIDEO_FIELDS.split(",")),
             "rows": 1,
             "output": "json"
         }
         
-        response = self.http_client.get(self.BASE_URL, params=params)
+        # The additional metadata includes files for thumbnails and playback URLs.
+        # It does not depend on the basic lookup, so both requests run concurrently
+        response, item_metadata = await asyncio.gather(
+            self._fetch("lookup", self.BASE_URL, params=params),
+            self._fetch_item_metadata(video_id, projection)
+        )
         results = response.get("response", {}).get("docs", [])
         
         if not results:
             return None
         
-        video_data = results[0]
+        with timing.stage("build"):
+            return self._build_video_details(video_id, results[0], item_metadata)
+    
+    def _item_metadata_url(self, video_id: str, projection: Optional[Dict[str, Any]]) -> Optional[str]:
+        """
+        Get the metadata API URL holding the parts of an item a projection needs
         
-        # Get the additional metadata including files for thumbnails and playback URLs
-        item_metadata_url = f"https://archive.org/metadata/{video_id}"
-        item_metadata = self.http_client.get(item_metadata_url)
+        Returns:
+            The URL of the whole item, of its files or metadata sub-path, or
+            None if no part of the item metadata is needed
+        """
+        needs_files = selects(projection, "thumbnail_url", "playback_urls")
+        needs_metadata = selects(projection, "metadata")
+        if needs_files and needs_metadata:
+            return f"{self.METADATA_URL}/{video_id}"
+        if needs_files:
+            return f"{self.METADATA_URL}/{video_id}/files"
+        if needs_metadata:
+            return f"{self.METADATA_URL}/{video_id}/metadata"
+        return None
+    
+    async def _fetch_item_metadata(self, video_id: str, projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Fetch the parts of the item metadata of a video a projection needs
+        """
+        url = self._item_metadata_url(video_id, projection)
+        if url is None:
+            return {}
+        return await self._fetch("metadata", url)
+    
+    def _build_video_details(self, video_id: str, video_data: Dict[str, Any], item_metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Combine the basic lookup document and the item metadata of a video
         
-        # Extract thumbnail URL
-        thumbnail_url = None
-        files = item_metadata.get("files", [])
-        for file in files:
-            if file.get("name", "").endswith(".jpg") and "thumb" in file.get("name", ""):
-                thumbnail_url = f"https://archive.org/download/{video_id}/{file.get('name')}"
-                break
+        Args:
+            video_id: The identifier of the video
+            video_data: The advancedsearch document of the video
+            item_metadata: The response of the metadata API for the video
+            
+        Returns:
+            A dictionary with video details
+        """
+        # Find the thumbnail and the playback files (best first) in the item files
+        classified = self.file_classifier.classify(video_id, item_metadata.get("files") or [])
         
         # Fallback thumbnail if none found
-        if not thumbnail_url:
-            thumbnail_url = f"https://archive.org/services/img/{video_id}"
-        
-        # Extract playback URLs (video files)
-        playback_urls = []
-        for file in files:
-            # Look for MP4, WebM, or other video formats
-            if file.get("name", "").endswith((".mp4", ".webm", ".avi", ".mov")):
-                playback_urls.append({
-                    "format": file.get("format", "Unknown"),
-                    "url": f"https://archive.org/download/{video_id}/{file.get('name')}"
-                })
+        if classified.thumbnail is not None:
+            thumbnail_url = self.thumbnail_url(video_id, classified.thumbnail.get("name"))
+        else:
+            thumbnail_url = self.thumbnail_url(video_id)
+        
+        playback_urls = [
+            {
+                "format": file.get("format", "Unknown"),
+                "url": self.playback_url(video_id, file.get("name"))
+            }
+            for file in classified.playback
+        ]
         
         # Combine the data into a comprehensive video details object
         video_details = {
             **video_data,
             "thumbnail_url": thumbnail_url,
             "playback_urls": playback_urls,
-            "metadata": item_metadata.get("metadata", {})
+            "metadata": self._item_metadata(item_metadata)
         }
         
-        return video_details 
\ No newline at end of file
+        return video_details
+    
+    @staticmethod
+    def _item_metadata(item_metadata: Dict[str, Any]) -> Any:
+        """
+        Get the metadata object of a compacted metadata API response
+        """
+        raw = item_metadata.get("metadata_json")
+        if raw is None:
+            # Entries cached before responses were compacted
+            return item_metadata.get("metadata", {})
+        return LazyMetadata(raw)
+    
+    async def get_videos_details(self,
+                                 video_ids: List[str],
+                                 concurrency: Optional[int] = None,
+                                 fields: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get detailed information about several videos concurrently
+        
+        Args:
+            video_ids: The identifiers of the videos
+            concurrency: Maximum number of videos fetched at once
+            fields: Optional comma-separated fields of the videos to fetch,
+                as for get_video_details
+            
+        Returns:
+            A dictionary mapping each identifier to its video details, to None
+            if the video was not found, or to the exception raised while fetching it
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.BATCH_CONCURRENCY)
+        projection = parse_fields(fields)
+        unique_ids = list(dict.fromkeys(video_ids))
+        
+        # Resolve the basic documents with a handful of multi-identifier queries
+        # while the item metadata requests are already in flight
+        async def fetch_metadata(video_id: str) -> Any:
+            async with semaphore:
+                try:
+                    return await self._fetch_item_metadata(video_id, projection)
+                except Exception as e:
+                    return e
+        
+        docs, *metadata = await asyncio.gather(
+            self.lookup_identifiers(unique_ids, fields=search_fields(projection, self.VIDEO_FIELDS.split(","))),
+            *[fetch_metadata(video_id) for video_id in unique_ids]
+        )
+        
+        results = {}
+        with timing.stage("build"):
+            for video_id, item_metadata in zip(unique_ids, metadata):
+                video_data = docs[video_id]
+                if video_data is None or isinstance(video_data, Exception):
+                    results[video_id] = video_data
+                elif isinstance(item_metadata, Exception):
+                    results[video_id] = item_metadata
+                else:
+                    results[video_id] = self._build_video_details(video_id, video_data, item_metadata)
+        return results
+    
+    def _chunk_identifiers(self, identifiers: List[str]) -> List[List[str]]:
+        """
+        Split identifiers into chunks whose OR query stays within the URL limits
+        
+        Args:
+            identifiers: The identifiers to split
+            
+        Returns:
+            A list of identifier chunks
+        """
+        chunks = []
+        current = []
+        length = 0
+        for identifier in identifiers:
+            # Each identifier costs its encoded length plus the "+OR+" separator
+            cost = len(quote_plus(identifier)) + 4
+            if current and (len(current) >= self.LOOKUP_CHUNK_SIZE or length + cost > self.LOOKUP_MAX_QUERY_LENGTH):
+                chunks.append(current)
+                current = []
+                length = 0
+            current.append(identifier)
+            length += cost
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    async def lookup_identifiers(self, identifiers: List[str], fields: str = "identifier,title,description") -> Dict[str, Any]:
+        """
+        Look up the advancedsearch documents of several identifiers using
+        `identifier:(a OR b OR ...)` queries, one per chunk of identifiers
+        
+        Args:
+            identifiers: The identifiers to look up
+            fields: The comma-separated list of fields to return
+            
+        Returns:
+            A dictionary mapping each identifier to its document, to None if it
+            was not found, or to the exception raised by the query of its chunk
+        """
+        async def lookup(chunk: List[str]) -> Any:
+            params = {
+                "q": f"identifier:({' OR '.join(chunk)})",
+                "fl": fields,
+                "rows": len(chunk),
+                "output": "json"
+            }
+            try:
+                response = await self._fetch("lookup", self.BASE_URL, params=params)
+            except Exception as e:
+                return e
+            return {doc.get("identifier"): doc for doc in response.get("response", {}).get("docs", [])}
+        
+        chunks = self._chunk_identifiers(list(dict.fromkeys(identifiers)))
+        responses = await asyncio.gather(*[lookup(chunk) for chunk in chunks])
+        
+        results = {}
+        for chunk, docs in zip(chunks, responses):
+            for identifier in chunk:
+                results[identifier] = docs if isinstance(docs, Exception) else docs.get(identifier)
+        return results
\ No newline at end of file
@@ -0,0 +1,716 @@
+"""
+Tiered response cache for upstream Internet Archive queries
+"""
+import os
+import json
+import time
+import uuid
+import zlib
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Tags of the binary encoding of values stored on disk
+RAW_TAG = b"\x00"
+ZLIB_TAG = b"\x01"
+
+
+def normalize_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Build a cache key that is identical for equivalent upstream queries
+
+    Query parameters from the URL and from `params` are merged, sorted and
+    whitespace-normalized, so "stars+desc" and "stars desc" share a key.
+
+    Args:
+        url: The upstream URL, optionally with a query string
+        params: Optional query parameters
+
+    Returns:
+        The normalized key
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query += [(key, str(value)) for key, value in (params or {}).items()]
+    normalized = sorted((key, " ".join(value.split())) for key, value in query)
+    return f"{parts.netloc}{parts.path}?{urlencode(normalized)}"
+
+
+def pack(encoded: bytes, compress_min_size: int) -> bytes:
+    """
+    Encode a value serialized with orjson for the disk tier: tagged as is,
+    or zlib-compressed when at least `compress_min_size` bytes (0 never compresses)
+    """
+    if compress_min_size and len(encoded) >= compress_min_size:
+        return ZLIB_TAG + zlib.compress(encoded, 1)
+    return RAW_TAG + encoded
+
+
+def unpack(data: bytes) -> bytes:
+    """
+    Get back the JSON of a value stored by pack()
+    """
+    tag = data[:1]
+    if tag == ZLIB_TAG:
+        return zlib.decompress(data[1:])
+    if tag == RAW_TAG:
+        return data[1:]
+    # Rows written before the binary encoding hold JSON text
+    return data
+
+
+@dataclass
+class CacheEntry:
+    """
+    A cached upstream response
+    """
+    value: Any
+    size: int
+    expires_at: float
+    # Upstream validators ("etag", "last_modified") used to revalidate the entry
+    validators: Optional[Dict[str, str]] = None
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        """
+        Check whether the entry has not expired yet
+        """
+        return (now if now is not None else time.time()) < self.expires_at
+
+
+class MemoryCache:
+    """
+    In-process LRU cache bounded by entry count and total payload bytes
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Get an entry and mark it as most recently used
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """
+        Get an entry without changing its recency
+        """
+        return self._entries.get(key)
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        """
+        Store an entry, evicting the least recently used ones when over budget
+        """
+        if entry.size > self.max_bytes or self.max_entries <= 0:
+            return
+        self.delete(key)
+        self._entries[key] = entry
+        self.total_bytes += entry.size
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= evicted.size
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        """
+        Remove an entry if present
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    def clear(self) -> None:
+        """
+        Remove every entry
+        """
+        self._entries.clear()
+        self.total_bytes = 0
+
+
+class DiskCache:
+    """
+    SQLite-backed cache tier that survives restarts.
+
+    The database is in WAL mode, so the uvicorn workers of a host can share
+    it: readers do not block each other nor the writer, and reads go through
+    a memory map of the file, whose pages the workers share. It also holds
+    the locks letting a single worker fetch a missing key.
+
+    Reads and writes go through separate connections, so a write waiting
+    for another process's write never holds up the reads of this one.
+    """
+
+    def __init__(self, path: str, mmap_size: int = 0, busy_timeout: float = 5.0):
+        """
+        Args:
+            path: Path of the SQLite database
+            mmap_size: Bytes of the database file read through a memory map
+            busy_timeout: Seconds a write waits for another process's write
+        """
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._write_conn = sqlite3.connect(path, check_same_thread=False, timeout=busy_timeout)
+        self._write_conn.execute("PRAGMA journal_mode=WAL")
+        # Durability of the last transactions is not needed for a cache
+        self._write_conn.execute("PRAGMA synchronous=NORMAL")
+        self._write_conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL, validators TEXT)"
+        )
+        self._write_conn.execute(
+            "CREATE TABLE IF NOT EXISTS locks ("
+            "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        # Databases created before validators were stored lack the column
+        columns = {row[1] for row in self._write_conn.execute("PRAGMA table_info(cache)")}
+        if "validators" not in columns:
+            self._write_conn.execute("ALTER TABLE cache ADD COLUMN validators TEXT")
+        # Pruning removes the entries expiring first
+        self._write_conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+        self._write_conn.commit()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=busy_timeout)
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float, Optional[Dict[str, str]]]]:
+        """
+        Get the encoded value, expiry time and upstream validators stored for a key
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at, validators FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], row[1], json.loads(row[2]) if row[2] else None) if row else None
+
+    def set(self, key: str, value: bytes, expires_at: float, validators: Optional[Dict[str, str]] = None) -> None:
+        """
+        Store an encoded value
+        """
+        with self._write_lock:
+            self._write_conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, validators) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, json.dumps(validators) if validators else None)
+            )
+            self._write_conn.commit()
+
+    def touch(self, key: str, expires_at: float) -> None:
+        """
+        Change the expiry time of a key
+        """
+        with self._write_lock:
+            self._write_conn.execute("UPDATE cache SET expires_at = ? WHERE key = ?", (expires_at, key))
+            self._write_conn.commit()
+
+    def delete(self, key: str) -> None:
+        """
+        Remove a key if present
+        """
+        with self._write_lock:
+            self._write_conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._write_conn.commit()
+
+    def expiry(self, key: str) -> Optional[float]:
+        """
+        Get the expiry time of a key without reading its value
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def acquire(self, key: str, owner: str, timeout: float) -> bool:
+        """
+        Take the lock of a key unless another owner holds an unexpired one
+
+        Args:
+            key: The locked key
+            owner: The identifier of the lock holder
+            timeout: Seconds after which the lock expires if not released
+
+        Returns:
+            Whether the lock was taken
+        """
+        now = time.time()
+        with self._write_lock:
+            cursor = self._write_conn.execute(
+                "INSERT INTO locks (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE locks.expires_at <= ?",
+                (key, owner, now + timeout, now)
+            )
+            self._write_conn.commit()
+        return cursor.rowcount == 1
+
+    def locked(self, key: str) -> bool:
+        """
+        Check whether an unexpired lock is held on a key, without writing
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM locks WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return row is not None
+
+    def release(self, key: str, owner: str) -> None:
+        """
+        Release a lock taken by `owner`
+        """
+        with self._write_lock:
+            self._write_conn.execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner))
+            self._write_conn.commit()
+
+    def prune(self, expired_before: float, max_entries: int) -> int:
+        """
+        Remove the rows expired before a time, then the rows expiring first
+        until at most 90% of `max_entries` are left when there are more, and
+        the locks left behind by dead workers
+
+        Args:
+            expired_before: Rows expired before this time are no longer served
+            max_entries: Maximum number of rows
+
+        Returns:
+            The number of rows removed
+        """
+        with self._write_lock:
+            removed = self._write_conn.execute("DELETE FROM cache WHERE expires_at <= ?", (expired_before,)).rowcount
+            count = self._write_conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > max_entries:
+                removed += self._write_conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at LIMIT ?)",
+                    (count - int(max_entries * 0.9),)
+                ).rowcount
+            self._write_conn.execute("DELETE FROM locks WHERE expires_at <= ?", (time.time(),))
+            self._write_conn.commit()
+        return removed
+
+    def clear(self) -> None:
+        """
+        Remove every row
+        """
+        with self._write_lock:
+            self._write_conn.execute("DELETE FROM cache")
+            self._write_conn.commit()
+
+    def close(self) -> None:
+        """
+        Close the database connection
+        """
+        with self._write_lock:
+            self._write_conn.close()
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for upstream responses: an in-memory LRU in front of an
+    optional on-disk store. Entries expire after a per-endpoint TTL and stay
+    available as stale values for a further grace period, so callers can
+    serve them while revalidating in the background. When upstream is
+    unavailable, entries can be served for a longer stale-if-error period.
+
+    The disk tier can be shared by the workers of a host, e.g. on a tmpfs
+    such as /dev/shm: entries stored by one worker are read by the others,
+    and a worker fetching a missing or expired key holds a lock on it that
+    makes the other workers wait for its result instead of fetching it too.
+
+    Writes to the disk tier run in order on a single background thread, so
+    requests never wait for SQLite commits nor for other processes' writes.
+    Entries are pruned from disk once past every grace period, and the
+    entries expiring first are removed when the disk tier holds more than
+    `disk_max_entries`.
+
+    Cached values are shared between callers and must not be mutated.
+    """
+    # Configuration, overridable through environment variables
+    MAX_ENTRIES = int(os.getenv("ARCHIVE_CACHE_MAX_ENTRIES", "2048"))
+    MAX_BYTES = int(os.getenv("ARCHIVE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    DISK_PATH = os.getenv("ARCHIVE_CACHE_DISK_PATH", "")
+    STALE_TTL = float(os.getenv("ARCHIVE_CACHE_STALE_TTL", "600"))
+    STALE_IF_ERROR_TTL = float(os.getenv("ARCHIVE_CACHE_STALE_IF_ERROR_TTL", "86400"))
+    # Bytes of the disk tier read through a shared memory map
+    DISK_MMAP_SIZE = int(os.getenv("ARCHIVE_CACHE_DISK_MMAP_SIZE", str(256 * 1024 * 1024)))
+    # Values at least this large are zlib-compressed on disk, 0 never compresses
+    COMPRESS_MIN_SIZE = int(os.getenv("ARCHIVE_CACHE_COMPRESS_MIN_SIZE", "4096"))
+    DISK_MAX_ENTRIES = int(os.getenv("ARCHIVE_CACHE_DISK_MAX_ENTRIES", "100000"))
+    # Seconds between prunings of the disk tier
+    PRUNE_INTERVAL = 300
+    # Whether workers sharing the disk tier lock keys so only one fetches each
+    SHARED_LOCKS = os.getenv("ARCHIVE_CACHE_SHARED_LOCKS", "true").lower() in ("1", "true", "yes")
+    # Seconds a lock is held at most, in case its worker dies while fetching
+    LOCK_TIMEOUT = float(os.getenv("ARCHIVE_CACHE_LOCK_TIMEOUT", "15"))
+    # Seconds between checks for the value of a key locked by another worker
+    LOCK_POLL_INTERVAL = 0.05
+    TTLS = {
+        "search": float(os.getenv("ARCHIVE_CACHE_TTL_SEARCH", "300")),
+        "lookup": float(os.getenv("ARCHIVE_CACHE_TTL_LOOKUP", "3600")),
+        "metadata": float(os.getenv("ARCHIVE_CACHE_TTL_METADATA", "3600")),
+    }
+
+    def __init__(self,
+                 max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 disk_path: Optional[str] = None,
+                 ttls: Optional[Dict[str, float]] = None,
+                 stale_ttl: Optional[float] = None,
+                 stale_if_error_ttl: Optional[float] = None,
+                 compress_min_size: Optional[int] = None,
+                 disk_max_entries: Optional[int] = None,
+                 shared_locks: Optional[bool] = None,
+                 lock_timeout: Optional[float] = None):
+        """
+        Args:
+            max_entries: Maximum number of entries kept in memory
+            max_bytes: Maximum encoded size of the entries kept in memory
+            disk_path: Path of the SQLite database for the disk tier, disabled when empty
+            ttls: Time to live in seconds per endpoint, 0 disables caching for an endpoint
+            stale_ttl: Seconds an expired entry can still be served as stale
+            stale_if_error_ttl: Seconds an expired entry can still be served while upstream is unavailable
+            compress_min_size: Smallest value in bytes compressed on disk, 0 never compresses
+            disk_max_entries: Maximum number of entries kept on disk
+            shared_locks: Whether keys are locked across the processes sharing the disk tier
+            lock_timeout: Seconds a lock is held at most
+        """
+        self.memory = MemoryCache(
+            max_entries if max_entries is not None else self.MAX_ENTRIES,
+            max_bytes if max_bytes is not None else self.MAX_BYTES
+        )
+        disk_path = disk_path if disk_path is not None else self.DISK_PATH
+        self.disk = DiskCache(disk_path, mmap_size=self.DISK_MMAP_SIZE) if disk_path else None
+        self.ttls = {**self.TTLS, **(ttls or {})}
+        self.stale_ttl = stale_ttl if stale_ttl is not None else self.STALE_TTL
+        self.stale_if_error_ttl = stale_if_error_ttl if stale_if_error_ttl is not None else self.STALE_IF_ERROR_TTL
+        self.compress_min_size = compress_min_size if compress_min_size is not None else self.COMPRESS_MIN_SIZE
+        self.disk_max_entries = disk_max_entries or self.DISK_MAX_ENTRIES
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-disk") if self.disk is not None else None
+        self._pruned_at = time.monotonic()
+        self.disk_pruned = 0
+        shared_locks = shared_locks if shared_locks is not None else self.SHARED_LOCKS
+        self.shared_locks = shared_locks and self.disk is not None
+        self.lock_timeout = lock_timeout if lock_timeout is not None else self.LOCK_TIMEOUT
+        # Identifies the locks of this cache among the processes sharing the disk tier
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self.shared_waits = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _write(self, func: Callable[..., Any], *args: Any) -> Future:
+        """
+        Run a write to the disk tier on the writer thread, after the writes
+        submitted before it, logging its failure
+        """
+        def run() -> Any:
+            try:
+                return func(*args)
+            except Exception:
+                logger.exception("Disk cache write failed")
+                raise
+        return self._writer.submit(run)
+
+    def _prune(self) -> None:
+        retention = max(self.stale_ttl, self.stale_if_error_ttl)
+        self.disk_pruned += self.disk.prune(time.time() - retention, self.disk_max_entries)
+
+    def flush(self) -> None:
+        """
+        Wait for the pending writes to the disk tier
+        """
+        if self._writer is not None:
+            self._writer.submit(lambda: None).result()
+
+    def _load(self, key: str, stored: Tuple[bytes, float, Optional[Dict[str, str]]]) -> CacheEntry:
+        """
+        Decode an entry read from the disk tier and keep it in memory
+        """
+        encoded = unpack(stored[0])
+        entry = CacheEntry(orjson.loads(encoded), len(encoded), stored[1], stored[2])
+        self.memory.set(key, entry)
+        return entry
+
+    def ttl(self, endpoint: str) -> float:
+        """
+        Get the time to live configured for an endpoint
+        """
+        return self.ttls.get(endpoint, 0)
+
+    def lookup(self,
+               endpoint: str,
+               key: str,
+               allow_stale: bool = True,
+               if_error: bool = False) -> Optional[Tuple[Any, bool]]:
+        """
+        Get a cached value together with its freshness
+
+        Args:
+            endpoint: The upstream endpoint the key belongs to
+            key: The normalized query key
+            allow_stale: Whether expired entries within the stale grace period are returned
+            if_error: Whether upstream is unavailable, extending the stale grace
+                period to the stale-if-error one
+
+        Returns:
+            A (value, is_fresh) tuple, or None on a miss
+        """
+        if self.ttl(endpoint) <= 0:
+            return None
+        now = time.time()
+        grace = max(self.stale_ttl, self.stale_if_error_ttl) if if_error else self.stale_ttl
+        # Entries are kept until neither grace period can use them anymore
+        retention = max(self.stale_ttl, self.stale_if_error_ttl)
+        from_disk = False
+        entry = self.memory.get(key)
+        if (entry is None or not entry.is_fresh(now)) and self.disk is not None:
+            # The disk tier may hold a newer entry, stored by another worker
+            stored = self.disk.get(key)
+            if stored is not None and stored[1] + grace > now and (entry is None or stored[1] > entry.expires_at):
+                entry = self._load(key, stored)
+                from_disk = True
+        if entry is None or now >= entry.expires_at + grace:
+            if entry is not None and now >= entry.expires_at + retention:
+                self.memory.delete(key)
+            self.misses += 1
+            return None
+        if entry.is_fresh(now):
+            if from_disk:
+                self.disk_hits += 1
+            else:
+                self.hits += 1
+            return entry.value, True
+        if not allow_stale:
+            self.misses += 1
+            return None
+        self.stale_hits += 1
+        return entry.value, False
+
+    def get(self, endpoint: str, key: str) -> Optional[Any]:
+        """
+        Get a fresh cached value
+
+        Args:
+            endpoint: The upstream endpoint the key belongs to
+            key: The normalized query key
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        hit = self.lookup(endpoint, key, allow_stale=False)
+        return hit[0] if hit is not None else None
+
+    def expires_in(self, key: str) -> Optional[float]:
+        """
+        Get the seconds left before an entry expires (negative once stale)
+
+        Args:
+            key: The normalized query key
+
+        Returns:
+            The remaining time to live, or None if the key is not cached
+        """
+        expires_at = self.expiry(key)
+        return expires_at - time.time() if expires_at is not None else None
+
+    def expiry(self, key: str) -> Optional[float]:
+        """
+        Get the time an entry expires at, the latest of both tiers
+
+        Args:
+            key: The normalized query key
+
+        Returns:
+            The expiry time, or None if the key is not cached
+        """
+        entry = self.memory.peek(key)
+        expires_at = entry.expires_at if entry is not None else None
+        if self.disk is not None and (entry is None or not entry.is_fresh()):
+            stored_expires_at = self.disk.expiry(key)
+            if stored_expires_at is not None and (expires_at is None or stored_expires_at > expires_at):
+                expires_at = stored_expires_at
+        return expires_at
+
+    def updated_value(self, key: str, expires_at: Optional[float]) -> Optional[Any]:
+        """
+        Get the value of an entry stored since a previous state of the key,
+        typically by another worker sharing the disk tier
+
+        Args:
+            key: The normalized query key
+            expires_at: The expiry time the entry had, None if it was not cached
+
+        Returns:
+            The fresh value of the entry if it expires later than before, otherwise None
+        """
+        now = time.time()
+        entry = self.memory.peek(key)
+        if (entry is None or not entry.is_fresh(now)) and self.disk is not None:
+            stored = self.disk.get(key)
+            if stored is not None and (entry is None or stored[1] > entry.expires_at):
+                entry = self._load(key, stored)
+        if entry is None or not entry.is_fresh(now) or (expires_at is not None and entry.expires_at <= expires_at):
+            return None
+        return entry.value
+
+    async def acquire(self, key: str) -> bool:
+        """
+        Lock a key for the other processes sharing the disk tier. The lock
+        row is written on the writer thread, as it may wait for the writes
+        of other processes.
+
+        Args:
+            key: The normalized query key
+
+        Returns:
+            Whether the lock was taken, always True without shared locks
+        """
+        if not self.shared_locks:
+            return True
+        return await asyncio.wrap_future(self._write(self.disk.acquire, key, self.owner, self.lock_timeout))
+
+    def locked(self, key: str) -> bool:
+        """
+        Check whether another process holds the lock of a key, with a read
+        that never waits for writers
+
+        Args:
+            key: The normalized query key
+
+        Returns:
+            Whether the key is locked, always False without shared locks
+        """
+        return self.shared_locks and self.disk.locked(key)
+
+    def release(self, key: str) -> None:
+        """
+        Release a lock taken with acquire()
+        """
+        if self.shared_locks:
+            # Queued after the write of the value fetched under the lock
+            self._write(self.disk.release, key, self.owner)
+
+    def set(self, endpoint: str, key: str, value: Any, validators: Optional[Dict[str, str]] = None) -> None:
+        """
+        Store a value under the TTL of its endpoint
+
+        Args:
+            endpoint: The upstream endpoint the key belongs to
+            key: The normalized query key
+            value: The JSON-compatible upstream response
+            validators: The upstream validators ("etag", "last_modified") of the response
+        """
+        ttl = self.ttl(endpoint)
+        if ttl <= 0:
+            return
+        encoded = orjson.dumps(value)
+        expires_at = time.time() + ttl
+        self.memory.set(key, CacheEntry(value, len(encoded), expires_at, validators or None))
+        if self.disk is not None:
+            self._write(self.disk.set, key, pack(encoded, self.compress_min_size), expires_at, validators or None)
+            if time.monotonic() - self._pruned_at >= self.PRUNE_INTERVAL:
+                self._pruned_at = time.monotonic()
+                self._write(self._prune)
+
+    def validators(self, key: str) -> Optional[Dict[str, str]]:
+        """
+        Get the upstream validators of a cached entry, fresh or not
+
+        Args:
+            key: The normalized query key
+
+        Returns:
+            The "etag" and "last_modified" validators, or None when the key
+            is not cached or upstream sent none
+        """
+        entry = self.memory.peek(key)
+        if entry is not None:
+            return entry.validators
+        if self.disk is not None:
+            stored = self.disk.get(key)
+            if stored is not None:
+                return stored[2]
+        return None
+
+    def revalidate(self, endpoint: str, key: str, validators: Optional[Dict[str, str]] = None) -> Optional[Any]:
+        """
+        Renew the TTL of an entry that upstream reported as not modified
+
+        Args:
+            endpoint: The upstream endpoint the key belongs to
+            key: The normalized query key
+            validators: The validators of the not modified response
+
+        Returns:
+            The cached value, or None when the entry is gone and has to be fetched again
+        """
+        entry = self.memory.peek(key)
+        if entry is None and self.disk is not None:
+            stored = self.disk.get(key)
+            if stored is not None:
+                entry = self._load(key, stored)
+        if entry is None:
+            return None
+        entry.expires_at = time.time() + self.ttl(endpoint)
+        if validators:
+            entry.validators = validators
+        if self.disk is not None:
+            self._write(self.disk.touch, key, entry.expires_at)
+        return entry.value
+
+    def clear(self) -> None:
+        """
+        Remove every entry from both tiers
+        """
+        self.memory.clear()
+        if self.disk is not None:
+            self._write(self.disk.clear).result()
+
+    def close(self) -> None:
+        """
+        Finish the pending writes and release the disk tier
+        """
+        if self.disk is not None:
+            self._writer.shutdown(wait=True)
+            self.disk.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache counters
+        """
+        served = self.hits + self.disk_hits + self.stale_hits
+        lookups = served + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": served / lookups if lookups else 0.0,
+            "evictions": self.memory.evictions,
+            "entries": len(self.memory),
+            "bytes": self.memory.total_bytes,
+            "max_entries": self.memory.max_entries,
+            "max_bytes": self.memory.max_bytes,
+            "disk_enabled": self.disk is not None,
+            "disk_pruned": self.disk_pruned,
+            "ttls": self.ttls,
+            "stale_ttl": self.stale_ttl,
+            "stale_if_error_ttl": self.stale_if_error_ttl,
+            "shared_locks": self.shared_locks,
+            "shared_waits": self.shared_waits
+        }
\ No newline at end of file
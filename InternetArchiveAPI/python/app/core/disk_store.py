@@ -0,0 +1,132 @@
+"""
+Directory of files bounded by their total size
+"""
+import os
+import time
+import tempfile
+import threading
+from typing import Iterator, Optional, Tuple
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """
+    Write a file atomically, so concurrent readers and workers never see it
+    partially written
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+class DiskStore:
+    """
+    Files stored by name under a directory, spread over subdirectories named
+    after the first two characters of their name. Once their total size
+    exceeds `max_bytes`, the least recently used files are removed; use is
+    tracked through the modification time of the files.
+
+    Writes and evictions walk the directory and should run in a thread
+    rather than on the event loop; they are serialized by a lock.
+    """
+    # Seconds between updates of the modification time of a used file
+    TOUCH_INTERVAL = 3600
+
+    def __init__(self, path: str, max_bytes: int):
+        """
+        Args:
+            path: Directory of the files
+            max_bytes: Total size above which the least recently used files are removed
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        # Computed on the first write
+        self.total_bytes: Optional[int] = None
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def path_of(self, name: str) -> str:
+        """
+        Get the path of a file, whether it exists or not
+        """
+        return os.path.join(self.path, name[:2], name)
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path_of(name))
+
+    def write(self, name: str, data: bytes) -> str:
+        """
+        Store a file unless it exists, evicting the least recently used files
+        when the store grows beyond its limit
+
+        Returns:
+            The path of the file
+        """
+        path = self.path_of(name)
+        if os.path.exists(path):
+            return path
+        write_atomic(path, data)
+        with self._lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for _, _, size in self._files())
+            else:
+                self.total_bytes += len(data)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+        return path
+
+    def touch(self, name: str) -> None:
+        """
+        Mark a file as recently used
+        """
+        path = self.path_of(name)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.TOUCH_INTERVAL:
+                os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _files(self) -> Iterator[Tuple[str, float, int]]:
+        """
+        Iterate over the stored files as (path, modification time, size)
+        """
+        for prefix in os.scandir(self.path):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_mtime, stat.st_size
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used files until the store is back to 90%
+        of its limit
+        """
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        files = sorted(self._files(), key=lambda item: item[1])
+        total = sum(size for _, _, size in files)
+        for path, _, size in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evicted += 1
+        self.total_bytes = total
@@ -0,0 +1,191 @@
+"""
+Classification of Internet Archive item files into playback candidates and thumbnails
+"""
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def _env_list(name: str, default: str) -> List[str]:
+    """
+    Read a comma-separated list from an environment variable
+    """
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
+def _number(value: Any) -> float:
+    """
+    Convert a metadata API numeric field, which is usually a string, to a number
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _extension(name: str) -> str:
+    """
+    Get the lowercase extension of a file name, empty when it has none
+    """
+    return name.rpartition(".")[2].lower() if "." in name else ""
+
+
+@dataclass
+class ClassifiedFiles:
+    """
+    The playback candidates and thumbnail of an item. Its files are indexed
+    by extension, format and derivative source on first access only, as most
+    requests need nothing but the playback candidates and thumbnail.
+    """
+    files: List[Dict[str, Any]] = field(default_factory=list)
+    # Playback candidates, best first
+    playback: List[Dict[str, Any]] = field(default_factory=list)
+    thumbnail: Optional[Dict[str, Any]] = None
+
+    def _group(self, key: Callable[[Dict[str, Any]], Optional[str]]) -> Dict[str, List[Dict[str, Any]]]:
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for file in self.files:
+            value = key(file)
+            if value is not None:
+                groups.setdefault(value, []).append(file)
+        return groups
+
+    @cached_property
+    def by_extension(self) -> Dict[str, List[Dict[str, Any]]]:
+        return self._group(lambda file: _extension(file.get("name", "")))
+
+    @cached_property
+    def by_format(self) -> Dict[str, List[Dict[str, Any]]]:
+        return self._group(lambda file: str(file.get("format", "")))
+
+    @cached_property
+    def derivatives(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Derivative files keyed by the name of the original they were made from
+        """
+        return self._group(lambda file: (file.get("original") or None) if file.get("source") == "derivative" else None)
+
+
+class FileClassifier:
+    """
+    Classifies the `files` list of the metadata API in a single pass.
+
+    Playback candidates are ranked by format preference, then by bitrate and
+    size, and the thumbnail is the image with the most preferred format. The
+    rules are compiled to lookup tables once, and classifications are cached
+    per item for as long as its files list is the same object, so repeated
+    requests served from the response cache are not classified again.
+    """
+    # Configuration, overridable through environment variables
+    PLAYBACK_EXTENSIONS = _env_list("ARCHIVE_PLAYBACK_EXTENSIONS", "mp4,webm,avi,mov")
+    # Preferred playback formats, best first; other formats rank after them
+    PLAYBACK_FORMATS = _env_list("ARCHIVE_PLAYBACK_FORMATS", "h.264,MPEG4,h.264 IA,512Kb MPEG4,WebM,QuickTime,Cinepack")
+    THUMBNAIL_EXTENSIONS = _env_list("ARCHIVE_THUMBNAIL_EXTENSIONS", "jpg,jpeg,png,gif")
+    # Preferred thumbnail formats, best first; any other image with "thumb" in its name ranks after them
+    THUMBNAIL_FORMATS = _env_list("ARCHIVE_THUMBNAIL_FORMATS", "Item Tile,Thumbnail,JPEG Thumb")
+    CACHE_SIZE = int(os.getenv("ARCHIVE_FILE_CLASSIFIER_CACHE_SIZE", "1024"))
+
+    def __init__(self,
+                 playback_extensions: Optional[List[str]] = None,
+                 playback_formats: Optional[List[str]] = None,
+                 thumbnail_extensions: Optional[List[str]] = None,
+                 thumbnail_formats: Optional[List[str]] = None,
+                 cache_size: Optional[int] = None):
+        """
+        Args:
+            playback_extensions: File extensions of playable videos
+            playback_formats: Playback formats in order of preference
+            thumbnail_extensions: File extensions of thumbnail images
+            thumbnail_formats: Thumbnail formats in order of preference
+            cache_size: Maximum number of items whose classification is cached
+        """
+        self.playback_extensions = {ext.lower().lstrip(".") for ext in playback_extensions or self.PLAYBACK_EXTENSIONS}
+        self.thumbnail_extensions = {ext.lower().lstrip(".") for ext in thumbnail_extensions or self.THUMBNAIL_EXTENSIONS}
+        self.playback_ranks = {name.lower(): rank for rank, name in enumerate(playback_formats or self.PLAYBACK_FORMATS)}
+        self.thumbnail_ranks = {name.lower(): rank for rank, name in enumerate(thumbnail_formats or self.THUMBNAIL_FORMATS)}
+        self.cache_size = cache_size if cache_size is not None else self.CACHE_SIZE
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[str, Tuple[List[Dict[str, Any]], ClassifiedFiles]]" = OrderedDict()
+
+    def _playback_key(self, file: Dict[str, Any]) -> Tuple[int, float, float, str]:
+        """
+        Sort key of a playback candidate: preferred format, then highest bitrate and size
+        """
+        size = _number(file.get("size"))
+        bitrate = _number(file.get("bitrate"))
+        if not bitrate:
+            length = _number(file.get("length"))
+            bitrate = size * 8 / length if length else 0.0
+        rank = self.playback_ranks.get(str(file.get("format", "")).lower(), len(self.playback_ranks))
+        return rank, -bitrate, -size, file.get("name", "")
+
+    def _classify(self, files: List[Dict[str, Any]]) -> ClassifiedFiles:
+        """
+        Pick the playback candidates and thumbnail in one pass
+        """
+        classified = ClassifiedFiles(files)
+        thumbnail_rank = None
+        for file in files:
+            name = file.get("name", "")
+            extension = _extension(name)
+            if extension in self.playback_extensions:
+                classified.playback.append(file)
+            elif extension in self.thumbnail_extensions:
+                rank = self.thumbnail_ranks.get(str(file.get("format", "")).lower())
+                if rank is None and "thumb" in name:
+                    rank = len(self.thumbnail_ranks)
+                if rank is not None and (thumbnail_rank is None or rank < thumbnail_rank):
+                    classified.thumbnail = file
+                    thumbnail_rank = rank
+
+        classified.playback.sort(key=self._playback_key)
+        return classified
+
+    def classify(self, identifier: str, files: List[Dict[str, Any]]) -> ClassifiedFiles:
+        """
+        Classify the files of an item, reusing the cached classification when
+        the item's files list has not changed
+
+        Args:
+            identifier: The identifier of the item
+            files: The `files` list of the metadata API response
+
+        Returns:
+            The classified files
+        """
+        if not files:
+            return ClassifiedFiles()
+        cached = self._cache.get(identifier)
+        if cached is not None and cached[0] is files:
+            self._cache.move_to_end(identifier)
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        classified = self._classify(files)
+        if self.cache_size > 0:
+            # The files list is kept so a refreshed response is detected by identity
+            self._cache[identifier] = (files, classified)
+            self._cache.move_to_end(identifier)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return classified
+
+    def clear(self) -> None:
+        """
+        Drop every cached classification
+        """
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the classification cache counters
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._cache)
+        }
@@ -0,0 +1,193 @@
+"""
+Incremental harvester keeping the local search index in sync with the Internet Archive
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from ..utils.rate_limiter import TokenBucket
+from .search_index import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+
+class Harvester:
+    """
+    Walks collections through the ArchiveService and writes their items into
+    the local search index.
+
+    The first run of a collection walks every item; later runs only fetch
+    items whose `publicdate` or `addeddate` is newer than the start of the
+    previous completed run (minus an overlap). The cursor is checkpointed
+    after each page, so an interrupted run resumes where it stopped.
+    """
+    # Configuration, overridable through environment variables
+    COLLECTIONS = [c.strip() for c in os.getenv("ARCHIVE_HARVEST_COLLECTIONS", "").split(",") if c.strip()]
+    CONCURRENCY = int(os.getenv("ARCHIVE_HARVEST_CONCURRENCY", "2"))
+    RATE = float(os.getenv("ARCHIVE_HARVEST_RATE", "2"))
+    PAGE_SIZE = int(os.getenv("ARCHIVE_HARVEST_PAGE_SIZE", "1000"))
+    INTERVAL = float(os.getenv("ARCHIVE_HARVEST_INTERVAL", "3600"))
+    OVERLAP = float(os.getenv("ARCHIVE_HARVEST_OVERLAP", "3600"))
+
+    # The media type harvested, the only one the local index answers for
+    MEDIATYPE = "movies"
+
+    # Fields stored in the local index
+    FIELDS = "identifier,title,description,subject,mediatype,date,publicdate,addeddate,avg_rating,downloads,collection"
+
+    def __init__(self,
+                 service,
+                 index: SearchIndex,
+                 concurrency: Optional[int] = None,
+                 rate: Optional[float] = None,
+                 page_size: Optional[int] = None,
+                 overlap: Optional[float] = None):
+        """
+        Args:
+            service: The ArchiveService used to reach the Internet Archive
+            index: The local search index written to
+            concurrency: Maximum number of collections harvested at once
+            rate: Maximum upstream page requests per second
+            page_size: The number of items per page
+            overlap: Seconds subtracted from the previous run start on incremental runs
+        """
+        self.service = service
+        self.index = index
+        self.concurrency = concurrency or self.CONCURRENCY
+        self.rate_limiter = TokenBucket(rate or self.RATE)
+        self.page_size = page_size or self.PAGE_SIZE
+        self.overlap = overlap if overlap is not None else self.OVERLAP
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _now() -> datetime:
+        return datetime.now(timezone.utc)
+
+    @staticmethod
+    def _format(moment: datetime) -> str:
+        return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def _query(self, collection_id: str, since: Optional[str]) -> str:
+        """
+        Build the advancedsearch query of a run
+        """
+        query = f"collection:({collection_id}) AND mediatype:({self.MEDIATYPE})"
+        if since:
+            query += f" AND (publicdate:[{since} TO *] OR addeddate:[{since} TO *])"
+        return query
+
+    async def harvest_collection(self, collection_id: str, full: bool = False) -> int:
+        """
+        Harvest one collection, resuming an interrupted run if there is one
+
+        Args:
+            collection_id: The identifier of the collection
+            full: Ignore the previous checkpoint and walk every item
+
+        Returns:
+            The number of items written during this call
+        """
+        checkpoint = None if full else await asyncio.to_thread(self.index.get_checkpoint, collection_id)
+
+        if checkpoint and checkpoint["run_started_at"]:
+            # Resume the interrupted run with the same date bound
+            since = checkpoint["since"]
+            cursor = checkpoint["cursor"]
+            run_started_at = checkpoint["run_started_at"]
+            items = checkpoint["items"]
+            logger.info("Resuming harvest of %s after %d items", collection_id, items)
+        else:
+            since = checkpoint["since"] if checkpoint else None
+            cursor = None
+            run_started_at = self._format(self._now())
+            items = 0
+            logger.info("Harvesting %s %s", collection_id, f"since {since}" if since else "from scratch")
+
+        query = self._query(collection_id, since)
+        resumed_cursor = cursor
+        written = 0
+        while True:
+            await self.rate_limiter.acquire()
+            try:
+                docs, next_cursor = await self.service.fetch_documents_page(
+                    query, cursor=cursor, page_size=self.page_size, fields=self.FIELDS
+                )
+            except Exception:
+                if cursor is None or cursor != resumed_cursor or cursor.startswith("page:"):
+                    raise
+                # Scrape cursors expire, so a resumed cursor that fails restarts the run
+                logger.warning("Checkpointed cursor of %s is no longer valid, restarting the run", collection_id)
+                cursor = resumed_cursor = None
+                items = 0
+                continue
+
+            # Index writes commit and update the full-text index, so they run
+            # in a thread to keep the API responsive during background harvests
+            written += await asyncio.to_thread(self.index.add_documents, docs, collection_id)
+            items += len(docs)
+            await asyncio.to_thread(
+                self.index.save_checkpoint, collection_id, since, next_cursor, run_started_at if next_cursor else None, items
+            )
+            if not next_cursor:
+                break
+            cursor = next_cursor
+
+        # The next incremental run starts from this run's start, minus the overlap
+        next_since = datetime.strptime(run_started_at, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        next_since -= timedelta(seconds=self.overlap)
+        await asyncio.to_thread(self.index.save_checkpoint, collection_id, self._format(next_since), None, None, items)
+        await asyncio.to_thread(self.index.mark_harvested, collection_id, self.MEDIATYPE)
+        logger.info("Harvested %d items of %s", written, collection_id)
+        return written
+
+    async def harvest(self, collection_ids: List[str], full: bool = False) -> Dict[str, Any]:
+        """
+        Harvest several collections concurrently
+
+        Args:
+            collection_ids: The identifiers of the collections
+            full: Ignore the previous checkpoints and walk every item
+
+        Returns:
+            A dictionary mapping each identifier to the number of items written,
+            or to the exception that stopped its harvest
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def harvest_one(collection_id: str) -> Any:
+            async with semaphore:
+                try:
+                    return await self.harvest_collection(collection_id, full=full)
+                except Exception as e:
+                    logger.error("Harvest of %s failed: %s", collection_id, e)
+                    return e
+
+        results = await asyncio.gather(*[harvest_one(collection_id) for collection_id in collection_ids])
+        return dict(zip(collection_ids, results))
+
+    async def _run(self, collection_ids: List[str], interval: float) -> None:
+        while True:
+            await self.harvest(collection_ids)
+            await asyncio.sleep(interval)
+
+    def start(self, collection_ids: Optional[List[str]] = None, interval: Optional[float] = None) -> None:
+        """
+        Harvest periodically in the background
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(
+                self._run(collection_ids or self.COLLECTIONS, interval or self.INTERVAL)
+            )
+
+    async def stop(self) -> None:
+        """
+        Stop the background harvest
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
\ No newline at end of file
@@ -0,0 +1,385 @@
+"""
+Streaming proxy of item files, forwarding HTTP Range requests
+"""
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+import httpx
+import orjson
+from ..utils.http_client import HttpClient
+from .disk_store import DiskStore, write_atomic
+
+logger = logging.getLogger(__name__)
+
+# Upstream response headers forwarded to the client
+FORWARDED_HEADERS = (
+    "content-type", "content-length", "content-range", "content-encoding", "accept-ranges", "etag", "last-modified"
+)
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d+)-(\d*)$")
+CONTENT_RANGE_PATTERN = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class StreamsExhaustedError(Exception):
+    """
+    Raised when the maximum number of proxied streams are already running
+    """
+
+
+def parse_range(header: Optional[str]) -> Optional[Tuple[int, Optional[int]]]:
+    """
+    Parse a Range header asking for a single range from an offset
+
+    Returns:
+        The first and last (None when open-ended) byte requested, or None for
+        no header, suffix ranges and multiple ranges
+    """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if match is None:
+        return None
+    start, end = int(match.group(1)), int(match.group(2)) if match.group(2) else None
+    if end is not None and end < start:
+        return None
+    return start, end
+
+
+@dataclass
+class FileInfo:
+    """
+    What is known of an upstream file whose blocks are cached
+    """
+    size: int
+    media_type: str
+    # Changes with the upstream validators, so blocks of an updated file are not mixed up
+    version: str
+    # ETag and Last-Modified headers of the file
+    headers: Dict[str, str]
+    stored_at: float
+
+
+class ProxiedStream:
+    """
+    A response being streamed from upstream or the block cache. Closing it
+    releases its stream slot and upstream connection; it is closed once its
+    body is exhausted, and may be closed again safely.
+    """
+
+    def __init__(self, proxy: "MediaProxy", status: int = 200, headers: Optional[Dict[str, str]] = None):
+        self.proxy = proxy
+        self.status = status
+        self.headers = headers or {}
+        self.body: Optional[AsyncIterator[bytes]] = None
+        self.upstream: Optional[httpx.Response] = None
+        self.closed = False
+
+    async def aclose(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.proxy.streams -= 1
+        if self.upstream is not None:
+            await self.upstream.aclose()
+
+
+class MediaProxy:
+    """
+    Streams item files from upstream through fixed-size chunks, so the memory
+    of a stream does not depend on the size of the file, and forwards Range
+    requests so players can seek. Each chunk is only read from upstream once
+    the client has taken the previous one, and upstream connections come from
+    the pooled HTTP client.
+
+    Optionally, files are cached on disk in aligned blocks of `block_size`
+    bytes: a block streamed through at least `cache_min_requests` times is
+    stored, and requests starting in a stored block are answered from disk,
+    continuing from upstream after the last consecutive stored block.
+    """
+    # Configuration, overridable through environment variables
+    CHUNK_SIZE = int(os.getenv("ARCHIVE_STREAM_CHUNK_SIZE", str(64 * 1024)))
+    MAX_STREAMS = int(os.getenv("ARCHIVE_STREAM_MAX", "64"))
+    # Directory of the block cache, disabled when empty
+    CACHE_PATH = os.getenv("ARCHIVE_STREAM_CACHE_PATH", "")
+    BLOCK_SIZE = int(os.getenv("ARCHIVE_STREAM_CACHE_BLOCK_SIZE", str(1024 * 1024)))
+    CACHE_MIN_REQUESTS = int(os.getenv("ARCHIVE_STREAM_CACHE_MIN_REQUESTS", "2"))
+    CACHE_MAX_BYTES = int(os.getenv("ARCHIVE_STREAM_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+    CACHE_TTL = float(os.getenv("ARCHIVE_STREAM_CACHE_TTL", "86400"))
+    # Number of blocks whose requests are counted
+    MAX_TRACKED_BLOCKS = 100000
+
+    def __init__(self,
+                 http_client: HttpClient,
+                 chunk_size: Optional[int] = None,
+                 max_streams: Optional[int] = None,
+                 cache_path: Optional[str] = None,
+                 block_size: Optional[int] = None,
+                 cache_min_requests: Optional[int] = None,
+                 cache_max_bytes: Optional[int] = None,
+                 cache_ttl: Optional[float] = None):
+        """
+        Args:
+            http_client: The pooled client the files are fetched with
+            chunk_size: Size in bytes of the chunks read from upstream
+            max_streams: Maximum number of streams running at once
+            cache_path: Directory of the block cache, disabled when empty
+            block_size: Size in bytes of the cached blocks
+            cache_min_requests: Times a block is streamed before it is cached
+            cache_max_bytes: Size of the cached blocks above which the least recently used are removed
+            cache_ttl: Seconds cached blocks are served before the file is checked upstream again
+        """
+        self.http_client = http_client
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.max_streams = max_streams or self.MAX_STREAMS
+        self.cache_path = cache_path if cache_path is not None else self.CACHE_PATH
+        self.block_size = block_size or self.BLOCK_SIZE
+        self.cache_min_requests = cache_min_requests or self.CACHE_MIN_REQUESTS
+        self.cache_ttl = cache_ttl if cache_ttl is not None else self.CACHE_TTL
+        cache_max_bytes = cache_max_bytes or self.CACHE_MAX_BYTES
+        self.blocks = DiskStore(os.path.join(self.cache_path, "blocks"), cache_max_bytes) if self.cache_path else None
+        self.streams = 0
+        self.rejected = 0
+        self.upstream_bytes = 0
+        self.cached_bytes = 0
+        self._block_requests: "OrderedDict[str, int]" = OrderedDict()
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.blake2b(url.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _info_path(self, url: str) -> str:
+        return os.path.join(self.cache_path, "files", self._key(url))
+
+    def _info(self, url: str) -> Optional[FileInfo]:
+        """
+        Get what is known of a cached file, or None when it is unknown or
+        older than the TTL
+        """
+        try:
+            with open(self._info_path(url), "rb") as file:
+                info = FileInfo(**orjson.loads(file.read()))
+        except (OSError, ValueError, TypeError):
+            return None
+        if time.time() - info.stored_at > self.cache_ttl:
+            return None
+        return info
+
+    def _record(self, url: str, response: httpx.Response) -> Optional[Tuple[FileInfo, int]]:
+        """
+        Record the size and validators of a file from an upstream response
+
+        Returns:
+            The file info and the offset the response body starts at, or None
+            when the response cannot be cached
+        """
+        if "content-encoding" in response.headers:
+            return None
+        if response.status_code == 206:
+            match = CONTENT_RANGE_PATTERN.match(response.headers.get("content-range", ""))
+            if match is None:
+                return None
+            start, size = int(match.group(1)), int(match.group(3))
+        elif response.headers.get("content-length", "").isdigit():
+            start, size = 0, int(response.headers["content-length"])
+        else:
+            return None
+        headers = {name: response.headers[name] for name in ("etag", "last-modified") if name in response.headers}
+        version = hashlib.blake2b(orjson.dumps([size, headers]), digest_size=4).hexdigest()
+        known = self._info(url)
+        if known is not None and known.version == version:
+            return known, start
+        info = FileInfo(size, response.headers.get("content-type", "application/octet-stream"), version, headers, time.time())
+        write_atomic(self._info_path(url), orjson.dumps(asdict(info)))
+        return info, start
+
+    def _block_name(self, url: str, info: FileInfo, index: int) -> str:
+        return f"{self._key(url)}-{info.version}-{index}"
+
+    def _wanted(self, name: str) -> bool:
+        """
+        Count a block being streamed and tell whether it should be cached
+        """
+        count = self._block_requests.get(name, 0) + 1
+        self._block_requests[name] = count
+        self._block_requests.move_to_end(name)
+        if len(self._block_requests) > self.MAX_TRACKED_BLOCKS:
+            self._block_requests.popitem(last=False)
+        return count >= self.cache_min_requests and not self.blocks.exists(name)
+
+    async def open(self, url: str, range_header: Optional[str] = None, if_range: Optional[str] = None) -> ProxiedStream:
+        """
+        Start streaming a file
+
+        Args:
+            url: The upstream URL of the file
+            range_header: The Range header of the client request
+            if_range: The If-Range header of the client request
+
+        Returns:
+            The stream, whose body must be consumed or closed
+
+        Raises:
+            StreamsExhaustedError: If the maximum number of streams are running
+            CircuitOpenError: If the upstream circuit is open
+            httpx.HTTPError: If the request fails
+        """
+        if self.streams >= self.max_streams:
+            self.rejected += 1
+            raise StreamsExhaustedError(f"{self.streams} streams are already running")
+        self.streams += 1
+        stream = ProxiedStream(self)
+        try:
+            requested = parse_range(range_header) if if_range is None else None
+            if self.blocks is None or requested is None or not self._open_cached(stream, url, *requested):
+                await self._open_upstream(stream, url, range_header, if_range)
+        except BaseException:
+            await stream.aclose()
+            raise
+        return stream
+
+    def _open_cached(self, stream: ProxiedStream, url: str, start: int, end: Optional[int]) -> bool:
+        """
+        Answer a range request from the block cache when its first block is stored
+
+        Returns:
+            Whether the stream is answered from the cache
+        """
+        info = self._info(url)
+        if info is None or start >= info.size:
+            return False
+        if not self.blocks.exists(self._block_name(url, info, start // self.block_size)):
+            return False
+        end = info.size - 1 if end is None else min(end, info.size - 1)
+        stream.status = 206
+        stream.headers = {
+            "content-type": info.media_type,
+            "content-length": str(end - start + 1),
+            "content-range": f"bytes {start}-{end}/{info.size}",
+            "accept-ranges": "bytes",
+            **info.headers
+        }
+        stream.body = self._cached_body(stream, url, info, start, end)
+        return True
+
+    async def _open_upstream(self,
+                             stream: ProxiedStream,
+                             url: str,
+                             range_header: Optional[str],
+                             if_range: Optional[str]) -> None:
+        """
+        Forward a request upstream, relaying the status and headers of its response
+        """
+        headers = {name: value for name, value in (("Range", range_header), ("If-Range", if_range)) if value}
+        response = await self.http_client.stream(url, headers or None)
+        stream.upstream = response
+        stream.status = response.status_code
+        stream.headers = {name: response.headers[name] for name in FORWARDED_HEADERS if name in response.headers}
+        recorded = None
+        if self.blocks is not None and response.status_code in (200, 206):
+            recorded = self._record(url, response)
+        stream.body = self._upstream_body(stream, url, response, recorded)
+
+    async def _upstream_body(self,
+                             stream: ProxiedStream,
+                             url: str,
+                             response: httpx.Response,
+                             recorded: Optional[Tuple[FileInfo, int]]) -> AsyncIterator[bytes]:
+        try:
+            if recorded is None:
+                async for chunk in response.aiter_raw(self.chunk_size):
+                    self.upstream_bytes += len(chunk)
+                    yield chunk
+            else:
+                async for chunk in self._relay(url, response, *recorded):
+                    yield chunk
+        finally:
+            await stream.aclose()
+
+    async def _cached_body(self, stream: ProxiedStream, url: str, info: FileInfo, start: int, end: int) -> AsyncIterator[bytes]:
+        """
+        Stream a range from the consecutive stored blocks it starts in, then
+        the rest of it from upstream
+        """
+        offset = start
+        try:
+            while offset <= end:
+                index = offset // self.block_size
+                name = self._block_name(url, info, index)
+                try:
+                    file = open(self.blocks.path_of(name), "rb")
+                except FileNotFoundError:
+                    break
+                with file:
+                    self.blocks.touch(name)
+                    file.seek(offset - index * self.block_size)
+                    block_end = min(end + 1, (index + 1) * self.block_size)
+                    while offset < block_end:
+                        chunk = await asyncio.to_thread(file.read, min(self.chunk_size, block_end - offset))
+                        if not chunk:
+                            break
+                        offset += len(chunk)
+                        self.cached_bytes += len(chunk)
+                        yield chunk
+                if offset < block_end:
+                    # Truncated block, the client sees a short response and retries
+                    logger.warning("Cached block %s is truncated", name)
+                    return
+
+            if offset <= end:
+                response = await self.http_client.stream(url, {"Range": f"bytes={offset}-{end}"})
+                stream.upstream = response
+                if response.status_code != 206:
+                    # The file changed upstream since its blocks were cached
+                    logger.warning("Upstream answered %d for the rest of %s, ending the stream", response.status_code, url)
+                    return
+                async for chunk in self._relay(url, response, info, offset):
+                    yield chunk
+        finally:
+            await stream.aclose()
+
+    async def _relay(self, url: str, response: httpx.Response, info: FileInfo, offset: int) -> AsyncIterator[bytes]:
+        """
+        Relay an upstream body starting at `offset`, storing the whole blocks
+        it covers that are wanted in the cache
+        """
+        index = offset // self.block_size
+        name = self._block_name(url, info, index)
+        # Only a block streamed from its start can be stored
+        buffer = bytearray() if offset % self.block_size == 0 and self._wanted(name) else None
+        async for chunk in response.aiter_raw(self.chunk_size):
+            self.upstream_bytes += len(chunk)
+            yield chunk
+            while chunk:
+                block_end = min((index + 1) * self.block_size, info.size)
+                taken = chunk[:block_end - offset]
+                chunk = chunk[len(taken):]
+                offset += len(taken)
+                if buffer is not None:
+                    buffer += taken
+                if offset < block_end:
+                    break
+                if buffer is not None:
+                    await asyncio.to_thread(self.blocks.write, name, bytes(buffer))
+                index += 1
+                name = self._block_name(url, info, index)
+                buffer = bytearray() if offset < info.size and self._wanted(name) else None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the stream counters and the size of the block cache
+        """
+        return {
+            "streams": self.streams,
+            "max_streams": self.max_streams,
+            "rejected": self.rejected,
+            "upstream_bytes": self.upstream_bytes,
+            "cached_bytes": self.cached_bytes,
+            "cache": {
+                "bytes": self.blocks.total_bytes,
+                "evicted": self.blocks.evicted
+            } if self.blocks is not None else {"enabled": False}
+        }
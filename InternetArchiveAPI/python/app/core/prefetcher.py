@@ -0,0 +1,197 @@
+"""
+Speculative prefetching of the next page of paginated searches
+"""
+import os
+import time
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+from ..utils.rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PaginationSession:
+    """
+    The progress of clients paging through the results of one query
+    """
+    # Last page requested
+    page: int
+    # Page fetched ahead and not requested yet
+    prefetched: Optional[int] = None
+
+
+class PagePrefetcher:
+    """
+    Tracks pagination sessions, keyed by the query without its page (the same
+    filters, rows and sort), and tells when the next page is worth fetching
+    ahead: when a session starts on page 1 or continues in order.
+
+    Prefetches are bounded by a budget of upstream requests per second and
+    a number running at once. Each prefetch is settled as a hit when its page
+    is requested next, or as a miss when the session moves to another page or
+    is forgotten. When the hit rate of the last `window` settled prefetches
+    falls below `min_hit_rate`, prefetching pauses for a backoff period that
+    doubles on every consecutive low window, up to `max_backoff`.
+    """
+    # Configuration, overridable through environment variables
+    ENABLED = os.getenv("ARCHIVE_PREFETCH_ENABLED", "false").lower() in ("1", "true", "yes")
+    # Prefetches allowed per second on average, bursting up to one second worth
+    BUDGET = float(os.getenv("ARCHIVE_PREFETCH_BUDGET", "2"))
+    CONCURRENCY = int(os.getenv("ARCHIVE_PREFETCH_CONCURRENCY", "4"))
+    MIN_HIT_RATE = float(os.getenv("ARCHIVE_PREFETCH_MIN_HIT_RATE", "0.3"))
+    # Number of settled prefetches the hit rate is computed over
+    WINDOW = int(os.getenv("ARCHIVE_PREFETCH_WINDOW", "50"))
+    BACKOFF = float(os.getenv("ARCHIVE_PREFETCH_BACKOFF", "60"))
+    MAX_BACKOFF = float(os.getenv("ARCHIVE_PREFETCH_MAX_BACKOFF", "900"))
+    # Number of sessions tracked, the least recently used are forgotten
+    MAX_SESSIONS = 10000
+
+    def __init__(self,
+                 budget: Optional[float] = None,
+                 concurrency: Optional[int] = None,
+                 min_hit_rate: Optional[float] = None,
+                 window: Optional[int] = None,
+                 backoff: Optional[float] = None,
+                 max_backoff: Optional[float] = None):
+        """
+        Args:
+            budget: Prefetches allowed per second on average
+            concurrency: Maximum number of prefetches running at once
+            min_hit_rate: Hit rate below which prefetching backs off
+            window: Number of settled prefetches the hit rate is computed over
+            backoff: Seconds prefetching pauses after a first low hit rate
+            max_backoff: Longest pause in seconds
+        """
+        self.budget = budget if budget is not None else self.BUDGET
+        self.concurrency = concurrency if concurrency is not None else self.CONCURRENCY
+        self.min_hit_rate = min_hit_rate if min_hit_rate is not None else self.MIN_HIT_RATE
+        self.window = window if window is not None else self.WINDOW
+        self.backoff = backoff if backoff is not None else self.BACKOFF
+        self.max_backoff = max_backoff if max_backoff is not None else self.MAX_BACKOFF
+        self.bucket = TokenBucket(self.budget)
+        self.prefetched = 0
+        self.hits = 0
+        self.misses = 0
+        self.failed = 0
+        self.skipped = 0
+        self.backoffs = 0
+        self.in_flight = 0
+        self._sessions: "OrderedDict[str, PaginationSession]" = OrderedDict()
+        self._outcomes: "deque[bool]" = deque(maxlen=max(1, self.window))
+        self._backoff = self.backoff
+        self._paused_until = 0.0
+
+    def _settle(self, hit: bool) -> None:
+        """
+        Record whether a prefetched page was requested, backing off when the
+        recent hit rate is too low
+        """
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self._outcomes.append(hit)
+        if len(self._outcomes) < self._outcomes.maxlen:
+            return
+        if self.hit_rate() < self.min_hit_rate:
+            self.backoffs += 1
+            self._paused_until = time.monotonic() + self._backoff
+            logger.info("Prefetch hit rate %.2f below %.2f, pausing for %.0fs", self.hit_rate(), self.min_hit_rate, self._backoff)
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+            self._outcomes.clear()
+        else:
+            self._backoff = self.backoff
+
+    def hit_rate(self) -> Optional[float]:
+        """
+        Get the share of the recently settled prefetches that were requested,
+        or None before any was settled
+        """
+        if not self._outcomes:
+            return None
+        return sum(self._outcomes) / len(self._outcomes)
+
+    def paused(self) -> bool:
+        """
+        Check whether prefetching is backing off after a low hit rate
+        """
+        return time.monotonic() < self._paused_until
+
+    def observe(self, session: str, page: int, wanted: bool = True) -> bool:
+        """
+        Record a request for a page and decide whether to prefetch the next one
+
+        Args:
+            session: The query without its page
+            page: The page requested
+            wanted: False when there is no next page or it is already cached
+
+        Returns:
+            Whether the next page should be prefetched, in which case the
+            caller runs `prefetch` for it
+        """
+        state = self._sessions.get(session)
+        if state is None:
+            state = self._sessions[session] = PaginationSession(page=0)
+            if len(self._sessions) > self.MAX_SESSIONS:
+                _, forgotten = self._sessions.popitem(last=False)
+                if forgotten.prefetched is not None:
+                    self._settle(False)
+        else:
+            self._sessions.move_to_end(session)
+        if state.prefetched is not None:
+            self._settle(state.prefetched == page)
+            state.prefetched = None
+        in_order = page == state.page + 1
+        state.page = page
+
+        if not in_order or not wanted or self.paused():
+            return False
+        if self.in_flight >= self.concurrency or not self.bucket.try_acquire():
+            self.skipped += 1
+            return False
+        state.prefetched = page + 1
+        return True
+
+    async def prefetch(self, session: str, page: int, fetch: Callable[[], Awaitable[Any]]) -> None:
+        """
+        Fetch a page ahead, storing it in the cache
+
+        Args:
+            session: The query without its page
+            page: The page fetched
+            fetch: Coroutine function fetching the page through the cache
+        """
+        self.in_flight += 1
+        try:
+            await fetch()
+            self.prefetched += 1
+        except Exception:
+            self.failed += 1
+            logger.debug("Prefetch of page %d failed for %s", page, session, exc_info=True)
+            # A failed prefetch is neither a hit nor a miss
+            state = self._sessions.get(session)
+            if state is not None and state.prefetched == page:
+                state.prefetched = None
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the prefetch counters and the backoff state
+        """
+        return {
+            "sessions": len(self._sessions),
+            "prefetched": self.prefetched,
+            "hits": self.hits,
+            "misses": self.misses,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "in_flight": self.in_flight,
+            "hit_rate": self.hit_rate(),
+            "backoffs": self.backoffs,
+            "paused_for": max(0.0, self._paused_until - time.monotonic())
+        }
@@ -0,0 +1,156 @@
+"""
+Background refresh of the most requested upstream queries
+"""
+import os
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class HotQueryTracker:
+    """
+    Counts how often each normalized upstream query is requested and keeps
+    what is needed to replay it. Counts are halved periodically so the
+    ranking follows recent traffic.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self.counts: Counter = Counter()
+        self.queries: Dict[str, Tuple[str, str, Optional[Dict[str, Any]]]] = {}
+
+    def record(self, key: str, endpoint: str, url: str, params: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Record a request for a query
+        """
+        self.counts[key] += 1
+        self.queries[key] = (endpoint, url, params)
+        if len(self.counts) > self.max_keys:
+            self.decay()
+
+    def top(self, n: int) -> List[Tuple[str, str, str, Optional[Dict[str, Any]]]]:
+        """
+        Get the `n` most requested queries as (key, endpoint, url, params) tuples
+        """
+        return [(key, *self.queries[key]) for key, _ in self.counts.most_common(n)]
+
+    def decay(self) -> None:
+        """
+        Halve every count and forget queries that drop to zero
+        """
+        for key in list(self.counts):
+            self.counts[key] //= 2
+            if not self.counts[key]:
+                del self.counts[key]
+                del self.queries[key]
+
+
+class CacheRefresher:
+    """
+    Periodically refreshes the top-N most requested queries of an
+    ArchiveService before their cache entries expire
+    """
+    # Configuration, overridable through environment variables
+    ENABLED = os.getenv("ARCHIVE_REFRESH_ENABLED", "false").lower() in ("1", "true", "yes")
+    TOP_N = int(os.getenv("ARCHIVE_REFRESH_TOP_N", "50"))
+    INTERVAL = float(os.getenv("ARCHIVE_REFRESH_INTERVAL", "30"))
+    CONCURRENCY = int(os.getenv("ARCHIVE_REFRESH_CONCURRENCY", "4"))
+    REFRESH_AHEAD = float(os.getenv("ARCHIVE_REFRESH_AHEAD", "60"))
+
+    def __init__(self,
+                 service,
+                 top_n: Optional[int] = None,
+                 interval: Optional[float] = None,
+                 concurrency: Optional[int] = None,
+                 refresh_ahead: Optional[float] = None):
+        """
+        Args:
+            service: The ArchiveService whose cache is refreshed
+            top_n: Number of most requested queries considered on each run
+            interval: Seconds between runs
+            concurrency: Maximum number of refreshes running at once
+            refresh_ahead: Refresh entries expiring within this many seconds
+        """
+        self.service = service
+        self.top_n = top_n or self.TOP_N
+        self.interval = interval or self.INTERVAL
+        self.concurrency = concurrency or self.CONCURRENCY
+        self.refresh_ahead = refresh_ahead if refresh_ahead is not None else self.REFRESH_AHEAD
+        self.refreshed = 0
+        self.failed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> int:
+        """
+        Refresh the hot queries that are about to expire
+
+        Returns:
+            The number of queries refreshed
+        """
+        cache = self.service.cache
+        if cache is None:
+            return 0
+
+        candidates = []
+        for key, endpoint, url, params in self.service.hot_queries.top(self.top_n):
+            remaining = cache.expires_in(key)
+            if remaining is None or remaining <= self.refresh_ahead:
+                candidates.append((key, endpoint, url, params))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh(key: str, endpoint: str, url: str, params: Optional[Dict[str, Any]]) -> bool:
+            async with semaphore:
+                try:
+                    await self.service.refresh(endpoint, key, url, params)
+                    return True
+                except Exception:
+                    logger.warning("Background refresh failed for %s", key, exc_info=True)
+                    return False
+
+        results = await asyncio.gather(*[refresh(*candidate) for candidate in candidates])
+        refreshed = sum(results)
+        self.refreshed += refreshed
+        self.failed += len(results) - refreshed
+        self.service.hot_queries.decay()
+        return refreshed
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Cache refresher run failed")
+
+    def start(self) -> None:
+        """
+        Start refreshing in the background
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background refresh loop
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the refresher counters
+        """
+        return {
+            "running": self._task is not None,
+            "refreshed": self.refreshed,
+            "failed": self.failed
+        }
\ No newline at end of file
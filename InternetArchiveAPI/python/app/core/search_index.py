@@ -0,0 +1,338 @@
+"""
+Local full-text search index over harvested Internet Archive metadata
+"""
+import os
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class SearchIndex:
+    """
+    SQLite FTS5 index of harvested items and the collections they belong to.
+
+    Queries are only answered for collections that have been harvested; any
+    other query is reported as a miss so the caller can fall back to upstream.
+    """
+    # Path of the index database, the index is disabled when empty
+    PATH = os.getenv("ARCHIVE_INDEX_PATH", "")
+
+    # Upstream sort fields supported locally, mapped to their SQL ordering
+    SORTS = {
+        "stars": "i.stars",
+        "avg_rating": "i.stars",
+        "downloads": "i.downloads",
+        "date": "i.date",
+        "publicdate": "i.publicdate",
+        "addeddate": "i.addeddate",
+        "title": "i.title COLLATE NOCASE",
+        "titleSorter": "i.title COLLATE NOCASE",
+        "identifier": "i.identifier",
+    }
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            identifier TEXT PRIMARY KEY,
+            title TEXT,
+            description TEXT,
+            subject TEXT,
+            mediatype TEXT,
+            date TEXT,
+            publicdate TEXT,
+            addeddate TEXT,
+            stars REAL,
+            downloads INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS item_collections (
+            collection TEXT NOT NULL,
+            identifier TEXT NOT NULL,
+            PRIMARY KEY (collection, identifier)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS collections (
+            identifier TEXT PRIMARY KEY,
+            harvested_at REAL NOT NULL,
+            item_count INTEGER NOT NULL,
+            mediatype TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS harvest_checkpoints (
+            collection TEXT PRIMARY KEY,
+            since TEXT,
+            cursor TEXT,
+            run_started_at TEXT,
+            items INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+            identifier, title, description, subject, content='items', content_rowid='rowid'
+        );
+        CREATE TRIGGER IF NOT EXISTS items_ai AFTER INSERT ON items BEGIN
+            INSERT INTO items_fts (rowid, identifier, title, description, subject)
+            VALUES (new.rowid, new.identifier, new.title, new.description, new.subject);
+        END;
+        CREATE TRIGGER IF NOT EXISTS items_ad AFTER DELETE ON items BEGIN
+            INSERT INTO items_fts (items_fts, rowid, identifier, title, description, subject)
+            VALUES ('delete', old.rowid, old.identifier, old.title, old.description, old.subject);
+        END;
+        CREATE TRIGGER IF NOT EXISTS items_au AFTER UPDATE ON items BEGIN
+            INSERT INTO items_fts (items_fts, rowid, identifier, title, description, subject)
+            VALUES ('delete', old.rowid, old.identifier, old.title, old.description, old.subject);
+            INSERT INTO items_fts (rowid, identifier, title, description, subject)
+            VALUES (new.rowid, new.identifier, new.title, new.description, new.subject);
+        END;
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: Path of the SQLite database, ":memory:" for a transient index
+        """
+        self.path = path or self.PATH
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+        # Indexes created before the harvested media type was stored only hold movies
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(collections)")}
+        if "mediatype" not in columns:
+            self._conn.execute("ALTER TABLE collections ADD COLUMN mediatype TEXT NOT NULL DEFAULT 'movies'")
+        self._conn.commit()
+
+    @staticmethod
+    def _text(value: Any) -> Optional[str]:
+        """
+        Flatten a single or multi-valued upstream field to text
+        """
+        if value is None:
+            return None
+        if isinstance(value, list):
+            return "; ".join(str(item) for item in value)
+        return str(value)
+
+    @staticmethod
+    def _number(value: Any) -> Optional[float]:
+        """
+        Convert an upstream numeric field, which may be a string, to a number
+        """
+        try:
+            return float(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    def add_documents(self, docs: Iterable[Dict[str, Any]], collection_id: Optional[str] = None) -> int:
+        """
+        Insert or update advancedsearch/scrape documents
+
+        Args:
+            docs: The upstream documents
+            collection_id: A collection the documents belong to, in addition to
+                the ones listed in their own `collection` field
+
+        Returns:
+            The number of documents written
+        """
+        items = []
+        memberships = []
+        for doc in docs:
+            identifier = doc.get("identifier")
+            if not identifier:
+                continue
+            items.append((
+                identifier,
+                self._text(doc.get("title")),
+                self._text(doc.get("description")),
+                self._text(doc.get("subject")),
+                self._text(doc.get("mediatype")),
+                self._text(doc.get("date")),
+                self._text(doc.get("publicdate")),
+                self._text(doc.get("addeddate")),
+                self._number(doc.get("avg_rating", doc.get("stars"))),
+                self._number(doc.get("downloads"))
+            ))
+            collections = doc.get("collection") or []
+            if isinstance(collections, str):
+                collections = [collections]
+            if collection_id:
+                collections = [*collections, collection_id]
+            memberships.extend((collection, identifier) for collection in set(collections))
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO items (identifier, title, description, subject, mediatype, date, publicdate, addeddate, stars, downloads) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(identifier) DO UPDATE SET title = excluded.title, description = excluded.description, "
+                "subject = excluded.subject, mediatype = COALESCE(excluded.mediatype, items.mediatype), "
+                "date = COALESCE(excluded.date, items.date), publicdate = COALESCE(excluded.publicdate, items.publicdate), "
+                "addeddate = COALESCE(excluded.addeddate, items.addeddate), stars = COALESCE(excluded.stars, items.stars), "
+                "downloads = COALESCE(excluded.downloads, items.downloads)",
+                items
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO item_collections (collection, identifier) VALUES (?, ?)", memberships
+            )
+            self._conn.commit()
+        return len(items)
+
+    def mark_harvested(self, collection_id: str, mediatype: str, harvested_at: Optional[float] = None) -> None:
+        """
+        Record that the items of a media type in a collection are fully
+        indexed and can be answered locally
+        """
+        with self._lock:
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM item_collections WHERE collection = ?", (collection_id,)
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO collections (identifier, harvested_at, item_count, mediatype) VALUES (?, ?, ?, ?)",
+                (collection_id, harvested_at if harvested_at is not None else time.time(), count, mediatype)
+            )
+            self._conn.commit()
+
+    def is_harvested(self, collection_id: str, mediatype: Optional[str] = None) -> bool:
+        """
+        Check whether a collection can be answered locally, for a media type
+        when given. Only the media type harvested can be, "*" included, as
+        the items of other media types are not all indexed.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mediatype FROM collections WHERE identifier = ?", (collection_id,)
+            ).fetchone()
+        return row is not None and (mediatype is None or row[0] == mediatype)
+
+    def get_checkpoint(self, collection_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the harvest checkpoint of a collection
+
+        Returns:
+            A dictionary with `since` (lower date bound of the next incremental
+            run), `cursor` and `run_started_at` (set while a run is in progress)
+            and `items`, or None if the collection was never harvested
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT since, cursor, run_started_at, items FROM harvest_checkpoints WHERE collection = ?",
+                (collection_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"since": row[0], "cursor": row[1], "run_started_at": row[2], "items": row[3]}
+
+    def save_checkpoint(self,
+                        collection_id: str,
+                        since: Optional[str],
+                        cursor: Optional[str],
+                        run_started_at: Optional[str],
+                        items: int) -> None:
+        """
+        Store the harvest checkpoint of a collection
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO harvest_checkpoints (collection, since, cursor, run_started_at, items, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (collection_id, since, cursor, run_started_at, items, time.time())
+            )
+            self._conn.commit()
+
+    def _order_by(self, sort: str) -> Optional[str]:
+        """
+        Translate an upstream sort such as "stars desc" to SQL, None if unsupported
+        """
+        parts = sort.replace("+", " ").split()
+        if not parts or parts[0] not in self.SORTS or len(parts) > 2:
+            return None
+        direction = parts[1].lower() if len(parts) == 2 else "asc"
+        if direction not in ("asc", "desc"):
+            return None
+        return f"{self.SORTS[parts[0]]} {direction.upper()}, i.identifier ASC"
+
+    @staticmethod
+    def _match_expression(text: str) -> str:
+        """
+        Build an FTS5 expression matching every word of a free-text query
+        """
+        return " ".join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+
+    def search(self,
+               collection: str,
+               mediatype: str = "*",
+               page: int = 1,
+               rows: int = 10,
+               sort: str = "stars desc",
+               text: Optional[str] = None) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+        """
+        Search the items of a harvested collection
+
+        Args:
+            collection: The identifier of the collection
+            mediatype: The media type to filter by, "*" for any, which is only
+                answered locally when every media type was harvested
+            page: The page number to fetch
+            rows: The number of rows to fetch per page
+            sort: The upstream sorting criteria
+            text: Optional free-text query matched against identifier, title, description and subject
+
+        Returns:
+            The total number of matches and the documents of the page, or None
+            if the query cannot be answered locally, such as when the media
+            type is not the one harvested
+        """
+        order_by = self._order_by(sort)
+        if order_by is None or not self.is_harvested(collection, mediatype):
+            self.misses += 1
+            return None
+
+        conditions = ["c.collection = ?"]
+        args: List[Any] = [collection]
+        if mediatype != "*":
+            conditions.append("i.mediatype = ?")
+            args.append(mediatype)
+        if text and text.strip():
+            conditions.append("i.rowid IN (SELECT rowid FROM items_fts WHERE items_fts MATCH ?)")
+            args.append(self._match_expression(text))
+        where = " AND ".join(conditions)
+
+        with self._lock:
+            num_found = self._conn.execute(
+                f"SELECT COUNT(*) FROM items i JOIN item_collections c ON c.identifier = i.identifier WHERE {where}",
+                args
+            ).fetchone()[0]
+            rows_found = self._conn.execute(
+                f"SELECT i.identifier, i.title, i.description FROM items i "
+                f"JOIN item_collections c ON c.identifier = i.identifier WHERE {where} "
+                f"ORDER BY {order_by} LIMIT ? OFFSET ?",
+                [*args, rows, (page - 1) * rows]
+            ).fetchall()
+
+        self.hits += 1
+        docs = []
+        for identifier, title, description in rows_found:
+            doc = {"identifier": identifier, "title": title}
+            if description is not None:
+                doc["description"] = description
+            docs.append(doc)
+        return num_found, docs
+
+    def close(self) -> None:
+        """
+        Close the database connection
+        """
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the index counters
+        """
+        with self._lock:
+            items = self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+            collections = self._conn.execute("SELECT COUNT(*) FROM collections").fetchone()[0]
+        return {
+            "items": items,
+            "collections": collections,
+            "hits": self.hits,
+            "misses": self.misses
+        }
\ No newline at end of file
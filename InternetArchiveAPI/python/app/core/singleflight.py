@@ -0,0 +1,62 @@
+"""
+Request coalescing for identical in-flight upstream queries
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls sharing the same key.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still running wait for the same result instead of starting their own.
+    Exceptions are propagated to every waiter. A cancelled waiter does not
+    cancel the shared work for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, "asyncio.Future[Any]"] = {}
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `func` once for all concurrent callers using the same key
+
+        Args:
+            key: The deduplication key
+            func: Coroutine function performing the work
+
+        Returns:
+            The shared result of `func`
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(func())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(call)
+
+    def _forget(self, key: str, call: "asyncio.Future[Any]") -> None:
+        """
+        Drop a finished call so the next caller starts fresh work
+        """
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every waiter was cancelled
+        if not call.cancelled():
+            call.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the coalescing counters
+        """
+        return {
+            "in_flight": len(self._calls),
+            "coalesced": self.coalesced
+        }
\ No newline at end of file
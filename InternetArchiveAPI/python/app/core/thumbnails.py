@@ -0,0 +1,219 @@
+"""
+Content-addressed disk store of item thumbnails and their resized variants
+"""
+import io
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from .disk_store import DiskStore, write_atomic
+from .singleflight import SingleFlight
+
+try:
+    from PIL import Image
+except ImportError:  # Optional dependency
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Variant formats: Pillow format name and media type
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+
+@dataclass
+class Thumbnail:
+    """
+    A stored image ready to be served
+    """
+    path: str
+    media_type: str
+    # Strong ETag derived from the content hash of the image
+    etag: str
+
+
+class ThumbnailStore:
+    """
+    Disk store of thumbnails fetched from upstream.
+
+    Each image is stored once under the hash of its content, and its variants
+    are named after that hash, their width bucket and format, so identical
+    images fetched from several sources share their files. A reference file
+    per source maps it to the hash of its content until it is fetched again
+    after `ttl`. Requested widths are rounded up to the nearest bucket so a
+    few variants serve every gallery layout.
+
+    Variants are only made when Pillow is installed; without it the original
+    image is served whatever the requested width and format. The least
+    recently served files are removed once the store exceeds `max_bytes`.
+    """
+    # Directory of the store, thumbnails are not proxied when empty
+    PATH = os.getenv("ARCHIVE_THUMBNAIL_PATH", "")
+    WIDTHS = tuple(sorted(int(width) for width in os.getenv("ARCHIVE_THUMBNAIL_WIDTHS", "160,320,640").split(",") if width.strip()))
+    QUALITY = int(os.getenv("ARCHIVE_THUMBNAIL_QUALITY", "80"))
+    TTL = float(os.getenv("ARCHIVE_THUMBNAIL_TTL", "604800"))
+    MAX_BYTES = int(os.getenv("ARCHIVE_THUMBNAIL_MAX_BYTES", str(1024 * 1024 * 1024)))
+    # Largest upstream image accepted
+    MAX_SOURCE_BYTES = 10 * 1024 * 1024
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 widths: Optional[Tuple[int, ...]] = None,
+                 quality: Optional[int] = None,
+                 ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        """
+        Args:
+            path: Directory of the store
+            widths: Width buckets of the resized variants
+            quality: Encoding quality of the variants, from 1 to 100
+            ttl: Seconds before the image of a source is fetched again
+            max_bytes: Size of the stored files above which the least recently served are removed
+        """
+        self.path = path or self.PATH
+        self.widths = tuple(sorted(widths)) if widths else self.WIDTHS
+        self.quality = quality or self.QUALITY
+        self.ttl = ttl if ttl is not None else self.TTL
+        self.max_bytes = max_bytes or self.MAX_BYTES
+        self.objects = DiskStore(os.path.join(self.path, "objects"), self.max_bytes)
+        self.single_flight = SingleFlight()
+        self.hits = 0
+        self.fetched = 0
+        self.stale = 0
+        self.variants = 0
+        os.makedirs(os.path.join(self.path, "refs"), exist_ok=True)
+
+    def _ref_path(self, source: str) -> str:
+        digest = hashlib.blake2b(source.encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.path, "refs", digest)
+
+    def _read_ref(self, source: str) -> Optional[Tuple[str, str, float]]:
+        """
+        Get the content hash, media type and fetch time of a source, or None
+        if it was never fetched or its image has been evicted
+        """
+        ref_path = self._ref_path(source)
+        try:
+            with open(ref_path, "r", encoding="utf-8") as file:
+                digest, media_type = file.read().split("\n", 1)
+            fetched_at = os.stat(ref_path).st_mtime
+        except (OSError, ValueError):
+            return None
+        if not self.objects.exists(digest):
+            return None
+        return digest, media_type, fetched_at
+
+    async def _original(self, source: str, fetch: Callable[[], Awaitable[Tuple[bytes, str]]]) -> Tuple[str, str]:
+        """
+        Get the content hash and media type of the image of a source,
+        fetching it when it is not stored or is older than the TTL. A stored
+        image is still served when fetching it again fails.
+        """
+        ref = self._read_ref(source)
+        if ref is not None and time.time() - ref[2] < self.ttl:
+            self.hits += 1
+            return ref[0], ref[1]
+
+        async def load() -> Tuple[str, str]:
+            data, media_type = await fetch()
+            media_type = media_type.split(";", 1)[0].strip().lower()
+            if not media_type.startswith("image/"):
+                raise ValueError(f"{source} is not an image ({media_type})")
+            if len(data) > self.MAX_SOURCE_BYTES:
+                raise ValueError(f"{source} is larger than {self.MAX_SOURCE_BYTES} bytes")
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            # The first write and evictions walk the whole store
+            await asyncio.to_thread(self.objects.write, digest, data)
+            await asyncio.to_thread(write_atomic, self._ref_path(source), f"{digest}\n{media_type}".encode("utf-8"))
+            self.fetched += 1
+            return digest, media_type
+
+        try:
+            return await self.single_flight.do(source, load)
+        except Exception as e:
+            if ref is None or isinstance(e, ValueError):
+                raise
+            logger.warning("Serving a stale thumbnail for %s: %s", source, e)
+            self.stale += 1
+            return ref[0], ref[1]
+
+    def bucket(self, width: Optional[int]) -> Optional[int]:
+        """
+        Round a requested width up to the nearest bucket, the largest one
+        for wider requests, or None to keep the original size
+        """
+        if width is None or not self.widths:
+            return None
+        return next((bucket for bucket in self.widths if bucket >= width), self.widths[-1])
+
+    def _resize(self, source_path: str, width: Optional[int], format: str) -> bytes:
+        """
+        Encode an image in a format, scaled down to a width when it is wider
+        """
+        with Image.open(source_path) as image:
+            if image.mode not in ("RGB", "RGBA") or (format == "jpeg" and image.mode == "RGBA"):
+                image = image.convert("RGBA" if format == "webp" and "A" in image.getbands() else "RGB")
+            if width is not None and image.width > width:
+                image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, FORMATS[format][0], quality=self.quality)
+            return output.getvalue()
+
+    async def get(self,
+                  source: str,
+                  fetch: Callable[[], Awaitable[Tuple[bytes, str]]],
+                  width: Optional[int] = None,
+                  format: Optional[str] = None) -> Thumbnail:
+        """
+        Get an image, resized and re-encoded as requested
+
+        Args:
+            source: The upstream URL of the image
+            fetch: Coroutine function fetching the image and its media type
+            width: Optional width the image is displayed at
+            format: Optional format of the variant, "webp" or "jpeg"
+
+        Returns:
+            The stored image or variant
+
+        Raises:
+            ValueError: If upstream does not answer with an image
+            httpx.HTTPError: If the image cannot be fetched
+        """
+        digest, media_type = await self._original(source, fetch)
+        bucket = self.bucket(width)
+        if Image is None or (bucket is None and format not in FORMATS):
+            self.objects.touch(digest)
+            return Thumbnail(self.objects.path_of(digest), media_type, f'"{digest}"')
+
+        format = format if format in FORMATS else "jpeg"
+        name = f"{digest}-{bucket or 0}.{format}"
+        if not self.objects.exists(name):
+            async def make() -> None:
+                data = await asyncio.to_thread(self._resize, self.objects.path_of(digest), bucket, format)
+                await asyncio.to_thread(self.objects.write, name, data)
+                self.variants += 1
+
+            await self.single_flight.do(name, make)
+        else:
+            self.objects.touch(name)
+        return Thumbnail(self.objects.path_of(name), FORMATS[format][1], f'"{name}"')
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the store counters
+        """
+        return {
+            "resizing": Image is not None,
+            "hits": self.hits,
+            "fetched": self.fetched,
+            "stale": self.stale,
+            "variants": self.variants,
+            "evicted": self.objects.evicted,
+            "bytes": self.objects.total_bytes
+        }
@@ -1,16 +1,78 @@
 """
 Main FastAPI application
 """
+import os
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .api.router import router as api_router
+from fastapi.responses import PlainTextResponse
+from .api.router import router as api_router, archive_service, refresher
+from .api.instrumentation import InstrumentationMiddleware, update_service_metrics
+from .api.caching import HttpCachingMiddleware
+from .api.compression import CompressionMiddleware
+from .api.admission import AdmissionController, AdmissionMiddleware
+from .utils.metrics import registry
+from .core.harvester import Harvester
+
+# Level of the application logs, e.g. DEBUG to log every upstream query
+LOG_LEVEL = os.getenv("ARCHIVE_LOG_LEVEL", "WARNING").upper()
+
+
+def configure_logging() -> None:
+    """
+    Send the application logs at LOG_LEVEL and above to stderr as key=value lines
+    """
+    logger = logging.getLogger("app")
+    logger.setLevel(LOG_LEVEL)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("time=%(asctime)s level=%(levelname)s logger=%(name)s msg=%(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+
+
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Keep the pooled upstream session open for the lifetime of the application,
+    optionally refresh hot queries and harvest collections in the background
+    """
+    if refresher is not None:
+        refresher.start()
+    harvester = None
+    if Harvester.COLLECTIONS and archive_service.search_index is not None:
+        harvester = Harvester(archive_service, archive_service.search_index)
+        harvester.start()
+    yield
+    if harvester is not None:
+        await harvester.stop()
+    if refresher is not None:
+        await refresher.stop()
+    await archive_service.aclose()
+
 
 app = FastAPI(
     title="Internet Archive Feature Films API",
     description="API facade for accessing Internet Archive Video Content",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
+# Innermost, so requests answered from the ETags are not queued and shed
+# requests still carry the CORS headers and are recorded in the metrics
+if AdmissionController.ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
+# ETags and Cache-Control, inside CORS so 304 responses carry the CORS headers
+app.add_middleware(HttpCachingMiddleware)
+
+# Outside the ETags, so compressed bodies are cached per ETag
+app.add_middleware(CompressionMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -18,8 +80,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing"],
 )
 
+# Outermost, so the recorded latency covers the whole request
+app.add_middleware(InstrumentationMiddleware)
+
 # Include API router
 app.include_router(api_router)
 
@@ -39,6 +105,18 @@ async def root():
             "explore": "/api/v1/explore",
             "collection_details": "/api/v1/collections/{collection_id}",
             "collection_items": "/api/v1/collections/{collection_id}/items",
-            "video_details": "/api/v1/videos/{video_id}"
-        }
-    } 
\ No newline at end of file
+            "collection_items_stream": "/api/v1/collections/{collection_id}/items:stream",
+            "video_details": "/api/v1/videos/{video_id}",
+            "video_details_batch": "/api/v1/videos:batch"
+        },
+        "metrics_url": "/metrics"
+    }
+
+
+@app.get("/metrics", tags=["root"], response_class=PlainTextResponse)
+async def metrics():
+    """
+    Metrics of the API, its upstream requests and its cache in the Prometheus text format
+    """
+    update_service_metrics(archive_service)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8") 
\ No newline at end of file
@@ -0,0 +1,8 @@
+"""
+Shared options for the data models
+"""
+import sys
+
+# Slotted dataclasses drop the per-instance __dict__, which makes the models
+# noticeably smaller. They are only available from Python 3.10.
+DATACLASS_OPTIONS = {"slots": True} if sys.version_info >= (3, 10) else {}
\ No newline at end of file
@@ -3,10 +3,11 @@ Collection model representing an Internet Archive film collection
 """
 from dataclasses import dataclass, field
 from typing import List, Optional
+from .base import DATACLASS_OPTIONS
 from .film import Film
 
 
-@dataclass
+@dataclass(**DATACLASS_OPTIONS)
 class Collection:
     """
     Represents a collection of films from the Internet Archive
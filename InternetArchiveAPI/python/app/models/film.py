@@ -3,9 +3,10 @@ Film model representing an Internet Archive film item
 """
 from dataclasses import dataclass
 from typing import Optional
+from .base import DATACLASS_OPTIONS
 
 
-@dataclass
+@dataclass(**DATACLASS_OPTIONS)
 class Film:
     """
     Represents a film item from the Internet Archive
@@ -2,10 +2,50 @@
 Video model representing a detailed Internet Archive video item
 """
 from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union, Iterator, Mapping
+import orjson
+from .base import DATACLASS_OPTIONS
 
 
-@dataclass
+class LazyMetadata(Mapping):
+    """
+    Read-only item metadata kept as its raw JSON encoding.
+
+    The JSON is only decoded when a field is accessed, and can be written
+    back to a response as-is without being decoded or re-encoded.
+    """
+    __slots__ = ("raw", "_decoded")
+
+    def __init__(self, raw: Union[str, bytes]):
+        """
+        Args:
+            raw: The JSON encoding of a metadata object
+        """
+        self.raw = raw
+        self._decoded: Optional[Dict[str, Any]] = None
+
+    def decode(self) -> Dict[str, Any]:
+        """
+        Decode the metadata, once
+        """
+        if self._decoded is None:
+            self._decoded = orjson.loads(self.raw)
+        return self._decoded
+
+    def __getitem__(self, key: str) -> Any:
+        return self.decode()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.decode())
+
+    def __len__(self) -> int:
+        return len(self.decode())
+
+    def __repr__(self) -> str:
+        return f"LazyMetadata({len(self.raw)} bytes)"
+
+
+@dataclass(**DATACLASS_OPTIONS)
 class VideoPlaybackUrl:
     """
     Represents a playback URL for a video
@@ -33,7 +73,7 @@ class VideoPlaybackUrl:
         )
 
 
-@dataclass
+@dataclass(**DATACLASS_OPTIONS)
 class Video:
     """
     Represents a detailed video item from the Internet Archive
@@ -47,11 +87,12 @@ class Video:
     collection: Optional[List[str]] = field(default_factory=list)
     thumbnail_url: Optional[str] = None
     playback_urls: List[VideoPlaybackUrl] = field(default_factory=list)
-    metadata: Dict[str, Any] = field(default_factory=dict)
+    metadata: Union[Dict[str, Any], LazyMetadata] = field(default_factory=dict)
     
     def to_dict(self) -> Dict[str, Any]:
         """
-        Convert the video object to a dictionary
+        Convert the video object to a dictionary.
+        LazyMetadata is passed through undecoded.
         """
         return {
             "identifier": self.identifier,
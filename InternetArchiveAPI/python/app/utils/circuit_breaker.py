@@ -0,0 +1,89 @@
+"""
+Circuit breaker failing fast while an upstream is unhealthy
+"""
+import time
+from typing import Any, Dict, Optional
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds. It then lets a single probe call through
+    (half-open): a success closes the circuit again, a failure reopens it.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        """
+        Args:
+            failure_threshold: Consecutive failures opening the circuit, 0 disables it
+            reset_timeout: Seconds the circuit stays open before a probe is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may go upstream, starting the probe of a half-open circuit
+        """
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            # A probe that never reported back (e.g. cancelled) is replaced after the timeout
+            if self._probe_started_at is None or now - self._probe_started_at >= self.reset_timeout:
+                self._probe_started_at = now
+                return True
+        self.rejected += 1
+        return False
+
+    def retry_after(self) -> float:
+        """
+        Get the seconds until the circuit lets a probe through
+        """
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self) -> None:
+        """
+        Record a successful call, closing the circuit
+        """
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started_at = None
+
+    def record_failure(self) -> None:
+        """
+        Record a failed call, opening the circuit when the threshold is reached
+        """
+        self.failures += 1
+        if self.failure_threshold <= 0:
+            return
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opens += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_started_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the breaker state and counters
+        """
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opens": self.opens,
+            "rejected": self.rejected
+        }
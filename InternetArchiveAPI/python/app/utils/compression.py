@@ -0,0 +1,178 @@
+"""
+Content codings (gzip, and brotli and zstd when installed) and their negotiation
+"""
+import os
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # Optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency
+    zstandard = None
+
+
+class StreamCompressor:
+    """
+    Incremental compressor whose output for each chunk can be decoded
+    without waiting for the next one, for streamed responses
+    """
+
+    def __init__(self, compress, flush, finish):
+        self._compress = compress
+        self._flush = flush
+        self._finish = finish
+
+    def write(self, chunk: bytes) -> bytes:
+        """
+        Compress a chunk and flush it
+        """
+        return self._compress(chunk) + self._flush()
+
+    def close(self) -> bytes:
+        """
+        End the compressed stream
+        """
+        return self._finish()
+
+
+class Codec:
+    """
+    A content coding of HTTP responses
+    """
+    name = ""
+
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compress a whole body
+        """
+        raise NotImplementedError
+
+    def stream(self) -> StreamCompressor:
+        """
+        Start compressing a body sent in chunks
+        """
+        raise NotImplementedError
+
+
+class GzipCodec(Codec):
+    """
+    gzip, from the standard library
+    """
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self) -> StreamCompressor:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return StreamCompressor(compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush)
+
+
+class BrotliCodec(Codec):
+    """
+    Brotli, when the brotli package is installed
+    """
+    name = "br"
+
+    def __init__(self, quality: int):
+        self.quality = quality
+
+    def compress(self, data: bytes) -> bytes:
+        return brotli.compress(data, quality=self.quality)
+
+    def stream(self) -> StreamCompressor:
+        compressor = brotli.Compressor(quality=self.quality)
+        return StreamCompressor(compressor.process, compressor.flush, compressor.finish)
+
+
+class ZstdCodec(Codec):
+    """
+    Zstandard, when the zstandard package is installed
+    """
+    name = "zstd"
+
+    def __init__(self, level: int):
+        self.level = level
+        self._compressor = zstandard.ZstdCompressor(level=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def stream(self) -> StreamCompressor:
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        return StreamCompressor(
+            compressor.compress, lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), compressor.flush
+        )
+
+
+# Compression levels, overridable through environment variables
+GZIP_LEVEL = int(os.getenv("ARCHIVE_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("ARCHIVE_BROTLI_QUALITY", "5"))
+ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "3"))
+
+
+def available_codecs() -> Dict[str, Codec]:
+    """
+    Get the codecs whose library is installed, in order of preference
+    """
+    codecs: List[Codec] = []
+    if brotli is not None:
+        codecs.append(BrotliCodec(BROTLI_QUALITY))
+    if zstandard is not None:
+        codecs.append(ZstdCodec(ZSTD_LEVEL))
+    codecs.append(GzipCodec(GZIP_LEVEL))
+    return {codec.name: codec for codec in codecs}
+
+
+def parse_accept_encoding(header: str) -> List[Tuple[str, float]]:
+    """
+    Parse an Accept-Encoding header into (coding, quality) pairs
+    """
+    codings = []
+    for item in header.split(","):
+        coding, *parameters = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings.append((coding.lower(), quality))
+    return codings
+
+
+def negotiate(header: Optional[str], available: Iterable[str]) -> Optional[str]:
+    """
+    Pick the content coding of a response
+
+    Args:
+        header: The Accept-Encoding request header
+        available: The supported codings, in order of preference
+
+    Returns:
+        The accepted coding with the highest quality, preferring the earlier
+        available ones on ties, or None to send the response unencoded
+    """
+    if not header:
+        return None
+    qualities = dict(parse_accept_encoding(header))
+    wildcard = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
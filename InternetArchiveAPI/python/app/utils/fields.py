@@ -0,0 +1,115 @@
+"""
+Field projections selecting which fields of a response are returned
+"""
+import re
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+# A field path, such as "title" or "metadata.runtime"
+FIELD_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_\-]*(\.[A-Za-z_][A-Za-z0-9_\-]*)*$")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Parse a comma-separated list of field paths into a projection
+
+    Args:
+        fields: The field paths, such as "identifier,title,metadata.runtime"
+
+    Returns:
+        A nested dictionary mapping each field to the projection of its
+        sub-fields, or to None when the whole field is selected; None when
+        no fields are given, which selects everything
+
+    Raises:
+        ValueError: If a field path is invalid
+    """
+    if fields is None or not fields.strip():
+        return None
+
+    projection: Dict[str, Any] = {}
+    for path in fields.split(","):
+        path = path.strip()
+        if not path:
+            continue
+        if not FIELD_PATTERN.match(path):
+            raise ValueError(f"Invalid field: {path}")
+
+        node = projection
+        *parents, name = path.split(".")
+        for parent in parents:
+            if parent in node and node[parent] is None:
+                # The whole parent field is already selected
+                break
+            node = node.setdefault(parent, {})
+        else:
+            node[name] = None
+    return projection or None
+
+
+def join_fields(projection: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Format a projection back to a comma-separated list of field paths
+    """
+    if projection is None:
+        return None
+
+    paths = []
+    for name, sub_projection in projection.items():
+        if sub_projection is None:
+            paths.append(name)
+        else:
+            paths.extend(f"{name}.{path}" for path in join_fields(sub_projection).split(","))
+    return ",".join(paths)
+
+
+def selects(projection: Optional[Dict[str, Any]], *names: str) -> bool:
+    """
+    Check whether a projection selects any of the given top-level fields
+    """
+    return projection is None or any(name in projection for name in names)
+
+
+def search_fields(projection: Optional[Dict[str, Any]], available: Iterable[str]) -> str:
+    """
+    Build the advancedsearch `fl` list of a projection
+
+    Args:
+        projection: The projection, None to select every available field
+        available: The upstream fields the response can hold
+
+    Returns:
+        The requested fields among the available ones, always including the
+        identifier, which derived fields such as thumbnails are built from
+    """
+    available = list(available)
+    if projection is None:
+        return ",".join(available)
+    return ",".join(["identifier", *[name for name in available if name in projection and name != "identifier"]])
+
+
+def project(value: Any, projection: Optional[Dict[str, Any]]) -> Any:
+    """
+    Keep only the projected fields of a value
+
+    Models are converted with to_dict() first, lists are projected item by
+    item, and fields missing from a value are left out.
+
+    Args:
+        value: The value to project
+        projection: The projection, None to keep the whole value
+
+    Returns:
+        The projected value
+    """
+    if projection is None:
+        return value
+    if hasattr(value, "to_dict"):
+        value = value.to_dict()
+    if isinstance(value, list):
+        return [project(item, projection) for item in value]
+    if isinstance(value, Mapping):
+        return {
+            name: project(value[name], sub_projection)
+            for name, sub_projection in projection.items() if name in value
+        }
+    return value
@@ -0,0 +1,149 @@
+"""
+Hedged requests cutting the latency tail of slow upstream calls
+"""
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class Hedger:
+    """
+    Runs a request and, if it has not answered within a delay, fires a second
+    identical one, returning whichever answers first and cancelling the other.
+
+    The delay is a percentile of the recent latencies, so only the slowest
+    requests are hedged, and the share of hedged requests is capped.
+    """
+    # Configuration, overridable through environment variables
+    ENABLED = os.getenv("ARCHIVE_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+    PERCENTILE = float(os.getenv("ARCHIVE_HEDGE_PERCENTILE", "95"))
+    # Delay used until enough latencies have been observed
+    INITIAL_DELAY = float(os.getenv("ARCHIVE_HEDGE_INITIAL_DELAY", "1"))
+    MIN_DELAY = float(os.getenv("ARCHIVE_HEDGE_MIN_DELAY", "0.05"))
+    MAX_RATE = float(os.getenv("ARCHIVE_HEDGE_MAX_RATE", "0.1"))
+    # Number of recent latencies the percentile is computed over
+    WINDOW = 1000
+    MIN_SAMPLES = 20
+    # The delay is recomputed after this many new latencies
+    RECOMPUTE_EVERY = 32
+
+    def __init__(self,
+                 percentile: Optional[float] = None,
+                 initial_delay: Optional[float] = None,
+                 min_delay: Optional[float] = None,
+                 max_rate: Optional[float] = None):
+        """
+        Args:
+            percentile: Latency percentile after which a request is hedged
+            initial_delay: Seconds before hedging until enough latencies are known
+            min_delay: Lowest hedging delay in seconds
+            max_rate: Maximum fraction of requests that are hedged
+        """
+        self.percentile = percentile if percentile is not None else self.PERCENTILE
+        self.initial_delay = initial_delay if initial_delay is not None else self.INITIAL_DELAY
+        self.min_delay = min_delay if min_delay is not None else self.MIN_DELAY
+        self.max_rate = max_rate if max_rate is not None else self.MAX_RATE
+        self.requests = 0
+        self.hedged = 0
+        self.skipped = 0
+        self.primary_wins = 0
+        self.hedge_wins = 0
+        self.failures = 0
+        self._latencies: "deque[float]" = deque(maxlen=self.WINDOW)
+        self._delay: Optional[float] = None
+        self._recorded_since_delay = 0
+
+    def record(self, latency: float) -> None:
+        """
+        Record the latency of an answered request
+        """
+        self._latencies.append(latency)
+        self._recorded_since_delay += 1
+        if self._recorded_since_delay >= self.RECOMPUTE_EVERY:
+            self._delay = None
+
+    def delay(self) -> float:
+        """
+        Get the seconds to wait for a request before hedging it
+        """
+        if len(self._latencies) < self.MIN_SAMPLES:
+            return max(self.min_delay, self.initial_delay)
+        if self._delay is None:
+            latencies = sorted(self._latencies)
+            index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+            self._delay = max(self.min_delay, latencies[index])
+            self._recorded_since_delay = 0
+        return self._delay
+
+    def _may_hedge(self) -> bool:
+        """
+        Check whether hedging one more request stays within the rate cap
+        """
+        return self.hedged + 1 <= self.max_rate * self.requests
+
+    async def run(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run a request, hedging it when it is slow
+
+        Args:
+            func: Coroutine function performing the request; it is called a
+                second time for the hedge, so it must be idempotent
+
+        Returns:
+            The result of the first attempt that succeeds
+
+        Raises:
+            Exception: The error of the first attempt when every attempt fails
+        """
+        self.requests += 1
+        started_at = time.monotonic()
+        primary = asyncio.ensure_future(func())
+        attempts = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay())
+            if done or not self._may_hedge():
+                if not done:
+                    self.skipped += 1
+                result = await primary
+                self.record(time.monotonic() - started_at)
+                return result
+
+            self.hedged += 1
+            hedge_started_at = time.monotonic()
+            attempts.append(asyncio.ensure_future(func()))
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is not None:
+                        continue
+                    if attempt is primary:
+                        self.primary_wins += 1
+                        self.record(time.monotonic() - started_at)
+                    else:
+                        self.hedge_wins += 1
+                        self.record(time.monotonic() - hedge_started_at)
+                    return attempt.result()
+            self.failures += 1
+            return primary.result()
+        finally:
+            # The losing attempt, or both when the caller is cancelled
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the hedging counters and the current delay
+        """
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "skipped": self.skipped,
+            "primary_wins": self.primary_wins,
+            "hedge_wins": self.hedge_wins,
+            "failures": self.failures,
+            "delay": self.delay()
+        }
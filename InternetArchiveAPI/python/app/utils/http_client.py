@@ -1,30 +1,504 @@
 """
 HTTP client for making requests to the Internet Archive API
 """
-import requests
-from typing import Dict, Any, Optional
+import os
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from .rate_limiter import AdaptiveTokenBucket
+from .circuit_breaker import CircuitBreaker
+from . import timing
+from .metrics import UPSTREAM_DURATION, UPSTREAM_RESPONSES, UPSTREAM_IN_FLIGHT, UPSTREAM_RESPONSE_SIZE, UPSTREAM_RETRIES
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """
+    Raised without contacting upstream while its circuit breaker is open
+    """
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"Upstream {upstream} is unavailable, retry in {retry_after:.0f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class ResponseTooLargeError(ValueError):
+    """
+    Raised when a response body is larger than the size accepted for it
+    """
+
+    def __init__(self, url: str, max_bytes: int):
+        super().__init__(f"{url} is larger than {max_bytes} bytes")
+        self.url = url
+        self.max_bytes = max_bytes
+
+
+def is_unavailable(error: BaseException) -> bool:
+    """
+    Check whether an error means upstream is unavailable or throttling,
+    rather than rejecting the request itself
+    """
+    if isinstance(error, (CircuitOpenError, httpx.TransportError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in HttpClient.RETRY_STATUSES
+    return False
+
+
+def retry_after_of(error: BaseException) -> Optional[float]:
+    """
+    Get the seconds an unavailable upstream asked to wait, if known
+    """
+    if isinstance(error, CircuitOpenError):
+        return error.retry_after
+    if isinstance(error, httpx.HTTPStatusError):
+        return HttpClient.parse_retry_after(error.response.headers.get("Retry-After"))
+    return None
 
 
 class HttpClient:
     """
-    HTTP client for making requests to external APIs
+    Asynchronous HTTP client for making requests to external APIs.
+
+    A single pooled keep-alive session is shared by every request made through
+    the client, so upstream connections are reused instead of being opened for
+    each call. The session is created lazily and must be closed with `aclose()`
+    when the application shuts down.
+
+    Requests to each upstream (advancedsearch, the metadata API and item
+    files) go through their own adaptive token bucket and circuit breaker.
+    Throttled (429), unavailable (502-504) and failed connections are retried
+    with jittered exponential backoff, waiting at least as long as
+    `Retry-After` asks.
     """
-    
+    # Pool configuration, overridable through environment variables
+    MAX_CONNECTIONS = int(os.getenv("ARCHIVE_HTTP_MAX_CONNECTIONS", "200"))
+    MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("ARCHIVE_HTTP_MAX_KEEPALIVE", "50"))
+    MAX_CONNECTIONS_PER_HOST = int(os.getenv("ARCHIVE_HTTP_MAX_PER_HOST", "100"))
+    KEEPALIVE_EXPIRY = float(os.getenv("ARCHIVE_HTTP_KEEPALIVE_EXPIRY", "30"))
+    TIMEOUT = float(os.getenv("ARCHIVE_HTTP_TIMEOUT", "10"))
+    CONNECT_TIMEOUT = float(os.getenv("ARCHIVE_HTTP_CONNECT_TIMEOUT", "5"))
+    # Requests per second allowed per upstream, 0 disables the limit
+    RATE_LIMITS = {
+        "search": float(os.getenv("ARCHIVE_RATE_LIMIT_SEARCH", "10")),
+        "metadata": float(os.getenv("ARCHIVE_RATE_LIMIT_METADATA", "30")),
+        "media": float(os.getenv("ARCHIVE_RATE_LIMIT_MEDIA", "20")),
+    }
+    # Seconds of requests a rate limiter lets through at once
+    RATE_LIMIT_BURST = float(os.getenv("ARCHIVE_RATE_LIMIT_BURST", "2"))
+    RETRIES = int(os.getenv("ARCHIVE_HTTP_RETRIES", "2"))
+    BACKOFF_BASE = float(os.getenv("ARCHIVE_HTTP_BACKOFF_BASE", "0.2"))
+    BACKOFF_MAX = float(os.getenv("ARCHIVE_HTTP_BACKOFF_MAX", "5"))
+    CIRCUIT_FAILURES = int(os.getenv("ARCHIVE_CIRCUIT_FAILURES", "5"))
+    CIRCUIT_RESET = float(os.getenv("ARCHIVE_CIRCUIT_RESET", "30"))
+    # Responses worth retrying: throttled or temporarily unavailable upstream
+    RETRY_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self,
+                 max_connections: Optional[int] = None,
+                 max_keepalive_connections: Optional[int] = None,
+                 max_connections_per_host: Optional[int] = None,
+                 timeout: Optional[float] = None,
+                 connect_timeout: Optional[float] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 rate_limits: Optional[Dict[str, float]] = None,
+                 retries: Optional[int] = None,
+                 backoff_base: Optional[float] = None,
+                 circuit_failures: Optional[int] = None,
+                 circuit_reset: Optional[float] = None):
+        """
+        Args:
+            max_connections: Maximum number of open connections in the pool
+            max_keepalive_connections: Maximum number of idle keep-alive connections
+            max_connections_per_host: Maximum number of concurrent requests per upstream host
+            timeout: Read/write/pool timeout in seconds
+            connect_timeout: Connection timeout in seconds
+            transport: Optional transport, mainly used to stub the upstream in tests
+            rate_limits: Requests per second per upstream ("search", "metadata", "media"), 0 disables a limit
+            retries: Retries of throttled, unavailable or failed requests
+            backoff_base: Seconds of the first retry backoff, doubled on each retry
+            circuit_failures: Consecutive failures opening an upstream circuit, 0 disables it
+            circuit_reset: Seconds an open circuit rejects requests before probing upstream
+        """
+        self.max_connections = max_connections or self.MAX_CONNECTIONS
+        self.max_keepalive_connections = max_keepalive_connections or self.MAX_KEEPALIVE_CONNECTIONS
+        self.max_connections_per_host = max_connections_per_host or self.MAX_CONNECTIONS_PER_HOST
+        self.timeout = timeout or self.TIMEOUT
+        self.connect_timeout = connect_timeout or self.CONNECT_TIMEOUT
+        self.rate_limits = {**self.RATE_LIMITS, **(rate_limits or {})}
+        self.retries = retries if retries is not None else self.RETRIES
+        self.backoff_base = backoff_base if backoff_base is not None else self.BACKOFF_BASE
+        self.circuit_failures = circuit_failures if circuit_failures is not None else self.CIRCUIT_FAILURES
+        self.circuit_reset = circuit_reset if circuit_reset is not None else self.CIRCUIT_RESET
+        self.retried = 0
+        self.not_modified = 0
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._rate_limiters: Dict[str, Optional[AdaptiveTokenBucket]] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        The pooled session, created on first use
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                transport=self._transport
+            )
+        return self._client
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        """
+        Get the semaphore bounding concurrent requests to the host of the URL
+        """
+        host = urlsplit(url).netloc
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = asyncio.Semaphore(self.max_connections_per_host)
+            self._host_limits[host] = limit
+        return limit
+
+    @staticmethod
+    def upstream(url: str) -> str:
+        """
+        Get the upstream a URL belongs to: "metadata" for the metadata API,
+        "media" for item files and images, "search" for advancedsearch and
+        the scrape API
+        """
+        path = urlsplit(url).path
+        if path.startswith("/metadata"):
+            return "metadata"
+        if path.startswith(("/download/", "/services/img/")):
+            return "media"
+        return "search"
+
     @staticmethod
-    def get(url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def follows_redirects(upstream: str) -> bool:
+        """
+        Whether requests to an upstream follow redirects: item files and
+        images are redirected to the storage node holding the item, and the
+        final response is the one the rate limiter and circuit breaker see
+        """
+        return upstream == "media"
+
+    def _rate_limiter(self, upstream: str) -> Optional[AdaptiveTokenBucket]:
+        """
+        Get the rate limiter of an upstream, None when it is not limited
+        """
+        if upstream not in self._rate_limiters:
+            rate = self.rate_limits.get(upstream, 0)
+            self._rate_limiters[upstream] = AdaptiveTokenBucket(rate, burst=max(rate * self.RATE_LIMIT_BURST, 1.0)) if rate > 0 else None
+        return self._rate_limiters[upstream]
+
+    def _breaker(self, upstream: str) -> CircuitBreaker:
+        """
+        Get the circuit breaker of an upstream
+        """
+        breaker = self._breakers.get(upstream)
+        if breaker is None:
+            breaker = CircuitBreaker(self.circuit_failures, self.circuit_reset)
+            self._breakers[upstream] = breaker
+        return breaker
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """
+        Parse a Retry-After header given in seconds or as an HTTP date
+        """
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    async def _send(self,
+                    upstream: str,
+                    url: str,
+                    params: Optional[Dict[str, Any]],
+                    headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        Send one request attempt, recording its latency, status and size
+        """
+        UPSTREAM_IN_FLIGHT.inc(upstream)
+        started_at = time.perf_counter()
+        try:
+            async with self._host_limit(url):
+                response = await self.client.get(url, params=params, headers=headers, follow_redirects=self.follows_redirects(upstream))
+        except httpx.TransportError:
+            UPSTREAM_RESPONSES.inc(upstream, "error")
+            raise
+        finally:
+            elapsed = time.perf_counter() - started_at
+            UPSTREAM_IN_FLIGHT.dec(upstream)
+            UPSTREAM_DURATION.observe(upstream, value=elapsed)
+            timing.record("upstream", elapsed)
+        UPSTREAM_RESPONSES.inc(upstream, str(response.status_code))
+        UPSTREAM_RESPONSE_SIZE.observe(upstream, value=len(response.content))
+        return response
+
+    def _backoff(self, attempt: int) -> float:
+        """
+        Get a jittered exponential backoff delay ("full jitter") for a retry
+        """
+        return random.uniform(0, min(self.BACKOFF_MAX, self.backoff_base * 2 ** attempt))
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Make a GET request to the specified URL
-        
+
         Args:
             url: The URL to make the request to
             params: Optional query parameters
-            
+
         Returns:
             The response as a dictionary
-            
+
+        Raises:
+            CircuitOpenError: If the upstream circuit is open
+            httpx.HTTPError: If the request fails
+        """
+        response = await self._request(url, params)
+        with timing.stage("parse"):
+            return response.json()
+
+    async def get_bytes(self,
+                        url: str,
+                        params: Optional[Dict[str, Any]] = None,
+                        max_bytes: Optional[int] = None) -> Tuple[bytes, str]:
+        """
+        Make a GET request for a binary resource, such as an image
+
+        Args:
+            url: The URL to make the request to
+            params: Optional query parameters
+            max_bytes: Optional largest body accepted. The body is then
+                streamed, and the request is not retried but abandoned as soon
+                as its Content-Length or the bytes read exceed the limit
+
+        Returns:
+            The response body and its content type
+
+        Raises:
+            CircuitOpenError: If the upstream circuit is open
+            httpx.HTTPError: If the request fails
+            ResponseTooLargeError: If the body is larger than max_bytes
+        """
+        if max_bytes is None:
+            response = await self._request(url, params)
+            return response.content, response.headers.get("Content-Type", "application/octet-stream")
+
+        response = await self.stream(str(httpx.URL(url, params=params)) if params else url)
+        try:
+            response.raise_for_status()
+            length = response.headers.get("Content-Length")
+            if length is not None and length.isdigit() and int(length) > max_bytes:
+                raise ResponseTooLargeError(url, max_bytes)
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > max_bytes:
+                    raise ResponseTooLargeError(url, max_bytes)
+        finally:
+            await response.aclose()
+        UPSTREAM_RESPONSE_SIZE.observe(self.upstream(url), value=len(body))
+        return bytes(body), response.headers.get("Content-Type", "application/octet-stream")
+
+    async def stream(self, url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        Open a GET request whose body is streamed, through the rate limiter
+        and circuit breaker of its upstream, following the redirect of item
+        files to their storage node. It is not retried, as its body may
+        already be partly forwarded when it fails.
+
+        Args:
+            url: The URL to make the request to
+            headers: Optional request headers, such as Range
+
+        Returns:
+            The successful, 304 or 416 response with its body unread;
+            the caller reads it with aiter_raw() and must close it with aclose()
+
         Raises:
-            requests.RequestException: If the request fails
+            CircuitOpenError: If the upstream circuit is open
+            httpx.HTTPError: If the request fails
         """
-        response = requests.get(url, params=params)
+        upstream = self.upstream(url)
+        breaker = self._breaker(upstream)
+        if not breaker.allow():
+            raise CircuitOpenError(upstream, breaker.retry_after())
+        rate_limiter = self._rate_limiter(upstream)
+        if rate_limiter is not None:
+            await rate_limiter.acquire()
+
+        started_at = time.perf_counter()
+        try:
+            response = await self.client.send(
+                self.client.build_request("GET", url, headers=headers),
+                stream=True,
+                follow_redirects=self.follows_redirects(upstream)
+            )
+        except httpx.TransportError:
+            breaker.record_failure()
+            UPSTREAM_RESPONSES.inc(upstream, "error")
+            raise
+        finally:
+            # Time to the response headers, the body takes as long as the client reads it
+            elapsed = time.perf_counter() - started_at
+            UPSTREAM_DURATION.observe(upstream, value=elapsed)
+            timing.record("upstream", elapsed)
+        UPSTREAM_RESPONSES.inc(upstream, str(response.status_code))
+        if response.status_code in self.RETRY_STATUSES:
+            breaker.record_failure()
+            if rate_limiter is not None and response.status_code in (429, 503):
+                rate_limiter.throttle(self.parse_retry_after(response.headers.get("Retry-After")))
+        else:
+            breaker.record_success()
+            if rate_limiter is not None:
+                rate_limiter.recover()
+        if response.is_success or response.status_code in (304, 416):
+            return response
+        await response.aclose()
         response.raise_for_status()
-        return response.json() 
\ No newline at end of file
+        return response
+
+    async def get_conditional(self,
+                              url: str,
+                              params: Optional[Dict[str, Any]] = None,
+                              validators: Optional[Dict[str, str]] = None) -> Tuple[Optional[Dict[str, Any]], Dict[str, str]]:
+        """
+        Make a conditional GET request, revalidating a previous response
+
+        Args:
+            url: The URL to make the request to
+            params: Optional query parameters
+            validators: The "etag" and "last_modified" validators of the
+                previous response, sent as If-None-Match and If-Modified-Since
+
+        Returns:
+            The response as a dictionary, or None when upstream answered 304
+            Not Modified, and the validators of the response, empty when
+            upstream sends none
+
+        Raises:
+            CircuitOpenError: If the upstream circuit is open
+            httpx.HTTPError: If the request fails
+        """
+        headers = {}
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+        response = await self._request(url, params, headers or None)
+        response_validators = {
+            name: response.headers[header]
+            for name, header in (("etag", "ETag"), ("last_modified", "Last-Modified"))
+            if header in response.headers
+        }
+        if response.status_code == 304:
+            self.not_modified += 1
+            return None, response_validators or dict(validators or {})
+        with timing.stage("parse"):
+            return response.json(), response_validators
+
+    async def _request(self,
+                       url: str,
+                       params: Optional[Dict[str, Any]] = None,
+                       headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        Send a GET request through the rate limiter and circuit breaker of
+        its upstream, retrying throttled, unavailable or failed attempts
+
+        Returns:
+            The successful (2xx or 304) response
+
+        Raises:
+            CircuitOpenError: If the upstream circuit is open
+            httpx.HTTPError: If the request fails
+        """
+        upstream = self.upstream(url)
+        breaker = self._breaker(upstream)
+        rate_limiter = self._rate_limiter(upstream)
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(upstream, breaker.retry_after())
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+
+            retry_after = None
+            try:
+                response = await self._send(upstream, url, params, headers)
+                if response.status_code != 304:
+                    response.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in self.RETRY_STATUSES:
+                    # Upstream is healthy, it rejected this request
+                    breaker.record_success()
+                    raise
+                error: httpx.HTTPError = e
+                retry_after = self.parse_retry_after(e.response.headers.get("Retry-After"))
+                if rate_limiter is not None and e.response.status_code in (429, 503):
+                    rate_limiter.throttle(retry_after)
+            except httpx.TransportError as e:
+                error = e
+            else:
+                breaker.record_success()
+                if rate_limiter is not None:
+                    rate_limiter.recover()
+                return response
+
+            breaker.record_failure()
+            delay = max(self._backoff(attempt), retry_after or 0.0)
+            if attempt >= self.retries or delay > self.BACKOFF_MAX:
+                raise error
+            attempt += 1
+            self.retried += 1
+            UPSTREAM_RETRIES.inc(upstream)
+            logger.info("Retrying %s upstream request in %.2fs after: %s", upstream, delay, error)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the retry counter and the rate limiter and circuit breaker state of each upstream
+        """
+        upstreams = {}
+        for upstream, breaker in self._breakers.items():
+            rate_limiter = self._rate_limiters.get(upstream)
+            upstreams[upstream] = {
+                "circuit": breaker.stats(),
+                "rate": rate_limiter.rate if rate_limiter is not None else None,
+                "throttled": rate_limiter.throttled if rate_limiter is not None else 0
+            }
+        return {"retried": self.retried, "not_modified": self.not_modified, "upstreams": upstreams}
+
+    async def aclose(self) -> None:
+        """
+        Close the pooled session and release its connections
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
\ No newline at end of file
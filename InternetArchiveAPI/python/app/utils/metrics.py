@@ -0,0 +1,276 @@
+"""
+Prometheus-style metrics of the API and of its upstream requests
+"""
+import math
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Default payload size buckets in bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value: str) -> str:
+    """
+    Escape a label value for the text exposition format
+    """
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Iterable[str]) -> str:
+    """
+    Format label names and values as {name="value",...}
+    """
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """
+    Format a sample value, using the exposition format spelling of infinities
+    """
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    A named metric whose samples are split by label values
+    """
+    TYPE = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        """
+        Args:
+            name: The metric name
+            description: The help text of the metric
+            labels: The label names
+        """
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> LabelValues:
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}")
+        return tuple(str(value) for value in labels)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """
+        Get the (suffixed name, formatted labels, value) samples of the metric
+        """
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        """
+        Render the metric in the text exposition format
+        """
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.TYPE}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """
+    A monotonically increasing count
+    """
+    TYPE = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        """
+        Increase the count of the given label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, *labels: str, value: float) -> None:
+        """
+        Set the value of the given label values, for counts maintained elsewhere
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, *labels: str) -> float:
+        """
+        Get the count of the given label values
+        """
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            return [(self.name, _format_labels(self.labels, key), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """
+    A value that goes up and down
+    """
+    TYPE = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        """
+        Decrease the value of the given label values
+        """
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """
+    Observations counted in cumulative buckets, with their sum and count
+    """
+    TYPE = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: the count of each bucket (the last one is +Inf), the sum and the count
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        """
+        Record an observation for the given label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+                self._values[key] = state
+            counts, totals = state
+            counts[bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def count(self, *labels: str) -> int:
+        """
+        Get the number of observations of the given label values
+        """
+        state = self._values.get(self._key(labels))
+        return int(state[1][1]) if state is not None else 0
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        samples = []
+        with self._lock:
+            for key, (counts, totals) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, math.inf), counts):
+                    cumulative += count
+                    labels = _format_labels((*self.labels, "le"), (*key, _format_value(bound)))
+                    samples.append((f"{self.name}_bucket", labels, cumulative))
+                labels = _format_labels(self.labels, key)
+                samples.append((f"{self.name}_sum", labels, totals[0]))
+                samples.append((f"{self.name}_count", labels, totals[1]))
+        return samples
+
+
+class Registry:
+    """
+    The set of metrics exposed together
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Add a metric, returning the one already registered under its name if any
+        """
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, description, labels))
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = (), buckets: Optional[Sequence[float]] = None) -> Histogram:
+        return self.register(Histogram(name, description, labels, buckets or LATENCY_BUCKETS))
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# API requests, labelled by route template rather than path to bound the label values
+REQUEST_DURATION = registry.histogram(
+    "archive_api_request_duration_seconds", "Latency of API requests", ["method", "route"]
+)
+REQUESTS = registry.counter(
+    "archive_api_requests_total", "API requests by response status", ["method", "route", "status"]
+)
+REQUESTS_IN_FLIGHT = registry.gauge(
+    "archive_api_requests_in_flight", "API requests being served"
+)
+RESPONSE_SIZE = registry.histogram(
+    "archive_api_response_size_bytes", "Size of API response bodies", ["route"], buckets=SIZE_BUCKETS
+)
+
+# Admission control, labelled by route template
+ADMISSION_IN_FLIGHT = registry.gauge(
+    "archive_admission_in_flight", "Admitted API requests being served", ["route"]
+)
+ADMISSION_QUEUED = registry.gauge(
+    "archive_admission_queued", "API requests waiting to be admitted", ["route"]
+)
+ADMISSION_REJECTIONS = registry.counter(
+    "archive_admission_rejections_total", "API requests shed with 503 by reason", ["route", "reason"]
+)
+ADMISSION_WAIT = registry.histogram(
+    "archive_admission_wait_seconds", "Time API requests waited to be admitted", ["route"]
+)
+
+# Upstream requests, labelled by upstream ("search", "metadata" or "media")
+UPSTREAM_DURATION = registry.histogram(
+    "archive_upstream_request_duration_seconds", "Latency of upstream requests", ["upstream"]
+)
+UPSTREAM_RESPONSES = registry.counter(
+    "archive_upstream_responses_total", "Upstream responses by status, \"error\" for failed connections", ["upstream", "status"]
+)
+UPSTREAM_IN_FLIGHT = registry.gauge(
+    "archive_upstream_requests_in_flight", "Upstream requests waiting for a response", ["upstream"]
+)
+UPSTREAM_RESPONSE_SIZE = registry.histogram(
+    "archive_upstream_response_size_bytes", "Size of upstream response bodies", ["upstream"], buckets=SIZE_BUCKETS
+)
+UPSTREAM_RETRIES = registry.counter(
+    "archive_upstream_retries_total", "Retried upstream requests", ["upstream"]
+)
+UPSTREAM_CIRCUIT_OPEN = registry.gauge(
+    "archive_upstream_circuit_open", "Whether the circuit breaker of an upstream is open", ["upstream"]
+)
+
+# Snapshots of the service components, updated when the metrics are rendered
+CACHE_LOOKUPS = registry.counter(
+    "archive_cache_lookups_total", "Response cache lookups by result", ["result"]
+)
+CACHE_HIT_RATIO = registry.gauge(
+    "archive_cache_hit_ratio", "Share of response cache lookups served from the cache"
+)
+CACHE_ENTRIES = registry.gauge(
+    "archive_cache_entries", "Responses held in the in-memory cache"
+)
+CACHE_BYTES = registry.gauge(
+    "archive_cache_bytes", "Encoded size of the responses held in the in-memory cache"
+)
+COALESCED_REQUESTS = registry.counter(
+    "archive_coalesced_requests_total", "Upstream queries that waited for an identical one in flight"
+)
@@ -0,0 +1,105 @@
+"""
+Token-bucket rate limiter for upstream requests
+"""
+import time
+import asyncio
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Asynchronous token bucket allowing `rate` requests per second on average
+    with bursts of up to `burst` requests
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        Args:
+            rate: Tokens added per second
+            burst: Maximum number of tokens held, defaults to one second worth of tokens
+        """
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """
+        Take tokens if they are available right now
+
+        Returns:
+            True if the tokens were taken
+        """
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """
+        Get the seconds until the given number of tokens is available
+        """
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate) if self.rate > 0 else float("inf")
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Wait until the tokens are available and take them
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep(self.wait_time(tokens))
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    Token bucket whose rate backs off when upstream throttles requests.
+
+    The rate is halved on each throttled response, down to `min_rate`, and
+    grows back by a twentieth of the configured rate on each successful one
+    (additive increase, multiplicative decrease). A `Retry-After` delay
+    pauses the bucket until it has elapsed.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, min_rate: Optional[float] = None):
+        """
+        Args:
+            rate: Tokens added per second when upstream is healthy
+            burst: Maximum number of tokens held, defaults to one second worth of tokens
+            min_rate: Lowest rate the bucket backs off to, defaults to a tenth of `rate`
+        """
+        super().__init__(rate, burst)
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 10
+        self.throttled = 0
+
+    def throttle(self, retry_after: Optional[float] = None) -> None:
+        """
+        Slow down after a throttled response
+
+        Args:
+            retry_after: Seconds upstream asked to wait before the next request
+        """
+        self._refill()
+        self.throttled += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        if retry_after:
+            # No token becomes available before the delay has elapsed
+            self.tokens = min(self.tokens, 1.0 - retry_after * self.rate)
+
+    def recover(self) -> None:
+        """
+        Speed back up after a successful response
+        """
+        if self.rate < self.max_rate:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
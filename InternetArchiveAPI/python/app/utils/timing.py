@@ -0,0 +1,75 @@
+"""
+Per-request stage timings reported in the Server-Timing header
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+# Whether responses carry a Server-Timing header
+ENABLED = os.getenv("ARCHIVE_SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+
+
+class ServerTiming:
+    """
+    The time spent in each stage of a request.
+
+    Stages running concurrently (such as parallel upstream requests) are
+    summed, so a stage can exceed the total duration of the request.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        """
+        Add time spent in a stage
+        """
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self) -> str:
+        """
+        Format the stages and the total duration, in milliseconds, as a Server-Timing header value
+        """
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started_at) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[ServerTiming]] = ContextVar("server_timing", default=None)
+
+
+def start() -> ServerTiming:
+    """
+    Start timing the request handled in the current context
+    """
+    timing = ServerTiming()
+    _current.set(timing)
+    return timing
+
+
+def record(stage: str, seconds: float) -> None:
+    """
+    Add time spent in a stage to the current request, if it is timed
+    """
+    timing = _current.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time the enclosed block as a stage of the current request
+    """
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - started_at)
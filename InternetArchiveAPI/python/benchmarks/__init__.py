@@ -0,0 +1,3 @@
+"""
+Benchmarks for the Internet Archive Feature Films API
+"""
\ No newline at end of file
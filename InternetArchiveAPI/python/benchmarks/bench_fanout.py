@@ -0,0 +1,59 @@
+"""
+Benchmark the concurrent upstream fan-out of the ArchiveService
+
+Every upstream request is answered by a stubbed transport after an injected
+delay, so the handler latency should be close to one delay instead of two.
+
+Usage:
+    python -m benchmarks.bench_fanout --delay 0.2 --iterations 10
+"""
+import time
+import asyncio
+import argparse
+import httpx
+from app.core.archive_service import ArchiveService
+from app.utils.http_client import HttpClient
+
+
+def make_transport(delay: float) -> httpx.MockTransport:
+    """
+    Build a stubbed upstream that answers every request after `delay` seconds
+    """
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(delay)
+        if request.url.path.startswith("/metadata/"):
+            return httpx.Response(200, json={"metadata": {}, "files": []})
+        query = request.url.params.get("q", "")
+        docs = [{"identifier": query[len("identifier:("):-1] or "film", "title": "Title"}]
+        return httpx.Response(200, json={"responseHeader": {"params": {}}, "response": {"docs": docs}})
+    return httpx.MockTransport(handler)
+
+
+async def measure(name: str, call, iterations: int) -> float:
+    """
+    Run `call` sequentially and return the mean latency in seconds
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await call()
+    mean = (time.perf_counter() - start) / iterations
+    print(f"{name:<28} mean={mean * 1000:8.1f} ms")
+    return mean
+
+
+async def main(delay: float, iterations: int) -> None:
+    service = ArchiveService(http_client=HttpClient(transport=make_transport(delay)))
+    try:
+        print(f"Injected upstream delay: {delay * 1000:.0f} ms per request (sequential baseline: {2 * delay * 1000:.0f} ms)")
+        await measure("get_collection_with_films", lambda: service.get_collection_with_films("feature_films"), iterations)
+        await measure("get_video_details", lambda: service.get_video_details("video1"), iterations)
+    finally:
+        await service.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--delay", type=float, default=0.2, help="Upstream delay in seconds")
+    parser.add_argument("--iterations", type=int, default=10, help="Calls per method")
+    args = parser.parse_args()
+    asyncio.run(main(args.delay, args.iterations))
\ No newline at end of file
@@ -0,0 +1,323 @@
+"""
+Load test the API against a local fake archive.org
+
+Starts benchmarks.fake_archive and the API (uvicorn) pointed at it, drives
+each endpoint with a closed-loop load generator for a fixed duration and
+reports its throughput, latency percentiles and the memory of the API
+process. Results are written to a JSON file; with --baseline, a previous
+results file is compared against and the run fails when the throughput of
+an endpoint dropped, or its p95 latency grew, by more than --tolerance.
+
+Usage:
+    python -m benchmarks.bench_load --duration 10 --concurrency 32 --latency 0.05 --jitter 0.02
+    python -m benchmarks.bench_load --baseline benchmarks/results/before.json --output benchmarks/results/after.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import httpx
+
+PYTHON_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.join(PYTHON_PATH, "benchmarks", "results")
+
+# A request of a scenario: method, path and JSON body
+Request = Tuple[str, str, Optional[Dict[str, Any]]]
+
+
+def scenarios(id_pool: int, rng: random.Random) -> Dict[str, Callable[[], Request]]:
+    """
+    Build the request generators of each benchmarked endpoint
+
+    Pages and identifiers are drawn from bounded pools, so a run mixes cache
+    misses while the pools are cold with hits once they are warm.
+
+    Args:
+        id_pool: Number of distinct video identifiers and pages requested
+        rng: Random generator of the pages and identifiers
+
+    Returns:
+        The request generators keyed by endpoint name
+    """
+    pages = max(1, id_pool // 10)
+
+    def video_id() -> str:
+        return f"bench_video_{rng.randrange(id_pool)}"
+
+    return {
+        "root": lambda: ("GET", "/", None),
+        "explore": lambda: ("GET", f"/api/v1/explore?page={rng.randint(1, pages)}", None),
+        "collection": lambda: ("GET", f"/api/v1/collections/feature_films?page={rng.randint(1, pages)}", None),
+        "collection_items": lambda: ("GET", f"/api/v1/collections/feature_films/items?page={rng.randint(1, pages)}", None),
+        "video": lambda: ("GET", f"/api/v1/videos/{video_id()}", None),
+        "videos_batch": lambda: ("POST", "/api/v1/videos:batch", {"ids": [video_id() for _ in range(20)]}),
+    }
+
+
+def percentile(latencies: List[float], value: float) -> Optional[float]:
+    """
+    Get a percentile of sorted latencies by the nearest-rank method
+    """
+    if not latencies:
+        return None
+    index = max(0, min(len(latencies) - 1, int(round(value / 100 * len(latencies))) - 1))
+    return latencies[index]
+
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    """
+    Get the resident memory in bytes of a process and its children, such
+    as the uvicorn workers, or None where /proc is not available
+    """
+    total = 0
+    pending = [pid]
+    try:
+        while pending:
+            current = pending.pop()
+            with open(f"/proc/{current}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            with open(f"/proc/{current}/task/{current}/children") as children:
+                pending.extend(int(child) for child in children.read().split())
+    except (OSError, ValueError):
+        return total or None
+    return total
+
+
+async def wait_until_ready(url: str, timeout: float = 20.0) -> None:
+    """
+    Wait until a server answers requests
+    """
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not start within {timeout} seconds")
+                await asyncio.sleep(0.1)
+
+
+async def run_endpoint(client: httpx.AsyncClient,
+                       make_request: Callable[[], Request],
+                       duration: float,
+                       concurrency: int,
+                       pid: Optional[int]) -> Dict[str, Any]:
+    """
+    Send requests from `concurrency` workers for `duration` seconds
+
+    Returns:
+        The request count, throughput, latency percentiles in milliseconds,
+        response statuses and memory of the API process
+    """
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    deadline = time.monotonic() + duration
+
+    async def worker() -> None:
+        while time.monotonic() < deadline:
+            method, path, body = make_request()
+            started_at = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                status = str(response.status_code)
+            except httpx.HTTPError as error:
+                status = type(error).__name__
+            latencies.append(time.perf_counter() - started_at)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    rss_samples: List[int] = []
+
+    async def sample_memory() -> None:
+        while True:
+            rss = process_tree_rss(pid) if pid is not None else None
+            if rss is not None:
+                rss_samples.append(rss)
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.create_task(sample_memory())
+    started_at = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        elapsed = time.perf_counter() - started_at
+        sampler.cancel()
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": errors / len(latencies) if latencies else 0.0,
+        "statuses": statuses,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) * 1000 if latencies else None,
+            **{f"p{value}": percentile(latencies, value) * 1000 if latencies else None for value in (50, 95, 99)},
+            "max": latencies[-1] * 1000 if latencies else None,
+        },
+        "memory_mb": {
+            "rss_peak": max(rss_samples) / 2 ** 20 if rss_samples else None,
+            "rss_end": rss_samples[-1] / 2 ** 20 if rss_samples else None,
+        },
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Compare the endpoints of two runs
+
+    Returns:
+        A description of every endpoint whose throughput dropped or whose
+        p95 latency grew by more than `tolerance`
+    """
+    regressions = []
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous is None:
+            continue
+        if previous["rps"] and current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {previous['rps']:.1f} -> {current['rps']:.1f} requests/s")
+        previous_p95, current_p95 = previous["latency_ms"]["p95"], current["latency_ms"]["p95"]
+        if previous_p95 and current_p95 and current_p95 > previous_p95 * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous_p95:.1f} -> {current_p95:.1f} ms")
+    return regressions
+
+
+def start_process(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], cwd=PYTHON_PATH, env=env)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Start the fake upstream and the API unless --target is given, then load
+    every selected endpoint in turn
+    """
+    processes: List[subprocess.Popen] = []
+    pid = None
+    target = args.target
+    try:
+        if target is None:
+            upstream = f"http://127.0.0.1:{args.upstream_port}"
+            processes.append(start_process([
+                "-m", "benchmarks.fake_archive", "--port", str(args.upstream_port),
+                "--latency", str(args.latency), "--jitter", str(args.jitter),
+                "--error-rate", str(args.error_rate), "--num-found", str(args.num_found),
+                *(["--seed", str(args.seed)] if args.seed is not None else []),
+            ], dict(os.environ)))
+            await wait_until_ready(f"{upstream}/advancedsearch.php")
+
+            env = dict(os.environ)
+            env.update({
+                "ARCHIVE_API_BASE_URL": f"{upstream}/advancedsearch.php",
+                "ARCHIVE_METADATA_URL": f"{upstream}/metadata",
+                "ARCHIVE_SCRAPE_URL": f"{upstream}/services/search/v1/scrape",
+            })
+            # The fake upstream is not rate limited, so neither is the API unless asked to
+            env.setdefault("ARCHIVE_RATE_LIMIT_SEARCH", "0")
+            env.setdefault("ARCHIVE_RATE_LIMIT_METADATA", "0")
+            app = start_process([
+                "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--workers", str(args.workers),
+                "--log-level", "warning", "--no-access-log",
+            ], env)
+            processes.append(app)
+            pid = app.pid
+            target = f"http://127.0.0.1:{args.port}"
+            await wait_until_ready(f"{target}/")
+
+        rng = random.Random(args.seed)
+        generators = scenarios(args.id_pool, rng)
+        selected = args.endpoints or list(generators)
+        results: Dict[str, Any] = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                name: getattr(args, name) for name in (
+                    "duration", "warmup", "concurrency", "workers", "latency", "jitter",
+                    "error_rate", "num_found", "id_pool", "seed"
+                )
+            },
+            "endpoints": {},
+        }
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=target, limits=limits, timeout=30.0) as client:
+            print(f"{'endpoint':<18} {'requests':>9} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'rss MB':>8}")
+            for name in selected:
+                if args.warmup:
+                    await run_endpoint(client, generators[name], args.warmup, args.concurrency, None)
+                result = await run_endpoint(client, generators[name], args.duration, args.concurrency, pid)
+                results["endpoints"][name] = result
+                latency, memory = result["latency_ms"], result["memory_mb"]
+                print(
+                    f"{name:<18} {result['requests']:>9} {result['rps']:>9.1f} {latency['p50'] or 0:>8.1f} "
+                    f"{latency['p95'] or 0:>8.1f} {latency['p99'] or 0:>8.1f} {result['errors']:>7} "
+                    f"{memory['rss_peak'] or 0:>8.1f}"
+                )
+        return results
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoints", nargs="*", help="Endpoints to load, all by default: root explore collection collection_items video videos_batch")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per endpoint")
+    parser.add_argument("--warmup", type=float, default=1.0, help="Seconds of unrecorded load before each endpoint")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes of the API")
+    parser.add_argument("--port", type=int, default=8000, help="Port of the API")
+    parser.add_argument("--target", help="URL of an already running API; the fake upstream and API are then not started")
+    parser.add_argument("--upstream-port", type=int, default=8081, help="Port of the fake archive.org")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean upstream delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maximum deviation from the upstream delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream requests answered with 503")
+    parser.add_argument("--num-found", type=int, default=1000, help="Number of documents matching every search")
+    parser.add_argument("--id-pool", type=int, default=500, help="Number of distinct videos requested")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the requests and upstream delays")
+    parser.add_argument("--output", help="Results file, benchmarks/results/load-<time>.json by default")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative drop of throughput or growth of p95")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_PATH, exist_ok=True)
+        output = os.path.join(RESULTS_PATH, f"load-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json")
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get("config") != results["config"]:
+            print(f"Warning: {args.baseline} was run with a different configuration: {baseline.get('config')}")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regression beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Benchmark the router response serialization paths
+
+Compares the previous path (to_dict(), validation against the generic
+`Dict[str, Any]` response model and stdlib JSON encoding) with the
+ModelResponse path that encodes the models directly with orjson.
+
+Usage:
+    python -m benchmarks.bench_serialization --iterations 2000 --files 500
+"""
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Any, Callable, Dict, List
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from app.api.responses import ModelResponse
+from app.models.video import Video, VideoPlaybackUrl
+
+
+def make_video(files: int) -> Video:
+    """
+    Build a video with a large metadata blob, like the /metadata/{id} ones
+    """
+    metadata: Dict[str, Any] = {
+        "identifier": "bench_video",
+        "title": "Benchmark Video",
+        "description": "A long description. " * 50,
+        "subject": [f"subject {i}" for i in range(20)],
+        "files": [
+            {"name": f"bench_video_{i}.mp4", "format": "h.264", "size": str(i * 1024), "md5": "0" * 32}
+            for i in range(files)
+        ]
+    }
+    return Video(
+        identifier="bench_video",
+        title="Benchmark Video",
+        description="A long description.",
+        subject=metadata["subject"],
+        collection=["feature_films"],
+        thumbnail_url="https://archive.org/services/img/bench_video",
+        playback_urls=[VideoPlaybackUrl(format="h.264", url=f"https://archive.org/download/bench_video/{i}.mp4") for i in range(10)],
+        metadata=metadata
+    )
+
+
+def measure(name: str, render: Callable[[], bytes], iterations: int) -> List[float]:
+    """
+    Render `iterations` responses and print latency percentiles and CPU time per request
+    """
+    latencies = []
+    cpu_start = time.process_time()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        render()
+        latencies.append(time.perf_counter() - start)
+    cpu = (time.process_time() - cpu_start) / iterations
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:<16} mean={statistics.mean(latencies) * 1e6:9.1f} us  p50={p50 * 1e6:9.1f} us  "
+          f"p99={p99 * 1e6:9.1f} us  cpu/request={cpu * 1e6:9.1f} us")
+    return latencies
+
+
+def main(iterations: int, files: int) -> None:
+    video = make_video(files)
+    field = create_response_field(name="Response_get_video_details", type_=Dict[str, Any])
+    loop = asyncio.new_event_loop()
+
+    def previous_path() -> bytes:
+        content = loop.run_until_complete(
+            serialize_response(field=field, response_content=video.to_dict(), is_coroutine=True)
+        )
+        return JSONResponse(content).body
+
+    def model_response_path() -> bytes:
+        return ModelResponse(video).body
+
+    print(f"Video with {files} metadata files, {len(model_response_path())} bytes per response")
+    measure("previous path", previous_path, iterations)
+    measure("ModelResponse", model_response_path, iterations)
+    loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000, help="Responses rendered per path")
+    parser.add_argument("--files", type=int, default=500, help="Files listed in the metadata blob")
+    args = parser.parse_args()
+    main(args.iterations, args.files)
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+Local stand-in for the archive.org advancedsearch and metadata APIs
+
+Serves the recorded responses of `benchmarks/fixtures` with configurable
+latency, jitter and error rate, so load tests measure the API rather than
+archive.org. Searches return `--num-found` documents cycled from the
+recorded ones, paginated by `rows` and `page`; identifier lookups and
+metadata requests return the recorded item under the requested identifier.
+
+Usage:
+    python -m benchmarks.fake_archive --port 8081 --latency 0.05 --jitter 0.02 --error-rate 0.01
+
+Point the API at it with:
+    ARCHIVE_API_BASE_URL=http://127.0.0.1:8081/advancedsearch.php
+    ARCHIVE_METADATA_URL=http://127.0.0.1:8081/metadata
+"""
+import os
+import random
+import asyncio
+import argparse
+from copy import deepcopy
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+import orjson
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixtures(path: str = FIXTURES_PATH) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Load the recorded advancedsearch response and metadata item
+
+    Returns:
+        The advancedsearch response and the metadata item, whose "{id}"
+        placeholders are replaced by the requested identifier
+    """
+    with open(os.path.join(path, "advancedsearch.json"), "rb") as file:
+        search = orjson.loads(file.read())
+    with open(os.path.join(path, "metadata.json"), "rb") as file:
+        item = orjson.loads(file.read())
+    return search, item
+
+
+class FakeArchive:
+    """
+    ASGI application answering like archive.org after an injected delay
+    """
+
+    def __init__(self,
+                 latency: float = 0.05,
+                 jitter: float = 0.0,
+                 error_rate: float = 0.0,
+                 error_status: int = 503,
+                 num_found: int = 1000,
+                 fixtures: str = FIXTURES_PATH,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            latency: Mean delay of every response in seconds
+            jitter: Maximum deviation from the mean delay in seconds
+            error_rate: Fraction of requests answered with `error_status`
+            error_status: Status of the injected errors
+            num_found: Number of documents matching every search
+            fixtures: Directory holding the recorded responses
+            seed: Seed of the delays and errors, for reproducible runs
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.num_found = num_found
+        self.random = random.Random(seed)
+        self.search, self.item = load_fixtures(fixtures)
+        self.docs: List[Dict[str, Any]] = self.search["response"]["docs"]
+        # The item is serialized once and identifiers are substituted in the bytes
+        self.item_json = orjson.dumps(self.item)
+        self.requests = 0
+        self.errors = 0
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def _search(self, params: Dict[str, str]) -> bytes:
+        """
+        Build an advancedsearch response for the query parameters
+        """
+        query = params.get("q", "")
+        fields = [name for name in params.get("fl", "").split(",") if name]
+        if query.startswith("identifier:(") and query.endswith(")"):
+            identifiers = query[len("identifier:("):-1].split(" OR ")
+            docs = [{**self.docs[index % len(self.docs)], "identifier": identifier} for index, identifier in enumerate(identifiers)]
+            num_found, start = len(docs), 0
+        else:
+            rows = int(params.get("rows", "50"))
+            page = max(1, int(params.get("page", "1")))
+            start = (page - 1) * rows
+            docs = [
+                {**self.docs[index % len(self.docs)], "identifier": f"{self.docs[index % len(self.docs)]['identifier']}_{index}"}
+                for index in range(start, min(start + rows, self.num_found))
+            ]
+            num_found = self.num_found
+        if fields:
+            docs = [{name: doc[name] for name in fields if name in doc} for doc in docs]
+        header = deepcopy(self.search["responseHeader"])
+        header["params"].update({"query": query, "qin": query, "fields": ",".join(fields), "start": start})
+        return orjson.dumps({"responseHeader": header, "response": {"numFound": num_found, "start": start, "docs": docs}})
+
+    def _metadata(self, path: str) -> bytes:
+        """
+        Build a metadata API response, or a single part of it for sub-paths
+        """
+        identifier, _, part = path[len("/metadata/"):].partition("/")
+        body = self.item_json.replace(b"{id}", identifier.encode())
+        if not part:
+            return body
+        item = orjson.loads(body)
+        return orjson.dumps({"result": item[part]} if part in item else {"error": f"no such part: {part}"})
+
+    async def __call__(self, scope: Dict[str, Any], receive, send) -> None:
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        self.requests += 1
+        await asyncio.sleep(self._delay())
+        path = scope["path"]
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            status, body = self.error_status, b'{"error": "injected"}'
+        elif path.startswith("/metadata/"):
+            status, body = 200, self._metadata(path)
+        elif path.endswith("/advancedsearch.php"):
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            status, body = 200, self._search({name: values[-1] for name, values in query.items()})
+        else:
+            # No scrape API, so streaming falls back to paginated searches
+            status, body = 404, b'{"error": "not found"}'
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean upstream delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maximum deviation from the delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503, help="Status of the injected errors")
+    parser.add_argument("--num-found", type=int, default=1000, help="Number of documents matching every search")
+    parser.add_argument("--fixtures", default=FIXTURES_PATH, help="Directory holding the recorded responses")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the delays and errors")
+    args = parser.parse_args()
+    app = FakeArchive(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, error_status=args.error_status,
+        num_found=args.num_found, fixtures=args.fixtures, seed=args.seed
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
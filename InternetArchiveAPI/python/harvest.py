@@ -0,0 +1,45 @@
+"""
+Harvest Internet Archive collections into the local search index
+"""
+import asyncio
+import argparse
+import logging
+from app.core.archive_service import ArchiveService
+from app.core.search_index import SearchIndex
+from app.core.harvester import Harvester
+
+
+async def main(args: argparse.Namespace) -> int:
+    service = ArchiveService(search_index=SearchIndex(args.index))
+    harvester = Harvester(service, service.search_index, concurrency=args.concurrency, rate=args.rate, page_size=args.page_size)
+    try:
+        results = await harvester.harvest(args.collections, full=args.full)
+    finally:
+        await service.aclose()
+
+    failed = 0
+    for collection_id, result in results.items():
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"{collection_id}: failed ({result})")
+        else:
+            print(f"{collection_id}: {result} items written")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Harvest Internet Archive collections into the local search index")
+    parser.add_argument("collections", nargs="*", default=Harvester.COLLECTIONS,
+                        help="Collections to harvest (default: ARCHIVE_HARVEST_COLLECTIONS)")
+    parser.add_argument("--index", default=SearchIndex.PATH or "archive_index.sqlite",
+                        help="SQLite file of the local index (default: ARCHIVE_INDEX_PATH)")
+    parser.add_argument("--concurrency", type=int, default=Harvester.CONCURRENCY, help="Collections harvested at once")
+    parser.add_argument("--rate", type=float, default=Harvester.RATE, help="Maximum upstream requests per second")
+    parser.add_argument("--page-size", type=int, default=Harvester.PAGE_SIZE, help="Items per upstream page")
+    parser.add_argument("--full", action="store_true", help="Ignore checkpoints and walk every item again")
+    args = parser.parse_args()
+    if not args.collections:
+        parser.error("no collections given and ARCHIVE_HARVEST_COLLECTIONS is empty")
+
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(asyncio.run(main(args)))
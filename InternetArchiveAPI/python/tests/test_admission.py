@@ -0,0 +1,165 @@
+"""
+Tests for the admission control of API requests
+"""
+import asyncio
+import unittest
+from unittest import mock
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api import router as router_module
+from app.api.admission import AdmissionController, AdmissionPolicy, AdmissionRejectedError, admission_controller
+from app.core.archive_service import ArchiveService
+from app.utils.http_client import HttpClient
+from tests.upstream import make_upstream
+
+CHEAP = "/"
+HEAVY = "/api/v1/videos/{video_id}"
+HEAVY_BATCH = "/api/v1/videos:batch"
+
+
+class TestAdmissionController(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for the per-route limits, wait queues and load shedding
+    """
+
+    def make_controller(self, max_concurrency: int = 10, deadline: float = 1.0) -> AdmissionController:
+        return AdmissionController(max_concurrency=max_concurrency, deadline=deadline, policies={
+            CHEAP: AdmissionPolicy(0, 10, 2),
+            HEAVY: AdmissionPolicy(2, 1, 2),
+            HEAVY_BATCH: AdmissionPolicy(2, 1, 2),
+        })
+
+    async def test_requests_wait_for_their_route_slot(self):
+        """
+        Test that requests beyond the limit of their route wait until a slot is released
+        """
+        controller = self.make_controller()
+        self.assertTrue(await controller.acquire(HEAVY))
+        waiting = asyncio.create_task(controller.acquire(HEAVY))
+        await asyncio.sleep(0)
+
+        self.assertFalse(waiting.done())
+        self.assertEqual(controller.stats()["routes"][HEAVY]["queued"], 1)
+        self.assertTrue(await controller.acquire(CHEAP))
+
+        controller.release(HEAVY, 0.01)
+        self.assertTrue(await waiting)
+        self.assertEqual(controller.stats()["routes"][HEAVY]["in_flight"], 1)
+
+    async def test_cheap_routes_are_admitted_first(self):
+        """
+        Test that a waiting cheap request is admitted before heavy requests
+        that arrived earlier
+        """
+        controller = self.make_controller(max_concurrency=1)
+        await controller.acquire(HEAVY)
+        admitted = []
+
+        async def request(route):
+            await controller.acquire(route)
+            admitted.append(route)
+
+        tasks = [asyncio.create_task(request(HEAVY_BATCH)), asyncio.create_task(request(CHEAP))]
+        await asyncio.sleep(0)
+        controller.release(HEAVY)
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(admitted, [CHEAP])
+        controller.release(CHEAP)
+        await asyncio.gather(*tasks)
+        self.assertEqual(admitted, [CHEAP, HEAVY_BATCH])
+
+    async def test_full_queue_is_shed(self):
+        """
+        Test that requests are rejected without waiting once their queue is full
+        """
+        controller = self.make_controller()
+        await controller.acquire(HEAVY)
+        waiting = [asyncio.create_task(controller.acquire(HEAVY)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        with self.assertRaises(AdmissionRejectedError) as context:
+            await controller.acquire(HEAVY)
+        self.assertEqual(context.exception.reason, "queue_full")
+        self.assertGreaterEqual(context.exception.retry_after, 1)
+        self.assertEqual(controller.stats()["routes"][HEAVY]["rejected"]["queue_full"], 1)
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+        self.assertEqual(controller.stats()["routes"][HEAVY]["queued"], 0)
+
+    async def test_long_estimated_wait_is_shed(self):
+        """
+        Test that requests whose estimated wait exceeds the deadline are
+        rejected with that estimate as their Retry-After
+        """
+        controller = self.make_controller()
+        await controller.acquire(HEAVY)
+        controller.release(HEAVY, 3.0)
+        await controller.acquire(HEAVY)
+
+        with self.assertRaises(AdmissionRejectedError) as context:
+            await controller.acquire(HEAVY)
+        self.assertEqual(context.exception.reason, "deadline")
+        self.assertEqual(context.exception.retry_after, 3.0)
+
+    async def test_wait_is_bounded_by_the_deadline(self):
+        """
+        Test that a request still waiting at the deadline is rejected
+        """
+        controller = self.make_controller(deadline=0.01)
+        await controller.acquire(HEAVY)
+
+        with self.assertRaises(AdmissionRejectedError) as context:
+            await controller.acquire(HEAVY)
+        self.assertEqual(context.exception.reason, "timeout")
+        self.assertEqual(controller.stats()["routes"][HEAVY]["queued"], 0)
+
+    async def test_unlimited_routes(self):
+        """
+        Test that routes without a policy are admitted without taking a slot
+        """
+        controller = self.make_controller()
+
+        self.assertFalse(await controller.acquire("/api/v1/videos/{video_id}/play/{file:path}"))
+        self.assertEqual(controller.in_flight, 0)
+
+
+class TestAdmissionMiddleware(unittest.TestCase):
+    """
+    Test cases for shedding requests in the app
+    """
+
+    def setUp(self):
+        service = ArchiveService(http_client=HttpClient(transport=make_upstream([])))
+        for patcher in (
+            mock.patch.object(router_module, "archive_service", service),
+            mock.patch.object(admission_controller, "_routes", {}),
+            mock.patch.object(admission_controller, "policies", {**admission_controller.policies, HEAVY: AdmissionPolicy(2, 1, 0)}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = TestClient(app)
+
+    def test_overloaded_route_answers_503(self):
+        """
+        Test that a request shed by its route answers 503 with Retry-After,
+        while other routes are still served, and that it is counted
+        """
+        asyncio.run(admission_controller.acquire(HEAVY))
+
+        response = self.client.get("/api/v1/videos/video1")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["retry-after"], "1")
+        self.assertEqual(self.client.get("/").status_code, 200)
+
+        stats = self.client.get("/api/v1/admission/stats").json()
+        self.assertEqual(stats["routes"][HEAVY]["rejected"]["queue_full"], 1)
+        self.assertEqual(stats["routes"][HEAVY]["in_flight"], 1)
+
+        admission_controller.release(HEAVY)
+        self.assertEqual(self.client.get("/api/v1/videos/video1").status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
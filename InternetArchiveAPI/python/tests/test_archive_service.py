@@ -0,0 +1,209 @@
+"""
+Tests for the ArchiveService
+"""
+import time
+import unittest
+import httpx
+from app.core.archive_service import ArchiveService
+from app.core.cache import ResponseCache, normalize_key
+from app.models.video import LazyMetadata
+from app.utils.http_client import HttpClient
+from tests.upstream import make_upstream
+
+
+class TestArchiveService(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for the ArchiveService against a stubbed upstream
+    """
+
+    async def asyncSetUp(self):
+        self.calls = []
+        self.service = ArchiveService(http_client=HttpClient(transport=make_upstream(self.calls)))
+
+    async def asyncTearDown(self):
+        await self.service.aclose()
+
+    async def test_search_collections(self):
+        """
+        Test that explore results include thumbnails
+        """
+        response = await self.service.search_collections(collection="*", rows=3)
+
+        self.assertEqual(response["numFound"], 3)
+        self.assertEqual(response["docs"][0]["thumbnail_url"], "https://archive.org/services/img/film0")
+
+    async def test_search_films_by_collection(self):
+        """
+        Test searching films within a collection
+        """
+        films = await self.service.search_films_by_collection("feature_films", rows=3)
+
+        self.assertEqual([film.identifier for film in films], ["film0", "film1", "film2"])
+
+    async def test_get_collection_with_films(self):
+        """
+        Test fetching a collection with its films
+        """
+        collection = await self.service.get_collection_with_films("feature_films", film_rows=3)
+
+        self.assertEqual(collection.identifier, "feature_films")
+        self.assertEqual(collection.rows, 3)
+        self.assertEqual(len(collection.films), 3)
+
+    async def test_get_video_details(self):
+        """
+        Test fetching video details with thumbnail and playback URLs
+        """
+        details = await self.service.get_video_details("video1")
+
+        self.assertEqual(details["identifier"], "video1")
+        self.assertEqual(details["thumbnail_url"], "https://archive.org/download/video1/video1_thumb.jpg")
+        self.assertEqual(details["playback_urls"], [
+            {"format": "h.264", "url": "https://archive.org/download/video1/video1.mp4"}
+        ])
+
+    async def test_item_metadata_is_cached_compact(self):
+        """
+        Test that item metadata is cached as raw JSON and decoded only on access
+        """
+        self.service.cache = ResponseCache(disk_path="")
+        details = await self.service.get_video_details("video1")
+
+        self.assertIsInstance(details["metadata"], LazyMetadata)
+        self.assertIsNone(details["metadata"]._decoded)
+        self.assertEqual(details["metadata"]["title"], "Title video1")
+        cached = self.service.cache.get("metadata", normalize_key("https://archive.org/metadata/video1"))
+        self.assertEqual(set(cached), {"files", "metadata_json"})
+
+    async def test_fields_are_pushed_upstream(self):
+        """
+        Test that projections narrow the fl list and the metadata API reads
+        """
+        details = await self.service.get_video_details("video1", fields="title,metadata.title")
+        films = await self.service.search_films_by_collection("feature_films", rows=3, fields="title")
+
+        self.assertEqual(details["metadata"]["title"], "Title video1")
+        self.assertEqual(len(films), 3)
+        self.assertTrue(any(call.endswith("/metadata/video1/metadata") for call in self.calls))
+        self.assertFalse(any(call.endswith("/metadata/video1") for call in self.calls))
+        searches = [httpx.URL(call) for call in self.calls if "advancedsearch" in call]
+        self.assertEqual({url.params["fl"] for url in searches}, {"identifier,title"})
+
+    async def test_collection_without_films_skips_the_search(self):
+        """
+        Test that the films search is skipped when the films are not selected
+        """
+        collection = await self.service.get_collection_with_films("feature_films", fields="identifier,title")
+
+        self.assertEqual(collection.films, [])
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_get_video_details_not_found(self):
+        """
+        Test that an unknown video returns None
+        """
+        self.assertIsNone(await self.service.get_video_details("missing"))
+
+    async def test_connection_pool_is_reused(self):
+        """
+        Test that consecutive calls share the same pooled session
+        """
+        await self.service.search_films_by_collection("feature_films")
+        client = self.service.http_client.client
+        await self.service.search_films_by_collection("feature_films")
+
+        self.assertIs(self.service.http_client.client, client)
+        self.assertEqual(len(self.calls), 2)
+
+
+class TestArchiveServiceBatchLookup(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for the multi-identifier lookup path
+    """
+
+    async def asyncSetUp(self):
+        self.calls = []
+        self.service = ArchiveService(http_client=HttpClient(
+            transport=make_upstream(self.calls), rate_limits={"search": 0, "metadata": 0}
+        ))
+
+    async def asyncTearDown(self):
+        await self.service.aclose()
+
+    async def test_lookup_identifiers_maps_docs_back(self):
+        """
+        Test that one query resolves several identifiers and reports missing ones
+        """
+        docs = await self.service.lookup_identifiers(["video1", "missing1", "video2"])
+
+        self.assertEqual(docs["video1"]["title"], "Title video1")
+        self.assertEqual(docs["video2"]["title"], "Title video2")
+        self.assertIsNone(docs["missing1"])
+        self.assertEqual(len(self.calls), 1)
+        self.assertIn("rows=3", self.calls[0])
+
+    async def test_identifiers_are_chunked(self):
+        """
+        Test that large batches are split by chunk size and query length
+        """
+        self.service.LOOKUP_CHUNK_SIZE = 40
+        identifiers = [f"video{i}" for i in range(100)]
+
+        self.assertEqual([len(chunk) for chunk in self.service._chunk_identifiers(identifiers)], [40, 40, 20])
+
+        self.service.LOOKUP_MAX_QUERY_LENGTH = 100
+        self.assertTrue(all(
+            sum(len(identifier) + 4 for identifier in chunk) <= 100
+            for chunk in self.service._chunk_identifiers(identifiers)
+        ))
+
+    async def test_batch_details_use_few_search_calls(self):
+        """
+        Test that resolving 100 videos costs a handful of search calls
+        """
+        identifiers = [f"video{i}" for i in range(100)]
+        details = await self.service.get_videos_details(identifiers)
+
+        search_calls = [call for call in self.calls if "/metadata/" not in call]
+        self.assertEqual(len(details), 100)
+        self.assertEqual(details["video42"]["identifier"], "video42")
+        self.assertLessEqual(len(search_calls), 2)
+
+
+class TestArchiveServiceFanOut(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for the concurrent upstream fan-out
+    """
+    DELAY = 0.2
+
+    async def asyncSetUp(self):
+        self.service = ArchiveService(http_client=HttpClient(transport=make_upstream(delay=self.DELAY)))
+
+    async def asyncTearDown(self):
+        await self.service.aclose()
+
+    async def test_collection_requests_run_concurrently(self):
+        """
+        Test that the collection lookup and films search overlap
+        """
+        start = time.perf_counter()
+        collection = await self.service.get_collection_with_films("feature_films")
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(collection.films), 3)
+        self.assertLess(elapsed, self.DELAY * 1.75)
+
+    async def test_video_requests_run_concurrently(self):
+        """
+        Test that the basic lookup and metadata requests overlap
+        """
+        start = time.perf_counter()
+        details = await self.service.get_video_details("video1")
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(details["identifier"], "video1")
+        self.assertLess(elapsed, self.DELAY * 1.75)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,356 @@
+"""
+Tests for the response cache
+"""
+import os
+import time
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+import httpx
+from app.core.cache import ResponseCache, normalize_key, pack, unpack
+from app.core.archive_service import ArchiveService
+from app.utils.http_client import HttpClient
+from tests.upstream import make_upstream
+
+
+class TestNormalizeKey(unittest.TestCase):
+    """
+    Test cases for the cache key normalization
+    """
+
+    def test_equivalent_queries_share_a_key(self):
+        """
+        Test that parameter order, URL/params split and sort spacing do not matter
+        """
+        first = normalize_key("https://archive.org/advancedsearch.php?rows=10&sort=stars+desc&q=collection:(a)")
+        second = normalize_key("https://archive.org/advancedsearch.php", {"q": "collection:(a)", "sort": "stars  desc", "rows": 10})
+
+        self.assertEqual(first, second)
+
+    def test_different_queries_have_different_keys(self):
+        """
+        Test that a different page yields a different key
+        """
+        first = normalize_key("https://archive.org/advancedsearch.php", {"q": "collection:(a)", "page": 1})
+        second = normalize_key("https://archive.org/advancedsearch.php", {"q": "collection:(a)", "page": 2})
+
+        self.assertNotEqual(first, second)
+
+
+class TestResponseCache(unittest.TestCase):
+    """
+    Test cases for the tiered response cache
+    """
+
+    def test_hit_and_miss_counters(self):
+        """
+        Test that lookups update the hit and miss counters
+        """
+        cache = ResponseCache(disk_path="")
+        self.assertIsNone(cache.get("search", "key"))
+        cache.set("search", "key", {"docs": []})
+
+        self.assertEqual(cache.get("search", "key"), {"docs": []})
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_lru_eviction_by_entries(self):
+        """
+        Test that the least recently used entry is evicted first
+        """
+        cache = ResponseCache(max_entries=2, disk_path="")
+        cache.set("search", "a", 1)
+        cache.set("search", "b", 2)
+        cache.get("search", "a")
+        cache.set("search", "c", 3)
+
+        self.assertEqual(cache.get("search", "a"), 1)
+        self.assertIsNone(cache.get("search", "b"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_eviction_by_bytes(self):
+        """
+        Test that the byte budget bounds the memory tier
+        """
+        cache = ResponseCache(max_bytes=50, disk_path="")
+        cache.set("search", "a", "x" * 30)
+        cache.set("search", "b", "y" * 30)
+
+        self.assertIsNone(cache.get("search", "a"))
+        self.assertLessEqual(cache.stats()["bytes"], 50)
+
+    def test_ttl_expiry(self):
+        """
+        Test that entries expire after the endpoint TTL and that TTL 0 disables caching
+        """
+        cache = ResponseCache(disk_path="", ttls={"search": 0.05, "metadata": 0})
+        cache.set("search", "a", 1)
+        cache.set("metadata", "b", 2)
+        time.sleep(0.06)
+
+        self.assertIsNone(cache.get("search", "a"))
+        self.assertIsNone(cache.get("metadata", "b"))
+
+    def test_stale_lookup(self):
+        """
+        Test that expired entries are served as stale within the grace period only
+        """
+        cache = ResponseCache(disk_path="", ttls={"search": 0.05}, stale_ttl=0.1)
+        cache.set("search", "a", 1)
+        time.sleep(0.06)
+
+        self.assertIsNone(cache.get("search", "a"))
+        self.assertEqual(cache.lookup("search", "a"), (1, False))
+        time.sleep(0.1)
+        self.assertIsNone(cache.lookup("search", "a"))
+
+    def test_disk_tier_survives_restart(self):
+        """
+        Test that entries stored on disk are available to a new cache instance
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.sqlite")
+            cache = ResponseCache(disk_path=path)
+            cache.set("metadata", "item", {"files": []})
+            cache.close()
+
+            restarted = ResponseCache(disk_path=path)
+            self.assertEqual(restarted.get("metadata", "item"), {"files": []})
+            self.assertEqual(restarted.stats()["disk_hits"], 1)
+            restarted.close()
+
+    def test_revalidate_renews_entry(self):
+        """
+        Test that upstream validators are kept on disk and that revalidation renews the TTL
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.sqlite")
+            cache = ResponseCache(disk_path=path, ttls={"search": 0.05}, stale_ttl=0)
+            cache.set("search", "a", {"docs": []}, {"etag": '"v1"'})
+            cache.close()
+
+            restarted = ResponseCache(disk_path=path, ttls={"search": 0.05}, stale_ttl=0)
+            time.sleep(0.06)
+            self.assertIsNone(restarted.get("search", "a"))
+            self.assertEqual(restarted.validators("a"), {"etag": '"v1"'})
+            self.assertEqual(restarted.revalidate("search", "a"), {"docs": []})
+            self.assertEqual(restarted.get("search", "a"), {"docs": []})
+            self.assertIsNone(restarted.revalidate("search", "missing"))
+            restarted.close()
+
+
+class TestSharedDiskTier(unittest.TestCase):
+    """
+    Test cases for the disk tier shared by several workers
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite")
+
+    def make_cache(self, **kwargs) -> ResponseCache:
+        cache = ResponseCache(disk_path=self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_binary_encoding(self):
+        """
+        Test that values round-trip raw, compressed and from JSON text rows
+        """
+        encoded = b'{"docs":[' + b'{"identifier":"film"},' * 100 + b'{}]}'
+
+        self.assertEqual(unpack(pack(encoded, 0)), encoded)
+        self.assertEqual(unpack(pack(encoded, 1024)), encoded)
+        self.assertLess(len(pack(encoded, 1024)), len(encoded))
+        self.assertEqual(unpack(b'{"a": 1}'), b'{"a": 1}')
+
+    def test_entries_are_shared(self):
+        """
+        Test that an entry stored by one worker is served to another
+        """
+        first = self.make_cache(compress_min_size=1)
+        second = self.make_cache()
+        second.lookup("search", "a")
+        first.set("search", "a", {"docs": [1, 2]})
+        first.flush()
+
+        self.assertEqual(second.get("search", "a"), {"docs": [1, 2]})
+
+    def test_newer_entries_replace_stale_ones(self):
+        """
+        Test that a stale entry in memory is replaced by a newer one stored by another worker
+        """
+        first = self.make_cache(ttls={"search": 0.05})
+        second = self.make_cache(ttls={"search": 60})
+        first.set("search", "a", 1)
+        self.assertEqual(first.get("search", "a"), 1)
+        time.sleep(0.06)
+        expires_at = first.expiry("a")
+        second.set("search", "a", 2)
+        second.flush()
+
+        self.assertEqual(first.updated_value("a", expires_at), 2)
+        self.assertEqual(first.get("search", "a"), 2)
+
+    def test_disk_tier_is_pruned(self):
+        """
+        Test that entries past every grace period are removed from disk, and
+        that the disk tier is bounded by its number of entries
+        """
+        cache = self.make_cache(ttls={"search": 0.05}, stale_ttl=0, stale_if_error_ttl=0, disk_max_entries=10)
+        with mock.patch.object(ResponseCache, "PRUNE_INTERVAL", 0):
+            cache.set("search", "expired", 1)
+            time.sleep(0.06)
+            for index in range(20):
+                cache.set("search", f"key{index}", index)
+            cache.flush()
+
+        self.assertIsNone(cache.disk.get("expired"))
+        self.assertLessEqual(cache.disk._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0], 10)
+        self.assertIsNotNone(cache.disk.get("key19"))
+        self.assertGreater(cache.stats()["disk_pruned"], 10)
+
+    def test_locks(self):
+        """
+        Test that a key is locked by one worker at a time, that the lock is
+        seen by reads, and that locks expire
+        """
+        first = self.make_cache(lock_timeout=0.05)
+        second = self.make_cache(lock_timeout=0.05)
+
+        async def run():
+            self.assertTrue(await first.acquire("a"))
+            self.assertTrue(second.locked("a"))
+            self.assertFalse(await second.acquire("a"))
+            self.assertTrue(await second.acquire("b"))
+            first.release("a")
+            first.flush()
+            self.assertFalse(second.locked("a"))
+            self.assertTrue(await second.acquire("a"))
+            time.sleep(0.06)
+            self.assertFalse(first.locked("a"))
+            self.assertTrue(await first.acquire("a"))
+            self.assertTrue(await ResponseCache(disk_path="", shared_locks=True).acquire("a"))
+
+        asyncio.run(run())
+
+    def test_memory_tier_can_be_disabled(self):
+        """
+        Test that without the in-process tier every hit is read from the
+        shared disk tier, so workers hold no decoded copy of its entries
+        """
+        first = self.make_cache(max_entries=0)
+        second = self.make_cache(max_entries=0)
+        first.set("search", "a", {"docs": [1]})
+        first.flush()
+
+        self.assertEqual(second.get("search", "a"), {"docs": [1]})
+        self.assertEqual(first.get("search", "a"), {"docs": [1]})
+        self.assertEqual(len(first.memory) + len(second.memory), 0)
+        self.assertEqual(first.stats()["disk_hits"], 1)
+
+
+class TestArchiveServiceSharedCache(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for ArchiveService workers sharing the disk cache tier
+    """
+
+    async def test_workers_fetch_once(self):
+        """
+        Test that concurrent workers cost a single upstream fetch per query
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.sqlite")
+            calls = []
+            services = [
+                ArchiveService(
+                    http_client=HttpClient(transport=make_upstream(calls, delay=0.1)),
+                    cache=ResponseCache(disk_path=path)
+                )
+                for _ in range(3)
+            ]
+            acquires = []
+            for service in services:
+                acquire = mock.Mock(wraps=service.cache.disk.acquire)
+                service.cache.disk.acquire = acquire
+                acquires.append(acquire)
+            try:
+                results = await asyncio.gather(*(service.get_video_details("video1") for service in services))
+            finally:
+                for service in services:
+                    await service.aclose()
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+        # One item metadata request and one identifier lookup
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(sum(service.cache.shared_waits for service in services), 4)
+        # Waiting workers poll with reads, each worker tries the lock of a key at most once
+        self.assertLessEqual(sum(acquire.call_count for acquire in acquires), 6)
+
+
+class TestArchiveServiceCache(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for the ArchiveService in front of the cache
+    """
+
+    async def asyncSetUp(self):
+        self.calls = []
+        self.service = ArchiveService(
+            http_client=HttpClient(transport=make_upstream(self.calls)),
+            cache=ResponseCache(disk_path="")
+        )
+
+    async def asyncTearDown(self):
+        await self.service.aclose()
+
+    async def test_repeated_queries_hit_the_cache(self):
+        """
+        Test that identical queries reach the upstream only once
+        """
+        first = await self.service.get_video_details("video1")
+        second = await self.service.get_video_details("video1")
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_cached_explore_response_is_not_mutated(self):
+        """
+        Test that repeated explore calls return consistent documents
+        """
+        first = await self.service.search_collections(rows=3)
+        second = await self.service.search_collections(rows=3)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_expired_entry_is_revalidated_upstream(self):
+        """
+        Test that an expired response with an ETag is revalidated with a conditional request
+        """
+        conditions = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            conditions.append(request.headers.get("If-None-Match"))
+            if request.headers.get("If-None-Match") == '"v1"':
+                return httpx.Response(304, headers={"ETag": '"v1"'})
+            return httpx.Response(200, json={"response": {"numFound": 1, "docs": [{"identifier": "film1"}]}}, headers={"ETag": '"v1"'})
+
+        http_client = HttpClient(transport=httpx.MockTransport(handler))
+        service = ArchiveService(http_client=http_client, cache=ResponseCache(disk_path="", ttls={"search": 0.05}, stale_ttl=0))
+        try:
+            first = await service.search_films_by_collection("feature_films")
+            time.sleep(0.06)
+            second = await service.search_films_by_collection("feature_films")
+        finally:
+            await service.aclose()
+
+        self.assertEqual(first, second)
+        self.assertEqual(conditions, [None, '"v1"'])
+        self.assertEqual(http_client.not_modified, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
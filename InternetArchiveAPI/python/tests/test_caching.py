@@ -0,0 +1,104 @@
+"""
+Tests for the ETag and Cache-Control handling of the API
+"""
+import unittest
+from unittest import mock
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import router as router_module
+from app.api.caching import CachePolicy, HttpCachingMiddleware, entity_tag, matches
+from tests.test_router import RouterTestCase
+
+
+class TestEntityTags(unittest.TestCase):
+    """
+    Test cases for the ETag helpers
+    """
+
+    def test_entity_tag_is_a_content_hash(self):
+        """
+        Test that equal bodies share a strong ETag and different bodies do not
+        """
+        self.assertEqual(entity_tag(b'{"a":1}'), entity_tag(b'{"a":1}'))
+        self.assertNotEqual(entity_tag(b'{"a":1}'), entity_tag(b'{"a":2}'))
+        self.assertTrue(entity_tag(b"").startswith(b'"'))
+
+    def test_matches(self):
+        """
+        Test the If-None-Match lists, wildcard and weak comparison
+        """
+        self.assertTrue(matches(b'"x", "y"', b'"y"'))
+        self.assertTrue(matches(b'W/"y"', b'"y"'))
+        self.assertTrue(matches(b"*", b'"y"'))
+        self.assertFalse(matches(b'"x"', b'"y"'))
+
+
+class TestHttpCaching(RouterTestCase):
+    """
+    Test cases for conditional requests to the API
+    """
+
+    def make_client(self, **kwargs) -> TestClient:
+        app = FastAPI()
+        app.include_router(router_module.router)
+        app.add_middleware(HttpCachingMiddleware, **kwargs)
+        return TestClient(app)
+
+    def test_etag_and_cache_control(self):
+        """
+        Test that cacheable routes carry an ETag and their max-age
+        """
+        response = self.make_client().get("/api/v1/videos/video1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["etag"], entity_tag(response.content).decode())
+        self.assertEqual(response.headers["cache-control"], f"public, max-age={HttpCachingMiddleware.MAX_AGE_VIDEO}")
+
+    def test_matching_request_is_answered_without_the_route(self):
+        """
+        Test that a remembered ETag answers 304 without reaching the service
+        """
+        client = self.make_client()
+        etag = client.get("/api/v1/videos/video1").headers["etag"]
+        calls = len(self.calls)
+        with mock.patch.object(self.service, "get_video_details") as get_video_details:
+            response = client.get("/api/v1/videos/video1", headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response.headers["etag"], etag)
+        get_video_details.assert_not_called()
+        self.assertEqual(len(self.calls), calls)
+
+    def test_matching_request_is_compared_after_the_route(self):
+        """
+        Test that without a remembered ETag the new body is compared to If-None-Match
+        """
+        client = self.make_client(policies={"/api/v1/videos/{video_id}": CachePolicy(60)})
+        etag = client.get("/api/v1/videos/video1").headers["etag"]
+
+        self.assertEqual(client.get("/api/v1/videos/video1", headers={"If-None-Match": etag}).status_code, 304)
+        self.assertEqual(client.get("/api/v1/videos/video1", headers={"If-None-Match": '"other"'}).status_code, 200)
+        self.assertEqual(client.get("/api/v1/videos/video1?fields=title", headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_stats_are_not_stored(self):
+        """
+        Test that statistics routes are marked as not cacheable and carry no ETag
+        """
+        response = self.make_client().get("/api/v1/cache/stats")
+
+        self.assertEqual(response.headers["cache-control"], "no-store")
+        self.assertNotIn("etag", response.headers)
+
+    def test_errors_carry_no_etag(self):
+        """
+        Test that error responses are passed through unchanged
+        """
+        response = self.make_client().get("/api/v1/videos/missing1")
+
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("etag", response.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+Tests for the response compression
+"""
+import gzip
+import unittest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from app.api import router as router_module
+from app.api.caching import HttpCachingMiddleware
+from app.api.compression import CompressionMiddleware
+from app.utils.compression import GzipCodec, negotiate
+from tests.test_router import RouterTestCase
+
+
+class CountingCodec(GzipCodec):
+    """
+    gzip codec counting its whole-body compressions
+    """
+
+    def __init__(self):
+        super().__init__(6)
+        self.compressions = 0
+
+    def compress(self, data: bytes) -> bytes:
+        self.compressions += 1
+        return super().compress(data)
+
+
+class TestNegotiation(unittest.TestCase):
+    """
+    Test cases for the Accept-Encoding negotiation
+    """
+
+    def test_negotiate(self):
+        """
+        Test that qualities, the wildcard and the server preference are honored
+        """
+        available = ["br", "zstd", "gzip"]
+
+        self.assertEqual(negotiate("gzip, br", available), "br")
+        self.assertEqual(negotiate("gzip, br;q=0.5", available), "gzip")
+        self.assertEqual(negotiate("gzip;q=0, *", available), "br")
+        self.assertEqual(negotiate("deflate", available), None)
+        self.assertEqual(negotiate("", available), None)
+        self.assertEqual(negotiate("br", ["gzip"]), None)
+
+
+class TestCompression(RouterTestCase):
+    """
+    Test cases for compressed API responses
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.codec = CountingCodec()
+
+    def make_client(self, min_size: int = 0) -> TestClient:
+        app = FastAPI()
+        app.include_router(router_module.router)
+        app.add_middleware(HttpCachingMiddleware)
+        app.add_middleware(CompressionMiddleware, min_size=min_size, codecs={"gzip": self.codec})
+        return TestClient(app)
+
+    def test_response_is_compressed(self):
+        """
+        Test that accepted codings compress the body and get their own ETag
+        """
+        client = self.make_client()
+        plain = client.get("/api/v1/videos/video1", headers={"Accept-Encoding": "identity"})
+        response = client.get("/api/v1/videos/video1", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertEqual(response.json(), plain.json())
+        self.assertNotIn("content-encoding", plain.headers)
+        self.assertEqual(response.headers["etag"], plain.headers["etag"][:-1] + '-gzip"')
+
+    def test_small_responses_are_not_compressed(self):
+        """
+        Test that bodies under the size threshold are sent as is
+        """
+        response = self.make_client(min_size=1 << 20).get("/api/v1/videos/video1", headers={"Accept-Encoding": "gzip"})
+
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(self.codec.compressions, 0)
+
+    def test_compressed_bodies_are_cached(self):
+        """
+        Test that identical responses are compressed once
+        """
+        client = self.make_client()
+        first = client.get("/api/v1/videos/video1", headers={"Accept-Encoding": "gzip"})
+        second = client.get("/api/v1/videos/video1", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.codec.compressions, 1)
+
+    def test_conditional_request_with_encoded_etag(self):
+        """
+        Test that the ETag of a compressed response revalidates it
+        """
+        client = self.make_client()
+        etag = client.get("/api/v1/videos/video1", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+        response = client.get("/api/v1/videos/video1", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], etag)
+
+    def test_streamed_response_is_compressed_by_chunk(self):
+        """
+        Test that streamed responses are compressed incrementally
+        """
+        async def lines():
+            for i in range(3):
+                yield f'{{"line": {i}}}\n'.encode()
+
+        app = FastAPI()
+        app.get("/stream")(lambda: StreamingResponse(lines(), media_type="application/x-ndjson"))
+        app.add_middleware(CompressionMiddleware, min_size=0, codecs={"gzip": self.codec})
+        with TestClient(app).stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+            raw = b"".join(response.iter_raw())
+
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(gzip.decompress(raw).decode().splitlines(), ['{"line": 0}', '{"line": 1}', '{"line": 2}'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests for the field projections
+"""
+import unittest
+from app.models.film import Film
+from app.models.video import LazyMetadata
+from app.utils.fields import parse_fields, join_fields, search_fields, project
+
+
+class TestFields(unittest.TestCase):
+    """
+    Test cases for parsing and applying field projections
+    """
+
+    def test_parse_fields(self):
+        """
+        Test that field paths are parsed into a nested projection
+        """
+        self.assertIsNone(parse_fields(None))
+        self.assertIsNone(parse_fields(" , "))
+        self.assertEqual(
+            parse_fields("identifier, title,metadata.runtime,metadata.title"),
+            {"identifier": None, "title": None, "metadata": {"runtime": None, "title": None}}
+        )
+        # Selecting a whole field wins over selecting some of its sub-fields
+        self.assertEqual(parse_fields("metadata.title,metadata"), {"metadata": None})
+        self.assertEqual(parse_fields("metadata,metadata.title"), {"metadata": None})
+
+    def test_invalid_fields_raise(self):
+        """
+        Test that malformed field paths are rejected
+        """
+        for fields in ("title;drop", "metadata.", "a b"):
+            with self.assertRaises(ValueError):
+                parse_fields(fields)
+
+    def test_join_fields_round_trips(self):
+        """
+        Test that a projection formats back to its field paths
+        """
+        self.assertEqual(join_fields(parse_fields("title,films.identifier,films.title")), "title,films.identifier,films.title")
+        self.assertIsNone(join_fields(None))
+
+    def test_search_fields_always_include_identifier(self):
+        """
+        Test that the upstream field list keeps the identifier and the available fields only
+        """
+        available = ["identifier", "title", "description"]
+        self.assertEqual(search_fields(None, available), "identifier,title,description")
+        self.assertEqual(search_fields(parse_fields("title,thumbnail_url"), available), "identifier,title")
+
+    def test_project(self):
+        """
+        Test projecting models, lists and lazily decoded metadata
+        """
+        films = [Film(identifier="f1", title="F1", description="D1")]
+        self.assertEqual(project(films, parse_fields("title")), [{"title": "F1"}])
+        self.assertIs(project(films, None), films)
+
+        metadata = LazyMetadata('{"title": "V", "runtime": "1:02:00"}')
+        self.assertEqual(project({"metadata": metadata}, parse_fields("metadata.runtime,missing")), {"metadata": {"runtime": "1:02:00"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
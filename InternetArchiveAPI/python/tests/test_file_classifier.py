@@ -0,0 +1,81 @@
+"""
+Tests for the file classifier
+"""
+import unittest
+from app.core.file_classifier import FileClassifier
+
+
+FILES = [
+    {"name": "film.avi", "format": "Cinepack", "source": "original", "size": "900000000"},
+    {"name": "film.ogv", "format": "Ogg Video", "source": "derivative", "original": "film.avi"},
+    {"name": "film_512kb.mp4", "format": "512Kb MPEG4", "source": "derivative", "original": "film.avi", "size": "200000000", "length": "3600"},
+    {"name": "film.mp4", "format": "h.264", "source": "derivative", "original": "film.avi", "size": "300000000", "length": "3600"},
+    {"name": "film.HD.mp4", "format": "h.264", "source": "derivative", "original": "film.avi", "size": "900000000", "length": "3600"},
+    {"name": "film.thumbs/film_000001.jpg", "format": "Thumbnail", "source": "derivative", "original": "film.avi"},
+    {"name": "__ia_thumb.jpg", "format": "Item Tile", "source": "original"},
+    {"name": "poster.jpg", "format": "JPEG", "source": "original"},
+]
+
+
+class TestFileClassifier(unittest.TestCase):
+    """
+    Test cases for indexing and ranking item files
+    """
+
+    def test_files_are_indexed(self):
+        """
+        Test that files are indexed by extension, format and derivative source,
+        only once the indexes are used
+        """
+        classified = FileClassifier().classify("film", FILES)
+        self.assertNotIn("by_extension", vars(classified))
+
+        self.assertEqual([f["name"] for f in classified.by_extension["jpg"]], ["film.thumbs/film_000001.jpg", "__ia_thumb.jpg", "poster.jpg"])
+        self.assertEqual(len(classified.by_format["h.264"]), 2)
+        self.assertEqual(len(classified.derivatives["film.avi"]), 5)
+
+    def test_playback_ranking(self):
+        """
+        Test that playback files are ranked by format, then bitrate and size
+        """
+        classified = FileClassifier().classify("film", FILES)
+
+        self.assertEqual(
+            [f["name"] for f in classified.playback],
+            ["film.HD.mp4", "film.mp4", "film_512kb.mp4", "film.avi"]
+        )
+
+    def test_best_thumbnail(self):
+        """
+        Test that the thumbnail with the most preferred format is picked
+        """
+        self.assertEqual(FileClassifier().classify("film", FILES).thumbnail["name"], "__ia_thumb.jpg")
+        self.assertIsNone(FileClassifier().classify("film", [FILES[0], FILES[7]]).thumbnail)
+
+    def test_rules_are_configurable(self):
+        """
+        Test that the extensions and format preferences can be overridden
+        """
+        classifier = FileClassifier(playback_extensions=["ogv", "mp4"], playback_formats=["Ogg Video"], thumbnail_formats=["JPEG"])
+        classified = classifier.classify("film", FILES)
+
+        self.assertEqual(classified.playback[0]["name"], "film.ogv")
+        self.assertNotIn("film.avi", [f["name"] for f in classified.playback])
+        self.assertEqual(classified.thumbnail["name"], "poster.jpg")
+
+    def test_classification_is_cached_per_item(self):
+        """
+        Test that the same files list is classified once, and a new list again
+        """
+        classifier = FileClassifier(cache_size=1)
+        first = classifier.classify("film", FILES)
+
+        self.assertIs(classifier.classify("film", FILES), first)
+        self.assertIsNot(classifier.classify("film", list(FILES)), first)
+        classifier.classify("other", FILES)
+        self.assertEqual(len(classifier._cache), 1)
+        self.assertEqual(classifier.stats(), {"hits": 1, "misses": 3, "entries": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
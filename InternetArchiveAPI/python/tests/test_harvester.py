@@ -0,0 +1,118 @@
+"""
+Tests for the incremental harvester
+"""
+import threading
+import unittest
+from unittest import mock
+import httpx
+from app.core.archive_service import ArchiveService
+from app.core.search_index import SearchIndex
+from app.core.harvester import Harvester
+from app.utils.http_client import HttpClient
+
+
+class TestHarvester(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for harvesting collections into the local index
+    """
+    ITEMS = 250
+
+    async def asyncSetUp(self):
+        self.requests = []
+        self.fail_cursor = None
+        self.index = SearchIndex(":memory:")
+        self.service = ArchiveService(
+            http_client=HttpClient(transport=httpx.MockTransport(self.handler)),
+            search_index=self.index
+        )
+        self.harvester = Harvester(self.service, self.index, rate=1000, page_size=100)
+
+    async def asyncTearDown(self):
+        await self.service.aclose()
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        """
+        Scrape API serving ITEMS items, or only two new ones for incremental queries
+        """
+        self.requests.append(request.url.params)
+        cursor = request.url.params.get("cursor")
+        if cursor is not None and cursor == self.fail_cursor:
+            return httpx.Response(503)
+        if "publicdate:[" in request.url.params.get("q", ""):
+            identifiers = [f"item{self.ITEMS + i}" for i in range(2)]
+            return httpx.Response(200, json={"items": [
+                {"identifier": identifier, "title": identifier, "mediatype": "movies", "publicdate": "2030-01-01T00:00:00Z"}
+                for identifier in identifiers
+            ]})
+        start = int(cursor or 0)
+        end = min(start + int(request.url.params["count"]), self.ITEMS)
+        body = {"items": [
+            {"identifier": f"item{i}", "title": f"Item {i}", "subject": ["silent"], "mediatype": "movies", "avg_rating": i % 5}
+            for i in range(start, end)
+        ]}
+        if end < self.ITEMS:
+            body["cursor"] = str(end)
+        return httpx.Response(200, json=body)
+
+    async def test_first_run_walks_everything(self):
+        """
+        Test that the first run indexes every item and marks the collection as harvested
+        """
+        results = await self.harvester.harvest(["feature_films"])
+
+        self.assertEqual(results, {"feature_films": 250})
+        self.assertTrue(self.index.is_harvested("feature_films", "movies"))
+        self.assertEqual(self.index.search("feature_films", mediatype="movies", rows=1)[0], 250)
+        self.assertIn("avg_rating", self.requests[0]["fields"])
+
+    async def test_incremental_run_only_fetches_new_items(self):
+        """
+        Test that later runs query items newer than the checkpoint
+        """
+        await self.harvester.harvest(["feature_films"])
+        self.requests.clear()
+        results = await self.harvester.harvest(["feature_films"])
+
+        self.assertEqual(results, {"feature_films": 2})
+        self.assertEqual(len(self.requests), 1)
+        self.assertIn("publicdate:[", self.requests[0]["q"])
+        self.assertEqual(self.index.search("feature_films", mediatype="movies", rows=1)[0], 252)
+
+    async def test_interrupted_run_resumes_from_checkpoint(self):
+        """
+        Test that a failed run resumes from the last checkpointed cursor
+        """
+        self.fail_cursor = "200"
+        results = await self.harvester.harvest(["feature_films"])
+        self.assertIsInstance(results["feature_films"], Exception)
+        self.assertEqual(self.index.get_checkpoint("feature_films")["cursor"], "200")
+        self.assertFalse(self.index.is_harvested("feature_films"))
+
+        self.fail_cursor = None
+        self.requests.clear()
+        results = await self.harvester.harvest(["feature_films"])
+
+        self.assertEqual(results, {"feature_films": 50})
+        self.assertEqual(self.requests[0]["cursor"], "200")
+        self.assertTrue(self.index.is_harvested("feature_films"))
+
+    async def test_index_writes_run_off_the_event_loop(self):
+        """
+        Test that pages are written to the index outside the event loop thread
+        """
+        threads = set()
+        add_documents = self.index.add_documents
+
+        def record(*args, **kwargs):
+            threads.add(threading.current_thread())
+            return add_documents(*args, **kwargs)
+
+        with mock.patch.object(self.index, "add_documents", record):
+            await self.harvester.harvest(["feature_films"])
+
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Tests for hedged requests
+"""
+import asyncio
+import unittest
+import httpx
+from app.core.archive_service import ArchiveService
+from app.utils.hedging import Hedger
+from app.utils.http_client import HttpClient
+from tests.upstream import make_upstream
+
+
+class TestHedger(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for hedging slow requests
+    """
+
+    def make_request(self, delays):
+        """
+        Build a request taking the given delays on successive calls, then answering immediately
+        """
+        self.started = 0
+        self.cancelled = 0
+
+        async def request():
+            index = self.started
+            self.started += 1
+            try:
+                await asyncio.sleep(delays[index] if index < len(delays) else 0)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+            return index
+        return request
+
+    async def test_fast_request_is_not_hedged(self):
+        """
+        Test that a request answering within the delay is sent once
+        """
+        hedger = Hedger(initial_delay=0.1, max_rate=1)
+
+        self.assertEqual(await hedger.run(self.make_request([0])), 0)
+        self.assertEqual(self.started, 1)
+        self.assertEqual(hedger.hedged, 0)
+
+    async def test_slow_request_is_hedged(self):
+        """
+        Test that the hedge answers for a slow request and the primary is cancelled
+        """
+        hedger = Hedger(initial_delay=0.05, min_delay=0, max_rate=1)
+
+        self.assertEqual(await hedger.run(self.make_request([1, 0])), 1)
+        await asyncio.sleep(0)
+        self.assertEqual(self.cancelled, 1)
+        self.assertEqual((hedger.hedged, hedger.hedge_wins, hedger.primary_wins), (1, 1, 0))
+
+    async def test_hedge_rate_is_capped(self):
+        """
+        Test that no more than max_rate of the requests are hedged
+        """
+        hedger = Hedger(initial_delay=0.01, min_delay=0, max_rate=0.5)
+
+        await hedger.run(self.make_request([0.03]))
+        self.assertEqual((hedger.hedged, hedger.skipped), (0, 1))
+        await hedger.run(self.make_request([0.03]))
+        self.assertEqual(hedger.hedged, 1)
+
+    async def test_failed_primary_falls_back_to_hedge(self):
+        """
+        Test that a hedge answering after a failed primary is used
+        """
+        hedger = Hedger(initial_delay=0.01, min_delay=0, max_rate=1)
+        calls = []
+
+        async def request():
+            calls.append(None)
+            if len(calls) == 1:
+                await asyncio.sleep(0.02)
+                raise RuntimeError("primary failed")
+            await asyncio.sleep(0.05)
+            return "hedge"
+
+        self.assertEqual(await hedger.run(request), "hedge")
+        self.assertEqual(hedger.hedge_wins, 1)
+
+    async def test_item_metadata_requests_are_hedged(self):
+        """
+        Test that a slow item metadata request is answered by its hedge
+        """
+        upstream = make_upstream()
+        metadata_calls = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path.startswith("/metadata/"):
+                metadata_calls.append(None)
+                if len(metadata_calls) == 1:
+                    await asyncio.sleep(5)
+            return await upstream.handler(request)
+
+        service = ArchiveService(
+            http_client=HttpClient(transport=httpx.MockTransport(handler)),
+            hedger=Hedger(initial_delay=0.05, min_delay=0, max_rate=1)
+        )
+        try:
+            details = await asyncio.wait_for(service.get_video_details("video1"), timeout=1)
+        finally:
+            await service.aclose()
+
+        self.assertEqual(details["identifier"], "video1")
+        self.assertEqual(len(metadata_calls), 2)
+        self.assertEqual(service.hedger.hedge_wins, 1)
+
+    def test_delay_follows_the_latency_percentile(self):
+        """
+        Test that the delay is the configured percentile of recent latencies
+        """
+        hedger = Hedger(percentile=90, initial_delay=2, min_delay=0)
+        self.assertEqual(hedger.delay(), 2)
+
+        for latency in range(100):
+            hedger.record(latency / 100)
+        self.assertAlmostEqual(hedger.delay(), 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+"""
+Tests for the upstream HTTP client retries, rate limiting and circuit breaker
+"""
+import time
+import unittest
+import httpx
+from app.core.archive_service import ArchiveService
+from app.core.cache import ResponseCache
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.http_client import HttpClient, CircuitOpenError, ResponseTooLargeError
+from app.utils.rate_limiter import AdaptiveTokenBucket
+
+
+def make_flaky_upstream(statuses, calls, headers=None):
+    """
+    Build a transport answering with the given statuses in order, then 200
+    """
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(time.monotonic())
+        status = statuses[len(calls) - 1] if len(calls) <= len(statuses) else 200
+        if status != 200:
+            return httpx.Response(status, headers=headers)
+        return httpx.Response(200, json={"response": {"numFound": 0, "docs": []}})
+    return httpx.MockTransport(handler)
+
+
+class TestHttpClientResilience(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for retries and the circuit breaker
+    """
+
+    async def test_throttled_requests_are_retried_after_retry_after(self):
+        """
+        Test that 429 responses are retried, waiting as long as Retry-After asks
+        """
+        calls = []
+        client = HttpClient(transport=make_flaky_upstream([429], calls, {"Retry-After": "0.2"}), backoff_base=0.001)
+        try:
+            response = await client.get("https://archive.org/advancedsearch.php")
+        finally:
+            await client.aclose()
+
+        self.assertEqual(response["response"]["numFound"], 0)
+        self.assertEqual(len(calls), 2)
+        self.assertGreaterEqual(calls[1] - calls[0], 0.2)
+        self.assertEqual(client.retried, 1)
+        self.assertEqual(client.stats()["upstreams"]["search"]["throttled"], 1)
+
+    async def test_client_errors_are_not_retried(self):
+        """
+        Test that a 404 fails immediately without opening the circuit
+        """
+        calls = []
+        client = HttpClient(transport=make_flaky_upstream([404], calls), circuit_failures=1)
+        try:
+            with self.assertRaises(httpx.HTTPStatusError):
+                await client.get("https://archive.org/metadata/missing")
+            await client.get("https://archive.org/metadata/missing")
+        finally:
+            await client.aclose()
+
+        self.assertEqual(len(calls), 2)
+
+    async def test_circuit_opens_and_fails_fast(self):
+        """
+        Test that repeated failures open the circuit of one upstream only
+        """
+        calls = []
+        client = HttpClient(transport=make_flaky_upstream([503] * 2, calls), retries=0, circuit_failures=2)
+        try:
+            for _ in range(2):
+                with self.assertRaises(httpx.HTTPStatusError):
+                    await client.get("https://archive.org/metadata/item")
+            with self.assertRaises(CircuitOpenError) as raised:
+                await client.get("https://archive.org/metadata/item")
+            # The search upstream has its own circuit
+            await client.get("https://archive.org/advancedsearch.php")
+        finally:
+            await client.aclose()
+
+        self.assertEqual(len(calls), 3)
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertEqual(client.stats()["upstreams"]["metadata"]["circuit"]["state"], "open")
+
+    async def test_stale_response_served_while_upstream_unavailable(self):
+        """
+        Test that an expired cached response is served when upstream is down
+        """
+        calls = []
+        cache = ResponseCache(disk_path="", ttls={"search": 0.05}, stale_ttl=0, stale_if_error_ttl=60)
+        service = ArchiveService(
+            http_client=HttpClient(transport=make_flaky_upstream([200, 503, 503], calls), retries=1, backoff_base=0.001),
+            cache=cache
+        )
+        try:
+            first = await service.search_films_by_collection("feature_films")
+            time.sleep(0.06)
+            second = await service.search_films_by_collection("feature_films")
+        finally:
+            await service.aclose()
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 3)
+
+    async def test_body_size_is_capped(self):
+        """
+        Test that a body larger than the limit is abandoned while it is read,
+        without a Content-Length to reject it from
+        """
+        chunks = []
+
+        async def body():
+            for _ in range(100):
+                chunks.append(1)
+                yield b"x" * 100
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, content=body(), headers={"Content-Type": "image/jpeg"})
+
+        client = HttpClient(transport=httpx.MockTransport(handler))
+        try:
+            self.assertEqual(await client.get_bytes("https://archive.org/services/img/a", max_bytes=10000), (b"x" * 10000, "image/jpeg"))
+            chunks.clear()
+            with self.assertRaises(ResponseTooLargeError):
+                await client.get_bytes("https://archive.org/services/img/a", max_bytes=1000)
+        finally:
+            await client.aclose()
+
+        self.assertEqual(len(chunks), 11)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """
+    Test cases for the circuit breaker states
+    """
+
+    def test_half_open_probe(self):
+        """
+        Test that one probe is let through after the reset timeout
+        """
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+
+class TestAdaptiveTokenBucket(unittest.TestCase):
+    """
+    Test cases for the adaptive rate limiter
+    """
+
+    def test_throttle_and_recover(self):
+        """
+        Test that throttling halves the rate and successes restore it gradually
+        """
+        bucket = AdaptiveTokenBucket(rate=10)
+        bucket.throttle()
+        self.assertEqual(bucket.rate, 5)
+        bucket.throttle(retry_after=2)
+        self.assertEqual(bucket.rate, 2.5)
+        self.assertGreaterEqual(bucket.wait_time(), 1.9)
+
+        for _ in range(20):
+            bucket.recover()
+        self.assertEqual(bucket.rate, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
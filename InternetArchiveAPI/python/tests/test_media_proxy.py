@@ -0,0 +1,232 @@
+"""
+Tests for the streaming proxy of item files
+"""
+import tempfile
+import unittest
+from unittest import mock
+import httpx
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api import router as router_module
+from app.core.archive_service import ArchiveService
+from app.core.media_proxy import MediaProxy, StreamsExhaustedError, parse_range
+from app.utils.http_client import HttpClient
+from tests.upstream import STORAGE_HOST, STORAGE_NODE
+
+FILE = bytes(range(256)) * 40
+
+
+class BodyStream(httpx.AsyncByteStream):
+    """
+    Response body left unread until it is streamed, like a network response
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def __aiter__(self):
+        for offset in range(0, len(self.data), 4096):
+            yield self.data[offset:offset + 4096]
+
+
+def make_file_upstream(calls):
+    """
+    Build a mock transport serving FILE at any URL, honouring single ranges.
+    Like archive.org, files are redirected to a storage node, and the Range
+    headers received there are recorded in `calls`.
+    """
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if "missing" in request.url.path:
+            return httpx.Response(404)
+        if request.url.host != STORAGE_HOST:
+            return httpx.Response(302, headers={"Location": f"{STORAGE_NODE}{request.url.raw_path.decode()}"})
+        calls.append(request.headers.get("range"))
+        headers = {"content-type": "video/mp4", "accept-ranges": "bytes", "etag": '"v1"'}
+        requested = parse_range(request.headers.get("range"))
+        if requested is None:
+            return httpx.Response(200, stream=BodyStream(FILE), headers=headers)
+        start, end = requested
+        if start >= len(FILE):
+            return httpx.Response(416, headers={"content-range": f"bytes */{len(FILE)}"})
+        end = len(FILE) - 1 if end is None else min(end, len(FILE) - 1)
+        headers["content-range"] = f"bytes {start}-{end}/{len(FILE)}"
+        return httpx.Response(206, stream=BodyStream(FILE[start:end + 1]), headers=headers)
+    return httpx.MockTransport(handler)
+
+
+async def read(stream):
+    chunks = [chunk async for chunk in stream.body]
+    return chunks, b"".join(chunks)
+
+
+class TestParseRange(unittest.TestCase):
+    """
+    Test cases for parsing Range headers
+    """
+
+    def test_parse_range(self):
+        """
+        Test that single ranges from an offset are parsed and others are not
+        """
+        self.assertEqual(parse_range("bytes=0-"), (0, None))
+        self.assertEqual(parse_range("bytes=10-19"), (10, 19))
+        self.assertIsNone(parse_range("bytes=-500"))
+        self.assertIsNone(parse_range("bytes=0-1,5-9"))
+        self.assertIsNone(parse_range("bytes=9-1"))
+        self.assertIsNone(parse_range(None))
+
+
+class TestMediaProxy(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for streaming files with and without the block cache
+    """
+    URL = "https://archive.org/download/video1/video1.mp4"
+
+    async def asyncSetUp(self):
+        self.calls = []
+        self.http_client = HttpClient(transport=make_file_upstream(self.calls))
+        self.directory = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        await self.http_client.aclose()
+        self.directory.cleanup()
+
+    def make_proxy(self, **kwargs) -> MediaProxy:
+        return MediaProxy(self.http_client, chunk_size=1000, **kwargs)
+
+    async def test_file_is_streamed_in_fixed_chunks(self):
+        """
+        Test that a whole file is relayed in chunks no larger than the chunk size
+        """
+        proxy = self.make_proxy(cache_path="")
+        stream = await proxy.open(self.URL)
+        chunks, body = await read(stream)
+
+        self.assertEqual(stream.status, 200)
+        self.assertEqual(body, FILE)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), 1000)
+        self.assertEqual(proxy.streams, 0)
+
+    async def test_range_is_forwarded(self):
+        """
+        Test that a Range request is forwarded through the redirect to the
+        storage node, with the status and headers of its final response
+        """
+        proxy = self.make_proxy(cache_path="")
+        stream = await proxy.open(self.URL, "bytes=100-199")
+        _, body = await read(stream)
+
+        self.assertEqual(stream.status, 206)
+        self.assertEqual(stream.headers["content-range"], f"bytes 100-199/{len(FILE)}")
+        self.assertEqual(body, FILE[100:200])
+        self.assertEqual(self.calls, ["bytes=100-199"])
+
+    async def test_hot_blocks_are_served_from_disk(self):
+        """
+        Test that blocks streamed enough times are stored and answer later
+        ranges without upstream, which only serves what is not stored
+        """
+        proxy = self.make_proxy(cache_path=self.directory.name, block_size=1024, cache_min_requests=2)
+        for _ in range(2):
+            await read(await proxy.open(self.URL, "bytes=0-2047"))
+        self.calls.clear()
+
+        stream = await proxy.open(self.URL, "bytes=1500-3000")
+        _, body = await read(stream)
+
+        self.assertEqual(stream.status, 206)
+        self.assertEqual(stream.headers["content-range"], f"bytes 1500-3000/{len(FILE)}")
+        self.assertEqual(stream.headers["content-length"], "1501")
+        self.assertEqual(body, FILE[1500:3001])
+        self.assertEqual(self.calls, ["bytes=2048-3000"])
+        self.assertEqual(proxy.stats()["cached_bytes"], 548)
+
+    async def test_blocks_are_not_stored_before_they_are_hot(self):
+        """
+        Test that a block streamed once is not stored
+        """
+        proxy = self.make_proxy(cache_path=self.directory.name, block_size=1024, cache_min_requests=2)
+        await read(await proxy.open(self.URL, "bytes=0-"))
+        self.calls.clear()
+
+        await read(await proxy.open(self.URL, "bytes=0-"))
+        self.assertEqual(self.calls, ["bytes=0-"])
+        self.assertEqual(proxy.stats()["cached_bytes"], 0)
+
+    async def test_streams_are_limited(self):
+        """
+        Test that streams beyond the maximum are rejected until one is closed
+        """
+        proxy = self.make_proxy(cache_path="", max_streams=1)
+        stream = await proxy.open(self.URL)
+
+        with self.assertRaises(StreamsExhaustedError):
+            await proxy.open(self.URL)
+        await stream.aclose()
+        await stream.aclose()
+        await read(await proxy.open(self.URL))
+        self.assertEqual(proxy.stats()["rejected"], 1)
+        self.assertEqual(proxy.streams, 0)
+
+
+class TestPlaybackRoute(unittest.TestCase):
+    """
+    Test cases for the playback endpoint
+    """
+
+    def setUp(self):
+        self.calls = []
+        self.service = ArchiveService(http_client=HttpClient(transport=make_file_upstream(self.calls)))
+        patcher = mock.patch.object(router_module, "archive_service", self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(app)
+
+    def test_range_request(self):
+        """
+        Test that a Range request is answered with the partial content
+        """
+        response = self.client.get("/api/v1/videos/video1/play/video1.mp4", headers={"Range": "bytes=10-19"})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, FILE[10:20])
+        self.assertEqual(response.headers["content-type"], "video/mp4")
+        self.assertEqual(response.headers["accept-ranges"], "bytes")
+
+    def test_missing_file(self):
+        """
+        Test that a file missing upstream answers 404
+        """
+        response = self.client.get("/api/v1/videos/video1/play/missing.mp4")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_playback_urls_point_at_the_proxy(self):
+        """
+        Test that playback URLs point at upstream by default, and are absolute
+        URLs of the proxy when it is enabled
+        """
+        self.assertEqual(self.service.playback_url("video1", "video1.mp4"), "https://archive.org/download/video1/video1.mp4")
+        with mock.patch.object(ArchiveService, "PLAYBACK_PROXY", True):
+            url = self.service.playback_url("video1", "video1.mp4")
+
+        self.assertEqual(url, "http://localhost:8000/api/v1/videos/video1/play/video1.mp4")
+
+
+class TestOpenPlayback(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for opening playback streams through the service
+    """
+
+    async def test_file_names_cannot_leave_the_item(self):
+        """
+        Test that file names with parent segments are rejected
+        """
+        service = ArchiveService(http_client=HttpClient(transport=make_file_upstream([])))
+        with self.assertRaises(ValueError):
+            await service.open_playback("video1", "../other/file.mp4")
+        await service.aclose()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Tests for the metrics and Server-Timing instrumentation
+"""
+import unittest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import router as router_module
+from app.api.instrumentation import InstrumentationMiddleware, update_service_metrics
+from app.utils.metrics import Registry, COALESCED_REQUESTS, REQUESTS, UPSTREAM_RESPONSES
+from tests.test_router import RouterTestCase
+
+
+class TestRegistry(unittest.TestCase):
+    """
+    Test cases for the metric types and the text exposition format
+    """
+
+    def test_render(self):
+        """
+        Test that counters, gauges and histograms render in the Prometheus format
+        """
+        registry = Registry()
+        requests = registry.counter("requests_total", "Requests", ["route"])
+        in_flight = registry.gauge("in_flight", "In flight")
+        latency = registry.histogram("latency_seconds", "Latency", ["route"], buckets=[0.1, 1])
+
+        requests.inc('/a"b')
+        requests.inc('/a"b', amount=2)
+        in_flight.inc()
+        in_flight.dec()
+        latency.observe("/a", value=0.05)
+        latency.observe("/a", value=0.5)
+        latency.observe("/a", value=5)
+        lines = registry.render().splitlines()
+
+        self.assertIn("# TYPE requests_total counter", lines)
+        self.assertIn('requests_total{route="/a\\"b"} 3', lines)
+        self.assertIn("in_flight 0", lines)
+        self.assertIn('latency_seconds_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{route="/a",le="1"} 2', lines)
+        self.assertIn('latency_seconds_bucket{route="/a",le="+Inf"} 3', lines)
+        self.assertIn('latency_seconds_sum{route="/a"} 5.55', lines)
+        self.assertIn('latency_seconds_count{route="/a"} 3', lines)
+
+    def test_labels_are_checked(self):
+        """
+        Test that samples with the wrong labels are rejected
+        """
+        with self.assertRaises(ValueError):
+            Registry().counter("requests_total", "Requests", ["route"]).inc()
+
+
+class TestInstrumentation(RouterTestCase):
+    """
+    Test cases for the request instrumentation
+    """
+
+    def test_metrics_endpoint(self):
+        """
+        Test that requests are recorded by route template and upstream
+        """
+        before = REQUESTS.value("GET", "/api/v1/videos/{video_id}", "200")
+        upstream_before = UPSTREAM_RESPONSES.value("metadata", "200")
+        self.client.get("/api/v1/videos/video1")
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        self.assertEqual(REQUESTS.value("GET", "/api/v1/videos/{video_id}", "200"), before + 1)
+        self.assertEqual(UPSTREAM_RESPONSES.value("metadata", "200"), upstream_before + 1)
+        self.assertIn('archive_api_request_duration_seconds_count{method="GET",route="/api/v1/videos/{video_id}"}', response.text)
+        self.assertIn("archive_upstream_request_duration_seconds_bucket", response.text)
+
+    def test_coalesced_requests_are_reported(self):
+        """
+        Test that the queries coalesced by the service are exposed in the
+        metrics and the cache statistics
+        """
+        self.service.single_flight.coalesced = 3
+
+        update_service_metrics(self.service)
+
+        self.assertEqual(COALESCED_REQUESTS.value(), 3)
+        self.assertEqual(self.client.get("/api/v1/cache/stats").json()["coalescing"], {"in_flight": 0, "coalesced": 3})
+
+    def test_server_timing_header(self):
+        """
+        Test that the stages of a request are reported when Server-Timing is enabled
+        """
+        app = FastAPI()
+        app.include_router(router_module.router)
+        app.add_middleware(InstrumentationMiddleware, server_timing=True)
+        response = TestClient(app).get("/api/v1/videos/video1")
+
+        stages = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+        self.assertEqual(response.status_code, 200)
+        for stage in ("upstream", "parse", "build", "serialize", "total"):
+            self.assertIn(stage, stages)
+        self.assertNotIn("server-timing", self.client.get("/api/v1/videos/video1").headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,12 @@
 """
 Tests for the models package
 """
+import sys
 import unittest
 import logging
 from app.models.film import Film
 from app.models.collection import Collection
+from app.models.video import Video, LazyMetadata
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -114,5 +116,41 @@ class TestCollectionModel(unittest.TestCase):
         self.assertEqual(collection_dict["films"][1]["identifier"], "film2")
 
 
+class TestVideoModel(unittest.TestCase):
+    """
+    Test cases for the Video model and its lazy metadata
+    """
+    
+    def test_lazy_metadata_decodes_on_access(self):
+        """
+        Test that LazyMetadata behaves like the decoded dictionary
+        """
+        metadata = LazyMetadata('{"title": "V", "runtime": "1:02:00", "subject": ["a", "b"]}')
+        self.assertIsNone(metadata._decoded)
+        
+        self.assertEqual(metadata["title"], "V")
+        self.assertEqual(metadata.get("missing"), None)
+        self.assertEqual(metadata, {"title": "V", "runtime": "1:02:00", "subject": ["a", "b"]})
+    
+    def test_video_to_dict_keeps_raw_metadata(self):
+        """
+        Test that to_dict passes LazyMetadata through without decoding it
+        """
+        metadata = LazyMetadata('{"title": "V"}')
+        video = Video(identifier="v", title="V", metadata=metadata)
+        
+        self.assertIs(video.to_dict()["metadata"], metadata)
+        self.assertIsNone(metadata._decoded)
+    
+    def test_models_have_no_instance_dict(self):
+        """
+        Test that the models are slotted where the Python version supports it
+        """
+        if sys.version_info < (3, 10):
+            self.skipTest("Slotted dataclasses require Python 3.10")
+        for model in (Film(identifier="f", title="F"), Collection(identifier="c", title="C"), Video(identifier="v", title="V")):
+            self.assertFalse(hasattr(model, "__dict__"))
+
+
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""
+Tests for the speculative prefetching of the next page of searches
+"""
+import asyncio
+import unittest
+from app.core.cache import ResponseCache
+from app.core.prefetcher import PagePrefetcher
+from app.core.archive_service import ArchiveService
+from app.utils.http_client import HttpClient
+from tests.upstream import make_upstream
+
+
+class TestPagePrefetcher(unittest.TestCase):
+    """
+    Test cases for the pagination session tracking and backoff
+    """
+
+    def test_prefetches_sessions_read_in_order(self):
+        """
+        Test that the next page is prefetched on page 1 and in-order pages only
+        """
+        prefetcher = PagePrefetcher(budget=100)
+
+        self.assertTrue(prefetcher.observe("a", 1))
+        self.assertTrue(prefetcher.observe("a", 2))
+        self.assertFalse(prefetcher.observe("a", 5))
+        self.assertFalse(prefetcher.observe("b", 3))
+        self.assertFalse(prefetcher.observe("c", 1, wanted=False))
+        self.assertEqual(prefetcher.stats()["hits"], 1)
+        self.assertEqual(prefetcher.stats()["misses"], 1)
+
+    def test_budget_limits_prefetches(self):
+        """
+        Test that prefetches beyond the budget are skipped
+        """
+        prefetcher = PagePrefetcher(budget=1)
+
+        self.assertTrue(prefetcher.observe("a", 1))
+        self.assertFalse(prefetcher.observe("b", 1))
+        self.assertEqual(prefetcher.stats()["skipped"], 1)
+
+    def test_backs_off_when_hit_rate_is_low(self):
+        """
+        Test that prefetching pauses once the recent hit rate falls below the minimum
+        """
+        prefetcher = PagePrefetcher(budget=100, window=2, min_hit_rate=0.5, backoff=60)
+        for session in ("a", "b"):
+            prefetcher.observe(session, 1)
+            prefetcher.observe(session, 7)
+
+        self.assertTrue(prefetcher.paused())
+        self.assertFalse(prefetcher.observe("c", 1))
+        self.assertEqual(prefetcher.stats()["backoffs"], 1)
+        self.assertEqual(prefetcher._backoff, 120)
+
+
+class TestArchiveServicePrefetch(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for prefetching through the archive service
+    """
+
+    async def asyncSetUp(self):
+        self.calls = []
+        self.prefetcher = PagePrefetcher(budget=100)
+        self.service = ArchiveService(
+            http_client=HttpClient(transport=make_upstream(self.calls)),
+            cache=ResponseCache(disk_path=""),
+            prefetcher=self.prefetcher
+        )
+
+    async def asyncTearDown(self):
+        await self.service.aclose()
+
+    async def test_next_page_is_served_from_the_cache(self):
+        """
+        Test that the page after the requested one is fetched in the background
+        and answers the next request without an upstream call
+        """
+        await self.service.search_films_by_collection("feature_films", page=1, rows=1)
+        await asyncio.sleep(0.01)
+        self.assertEqual(len(self.calls), 2)
+        self.assertIn("page=2", self.calls[1])
+
+        await self.service.search_films_by_collection("feature_films", page=2, rows=1)
+        await asyncio.sleep(0.01)
+        self.assertEqual(len(self.calls), 3)
+        self.assertIn("page=3", self.calls[2])
+        self.assertEqual(self.prefetcher.stats()["hits"], 1)
+
+    async def test_prefetched_pages_are_not_counted_as_hot(self):
+        """
+        Test that prefetching a page does not count as a request for it, so
+        prefetches do not keep their own queries refreshed
+        """
+        await self.service.search_films_by_collection("feature_films", page=1, rows=1)
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(self.service.hot_queries.counts), 1)
+        self.assertNotIn("page=2", next(iter(self.service.hot_queries.queries.values()))[1])
+
+    async def test_no_prefetch_past_the_last_page(self):
+        """
+        Test that nothing is prefetched after the last page of the results
+        """
+        await self.service.search_collections("feature_films", "movies", page=1, rows=10)
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.prefetcher.stats()["prefetched"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
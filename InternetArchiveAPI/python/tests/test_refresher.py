@@ -0,0 +1,130 @@
+"""
+Tests for stale-while-revalidate and the background refresher
+"""
+import asyncio
+import unittest
+from unittest import mock
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api import router as router_module
+from app.core.cache import ResponseCache
+from app.core.refresher import CacheRefresher, HotQueryTracker
+from app.core.archive_service import ArchiveService
+from app.utils.http_client import HttpClient
+from tests.upstream import make_upstream
+
+
+class TestHotQueryTracker(unittest.TestCase):
+    """
+    Test cases for the hot query ranking
+    """
+
+    def test_top_and_decay(self):
+        """
+        Test that queries are ranked by count and forgotten after decaying to zero
+        """
+        tracker = HotQueryTracker()
+        for _ in range(3):
+            tracker.record("a", "search", "url-a")
+        tracker.record("b", "metadata", "url-b")
+
+        self.assertEqual([query[0] for query in tracker.top(2)], ["a", "b"])
+        tracker.decay()
+        self.assertEqual(tracker.top(2), [("a", "search", "url-a", None)])
+
+
+class TestStaleWhileRevalidate(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for serving stale entries while revalidating
+    """
+
+    async def asyncSetUp(self):
+        self.calls = []
+        self.cache = ResponseCache(disk_path="", ttls={"search": 0.05}, stale_ttl=60)
+        self.service = ArchiveService(
+            http_client=HttpClient(transport=make_upstream(self.calls, delay=0.05)),
+            cache=self.cache
+        )
+
+    async def asyncTearDown(self):
+        await self.service.aclose()
+
+    async def test_stale_entry_is_served_and_refreshed(self):
+        """
+        Test that an expired entry is returned at once and refreshed in the background
+        """
+        await self.service.search_films_by_collection("feature_films")
+        await asyncio.sleep(0.06)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        films = await self.service.search_films_by_collection("feature_films")
+        elapsed = loop.time() - start
+
+        self.assertEqual(len(films), 3)
+        self.assertLess(elapsed, 0.04)
+        self.assertEqual(self.cache.stats()["stale_hits"], 1)
+
+        await asyncio.sleep(0.08)
+        self.assertEqual(len(self.calls), 2)
+        self.assertGreater(self.cache.expires_in(next(iter(self.service.hot_queries.queries))), 0)
+
+
+class TestCacheRefresher(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for the proactive refresher
+    """
+
+    async def asyncSetUp(self):
+        self.calls = []
+        self.service = ArchiveService(
+            http_client=HttpClient(transport=make_upstream(self.calls)),
+            cache=ResponseCache(disk_path="", ttls={"search": 30, "lookup": 3600, "metadata": 3600})
+        )
+
+    async def asyncTearDown(self):
+        await self.service.aclose()
+
+    async def test_refreshes_hot_queries_about_to_expire(self):
+        """
+        Test that only the hot queries expiring within the refresh window are refreshed
+        """
+        for _ in range(3):
+            await self.service.search_films_by_collection("feature_films")
+        await self.service.get_video_details("video1")
+        self.calls.clear()
+
+        refresher = CacheRefresher(self.service, top_n=10, concurrency=2, refresh_ahead=60)
+        refreshed = await refresher.run_once()
+
+        self.assertEqual(refreshed, 1)
+        self.assertEqual(len(self.calls), 1)
+        self.assertIn("feature_films", self.calls[0])
+        self.assertEqual((refresher.stats()["refreshed"], refresher.stats()["failed"]), (1, 0))
+
+    async def test_stats_are_reported(self):
+        """
+        Test that the refresher counters are reported by the cache statistics
+        """
+        refresher = CacheRefresher(self.service)
+        refresher.refreshed = 2
+        with mock.patch.object(router_module, "archive_service", self.service):
+            with mock.patch.object(router_module, "refresher", refresher):
+                stats = TestClient(app).get("/api/v1/cache/stats").json()
+
+        self.assertEqual(stats["refresh"], {"running": False, "refreshed": 2, "failed": 0})
+
+    async def test_start_and_stop(self):
+        """
+        Test that the background loop can be started and stopped
+        """
+        refresher = CacheRefresher(self.service, interval=0.01)
+        refresher.start()
+        await asyncio.sleep(0.03)
+        await refresher.stop()
+
+        self.assertFalse(refresher.stats()["running"])
+
+
+if __name__ == "__main__":
+    unittest.main()
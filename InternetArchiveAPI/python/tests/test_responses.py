@@ -0,0 +1,100 @@
+"""
+Tests for the fast JSON and file responses
+"""
+import json
+import tempfile
+import unittest
+from app.api.responses import FileSendResponse, ModelResponse, dumps
+from app.models.film import Film
+from app.models.collection import Collection
+from app.models.video import Video, VideoPlaybackUrl, LazyMetadata
+
+
+class TestModelResponse(unittest.TestCase):
+    """
+    Test cases for encoding models directly
+    """
+
+    def test_models_encode_like_to_dict(self):
+        """
+        Test that direct encoding matches the to_dict() representation
+        """
+        collection = Collection(identifier="c", title="C", films=[Film(identifier="f", title="F")])
+        video = Video(
+            identifier="v", title="V", subject=["silent"],
+            playback_urls=[VideoPlaybackUrl(format="h.264", url="https://archive.org/download/v/v.mp4")],
+            metadata={"title": "V", "runtime": "1:02:00"}
+        )
+
+        self.assertEqual(json.loads(dumps(collection)), collection.to_dict())
+        self.assertEqual(json.loads(dumps(video)), video.to_dict())
+        self.assertEqual(json.loads(dumps({"results": {"v": video}})), {"results": {"v": video.to_dict()}})
+
+    def test_response_body_and_media_type(self):
+        """
+        Test that the response renders JSON bytes
+        """
+        response = ModelResponse([Film(identifier="f", title="Fílm")])
+
+        self.assertEqual(response.media_type, "application/json")
+        self.assertEqual(json.loads(response.body)[0]["title"], "Fílm")
+
+    def test_lazy_metadata_written_raw(self):
+        """
+        Test that LazyMetadata is written to the body without being decoded
+        """
+        metadata = LazyMetadata('{"title":"V","runtime":"1:02:00"}')
+        body = dumps(Video(identifier="v", title="V", metadata=metadata))
+
+        self.assertIn(b'"metadata":{"title":"V","runtime":"1:02:00"}', body)
+        self.assertIsNone(metadata._decoded)
+
+    def test_unsupported_objects_raise(self):
+        """
+        Test that unknown objects are rejected
+        """
+        with self.assertRaises(TypeError):
+            dumps({"value": object()})
+
+
+
+class TestFileSendResponse(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for handing files to the server
+    """
+
+    async def send_file(self, extensions):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        with tempfile.NamedTemporaryFile() as file:
+            file.write(b"image")
+            file.flush()
+            scope = {"type": "http", "method": "GET", "headers": [], "extensions": extensions}
+            await FileSendResponse(file.name, media_type="image/jpeg")(scope, None, send)
+            return file.name, messages
+
+    async def test_path_is_sent_when_supported(self):
+        """
+        Test that the file path is handed to servers supporting path send
+        """
+        path, messages = await self.send_file({"http.response.pathsend": {}})
+
+        self.assertEqual(messages[0]["type"], "http.response.start")
+        self.assertIn((b"content-length", b"5"), messages[0]["headers"])
+        self.assertEqual(messages[1], {"type": "http.response.pathsend", "path": path})
+
+    async def test_file_is_read_otherwise(self):
+        """
+        Test that the file is sent as body chunks by other servers
+        """
+        _, messages = await self.send_file({})
+
+        self.assertEqual(messages[1]["type"], "http.response.body")
+        self.assertEqual(messages[1]["body"], b"image")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+"""
+Tests for the API router
+"""
+import unittest
+from unittest import mock
+import httpx
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api import router as router_module
+from app.core.archive_service import ArchiveService
+from app.core.search_index import SearchIndex
+from app.utils.http_client import HttpClient
+from tests.upstream import make_upstream
+
+
+class RouterTestCase(unittest.TestCase):
+    """
+    Base test case serving the app against a stubbed upstream
+    """
+
+    def setUp(self):
+        self.calls = []
+        self.service = ArchiveService(http_client=HttpClient(transport=self.make_transport()))
+        patcher = mock.patch.object(router_module, "archive_service", self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(app)
+
+    def make_transport(self) -> httpx.MockTransport:
+        return make_upstream(self.calls)
+
+
+class TestVideoRoutes(RouterTestCase):
+    """
+    Test cases for the video endpoints
+    """
+
+    def test_get_video_details(self):
+        """
+        Test fetching a single video
+        """
+        response = self.client.get("/api/v1/videos/video1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["identifier"], "video1")
+        self.assertEqual(len(response.json()["playback_urls"]), 1)
+
+    def test_get_video_details_not_found(self):
+        """
+        Test that a missing video answers 404
+        """
+        response = self.client.get("/api/v1/videos/missing")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_batch_video_details(self):
+        """
+        Test that a batch returns results and per-id errors in one response
+        """
+        response = self.client.post("/api/v1/videos:batch", json={"ids": ["video1", "missing1", "video2", "video1"]})
+        body = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body["requested"], 3)
+        self.assertEqual(sorted(body["results"]), ["video1", "video2"])
+        self.assertEqual(body["errors"]["missing1"]["status"], 404)
+
+    def test_video_fields_are_projected(self):
+        """
+        Test that only the requested fields are returned and fetched
+        """
+        response = self.client.get("/api/v1/videos/video1", params={"fields": "title,playback_urls"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "title": "Title video1",
+            "playback_urls": [{"format": "h.264", "url": "https://archive.org/download/video1/video1.mp4"}]
+        })
+        self.assertTrue(any(call.endswith("/metadata/video1/files") for call in self.calls))
+
+    def test_file_classifications_are_reported(self):
+        """
+        Test that the file classifications are counted in the cache statistics
+        """
+        self.client.get("/api/v1/videos/video1")
+
+        stats = self.client.get("/api/v1/cache/stats").json()["file_classifier"]
+        self.assertEqual((stats["misses"], stats["entries"]), (1, 1))
+
+    def test_invalid_fields_are_rejected(self):
+        """
+        Test that malformed fields answer 400
+        """
+        response = self.client.get("/api/v1/videos/video1", params={"fields": "title;drop"})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_rejects_too_many_ids(self):
+        """
+        Test that oversized batches are rejected
+        """
+        with mock.patch.object(router_module, "BATCH_MAX_IDS", 2):
+            response = self.client.post("/api/v1/videos:batch", json={"ids": ["a", "b", "c"]})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TestBatchPartialFailure(RouterTestCase):
+    """
+    Test cases for upstream failures inside a batch
+    """
+
+    def make_transport(self) -> httpx.MockTransport:
+        upstream = make_upstream(self.calls)
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path == "/metadata/broken":
+                return httpx.Response(503)
+            return await upstream.handler(request)
+        return httpx.MockTransport(handler)
+
+    def test_failed_video_does_not_fail_the_batch(self):
+        """
+        Test that an upstream error is reported for its id only, as unavailable
+        """
+        response = self.client.post("/api/v1/videos:batch", json={"ids": ["video1", "broken"]})
+        body = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("video1", body["results"])
+        self.assertEqual(body["errors"]["broken"]["status"], 503)
+
+
+
+class TestExploreRoutes(RouterTestCase):
+    """
+    Test cases for exploring collections with the local search index
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.service.search_index = SearchIndex(":memory:")
+        self.service.search_index.add_documents([
+            {"identifier": "nosferatu", "title": "Nosferatu", "mediatype": "movies", "avg_rating": "4.5"},
+            {"identifier": "metropolis", "title": "Metropolis", "mediatype": "movies", "avg_rating": "4.8"},
+        ], collection_id="feature_films")
+        self.service.search_index.mark_harvested("feature_films", "movies")
+        self.addCleanup(self.service.search_index.close)
+
+    def test_harvested_media_type_is_served_locally(self):
+        """
+        Test that exploring the harvested media type of a collection does not
+        reach upstream, and is counted by the index statistics
+        """
+        response = self.client.get("/api/v1/explore", params={"collection": "feature_films", "mediatype": "movies"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([doc["identifier"] for doc in response.json()["docs"]], ["metropolis", "nosferatu"])
+        self.assertEqual(self.calls, [])
+        stats = self.client.get("/api/v1/cache/stats").json()["search_index"]
+        self.assertEqual((stats["items"], stats["hits"]), (2, 1))
+
+    def test_any_media_type_reaches_upstream(self):
+        """
+        Test that exploring every media type, the default, is fetched from upstream
+        """
+        response = self.client.get("/api/v1/explore", params={"collection": "feature_films"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+Tests for the local search index
+"""
+import unittest
+import httpx
+from app.core.search_index import SearchIndex
+from app.core.archive_service import ArchiveService
+from app.utils.http_client import HttpClient
+from tests.upstream import make_upstream
+
+DOCS = [
+    {"identifier": "nosferatu", "title": "Nosferatu", "description": "A vampire classic", "subject": ["horror", "silent"],
+     "mediatype": "movies", "avg_rating": "4.5", "downloads": 900, "date": "1922-03-04"},
+    {"identifier": "metropolis", "title": "Metropolis", "description": "A city of the future", "subject": "science fiction",
+     "mediatype": "movies", "avg_rating": "4.8", "downloads": 500, "date": "1927-01-10"},
+    {"identifier": "his_girl_friday", "title": "His Girl Friday", "description": "Screwball comedy",
+     "mediatype": "movies", "avg_rating": "4.1", "downloads": 1200, "date": "1940-01-18", "collection": ["comedy_films"]},
+    {"identifier": "newsreel", "title": "Newsreel", "mediatype": "texts"},
+]
+
+
+class TestSearchIndex(unittest.TestCase):
+    """
+    Test cases for the SQLite FTS5 index
+    """
+
+    def setUp(self):
+        self.index = SearchIndex(":memory:")
+        self.index.add_documents(DOCS, collection_id="feature_films")
+        self.index.mark_harvested("feature_films", "movies")
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_sorts(self):
+        """
+        Test sorting by stars, downloads, date and title
+        """
+        def identifiers(sort):
+            return [doc["identifier"] for doc in self.index.search("feature_films", mediatype="movies", sort=sort)[1]]
+
+        self.assertEqual(identifiers("stars desc"), ["metropolis", "nosferatu", "his_girl_friday"])
+        self.assertEqual(identifiers("downloads desc"), ["his_girl_friday", "nosferatu", "metropolis"])
+        self.assertEqual(identifiers("date asc"), ["nosferatu", "metropolis", "his_girl_friday"])
+        self.assertEqual(identifiers("title asc"), ["his_girl_friday", "metropolis", "nosferatu"])
+
+    def test_full_text_and_paging(self):
+        """
+        Test free-text matching on subject and description, and pagination
+        """
+        num_found, docs = self.index.search("feature_films", text="vampire", mediatype="movies")
+        self.assertEqual((num_found, [doc["identifier"] for doc in docs]), (1, ["nosferatu"]))
+
+        num_found, docs = self.index.search("feature_films", text="science", mediatype="movies")
+        self.assertEqual([doc["identifier"] for doc in docs], ["metropolis"])
+
+        num_found, docs = self.index.search("feature_films", mediatype="movies", page=2, rows=2, sort="title asc")
+        self.assertEqual((num_found, [doc["identifier"] for doc in docs]), (3, ["nosferatu"]))
+
+    def test_misses(self):
+        """
+        Test that unharvested collections, media types other than the
+        harvested one and unsupported sorts are misses
+        """
+        self.assertIsNone(self.index.search("comedy_films", mediatype="movies"))
+        self.assertIsNone(self.index.search("feature_films"))
+        self.assertIsNone(self.index.search("feature_films", mediatype="texts"))
+        self.assertIsNone(self.index.search("feature_films", mediatype="movies", sort="random desc"))
+        self.assertEqual(self.index.stats()["misses"], 4)
+
+    def test_updates_replace_indexed_text(self):
+        """
+        Test that updating a document updates the full-text index
+        """
+        self.index.add_documents([{"identifier": "nosferatu", "title": "Nosferatu", "description": "Restored print"}])
+
+        self.assertEqual(self.index.search("feature_films", mediatype="movies", text="vampire")[0], 0)
+        self.assertEqual(self.index.search("feature_films", mediatype="movies", text="restored")[0], 1)
+
+
+class TestArchiveServiceSearchIndex(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for answering ArchiveService searches from the index
+    """
+
+    async def asyncSetUp(self):
+        self.calls = []
+        index = SearchIndex(":memory:")
+        index.add_documents(DOCS, collection_id="feature_films")
+        index.mark_harvested("feature_films", "movies")
+        self.service = ArchiveService(http_client=HttpClient(transport=make_upstream(self.calls)), search_index=index)
+
+    async def asyncTearDown(self):
+        await self.service.aclose()
+
+    async def test_harvested_collection_is_answered_locally(self):
+        """
+        Test that searches in a harvested collection do not reach upstream
+        """
+        films = await self.service.search_films_by_collection("feature_films", sort="stars desc", query="city")
+        response = await self.service.search_collections(collection="feature_films", mediatype="movies", rows=2)
+
+        self.assertEqual([film.identifier for film in films], ["metropolis"])
+        self.assertEqual(films[0].thumbnail_url, "https://archive.org/services/img/metropolis")
+        self.assertEqual(response["numFound"], 3)
+        self.assertEqual(len(response["docs"]), 2)
+        self.assertEqual(self.calls, [])
+
+    async def test_other_media_types_fall_back_to_upstream(self):
+        """
+        Test that searching any media type in a collection harvested for
+        movies only is fetched from upstream, which also holds the rest
+        """
+        response = await self.service.search_collections(collection="feature_films", mediatype="*", rows=2)
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(httpx.URL(self.calls[0]).params["q"], "collection:(feature_films) AND mediatype:(*)")
+        self.assertEqual([doc["identifier"] for doc in response["docs"]], ["film0", "film1", "film2"])
+        self.assertEqual(self.service.search_index.stats()["hits"], 0)
+
+    async def test_miss_falls_back_to_upstream(self):
+        """
+        Test that other collections are fetched from upstream
+        """
+        films = await self.service.search_films_by_collection("other_collection")
+
+        self.assertEqual(len(films), 3)
+        self.assertEqual(len(self.calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Tests for the request coalescing
+"""
+import asyncio
+import unittest
+from app.core.singleflight import SingleFlight
+from app.core.archive_service import ArchiveService
+from app.utils.http_client import HttpClient
+from tests.upstream import make_upstream
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for the SingleFlight helper
+    """
+
+    async def test_concurrent_calls_share_one_execution(self):
+        """
+        Test that identical concurrent calls run the work once
+        """
+        group = SingleFlight()
+        executions = []
+
+        async def work():
+            executions.append(1)
+            await asyncio.sleep(0.05)
+            return {"value": 42}
+
+        results = await asyncio.gather(*[group.do("key", work) for _ in range(10)])
+
+        self.assertEqual(len(executions), 1)
+        self.assertTrue(all(result == {"value": 42} for result in results))
+        self.assertEqual(group.stats(), {"in_flight": 0, "coalesced": 9})
+
+    async def test_errors_propagate_to_all_waiters(self):
+        """
+        Test that every waiter receives the exception
+        """
+        group = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(*[group.do("key", failing) for _ in range(3)], return_exceptions=True)
+
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    async def test_cancelled_waiter_does_not_cancel_others(self):
+        """
+        Test that cancelling one waiter leaves the shared work running
+        """
+        group = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.ensure_future(group.do("key", work))
+        second = asyncio.ensure_future(group.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        self.assertEqual(await second, "done")
+
+    async def test_calls_after_completion_start_fresh_work(self):
+        """
+        Test that a finished call is not reused by later callers
+        """
+        group = SingleFlight()
+        executions = []
+
+        async def work():
+            executions.append(1)
+            return len(executions)
+
+        self.assertEqual(await group.do("key", work), 1)
+        self.assertEqual(await group.do("key", work), 2)
+
+
+class TestArchiveServiceCoalescing(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for coalescing in the ArchiveService
+    """
+
+    async def asyncSetUp(self):
+        self.calls = []
+        self.service = ArchiveService(http_client=HttpClient(transport=make_upstream(self.calls, delay=0.05)))
+
+    async def asyncTearDown(self):
+        await self.service.aclose()
+
+    async def test_identical_searches_are_coalesced(self):
+        """
+        Test that concurrent identical film searches hit the upstream once
+        """
+        results = await asyncio.gather(*[
+            self.service.search_films_by_collection("feature_films", page=1, rows=3) for _ in range(20)
+        ])
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all(len(films) == 3 for films in results))
+
+    async def test_identical_video_details_are_coalesced(self):
+        """
+        Test that concurrent video details share the search and metadata requests
+        """
+        await asyncio.gather(*[self.service.get_video_details("video1") for _ in range(10)])
+
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
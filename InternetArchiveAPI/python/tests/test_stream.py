@@ -0,0 +1,76 @@
+"""
+Tests for the streaming collection export
+"""
+import json
+import unittest
+from app.core.archive_service import ArchiveService
+from app.utils.http_client import HttpClient
+from tests.upstream import make_upstream
+from tests.test_router import RouterTestCase
+
+
+class TestIterCollectionFilms(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for the paged collection walk
+    """
+
+    async def make_service(self, scrape_items=None):
+        self.calls = []
+        self.service = ArchiveService(http_client=HttpClient(transport=make_upstream(self.calls, scrape_items=scrape_items)))
+        self.addAsyncCleanup(self.service.aclose)
+
+    async def test_walks_every_page_of_the_scrape_api(self):
+        """
+        Test that all items are yielded with the cursor of the next page
+        """
+        await self.make_service(scrape_items=250)
+        pages = [page async for page in self.service.iter_collection_films("feature_films", page_size=100)]
+
+        self.assertEqual([len(films) for films, _ in pages], [100, 100, 50])
+        self.assertEqual([cursor for _, cursor in pages], ["100", "200", None])
+        self.assertEqual(pages[2][0][-1].identifier, "item249")
+
+    async def test_resumes_from_cursor(self):
+        """
+        Test that a cursor resumes after the page it was returned with
+        """
+        await self.make_service(scrape_items=250)
+        pages = [page async for page in self.service.iter_collection_films("feature_films", cursor="200", page_size=100)]
+
+        self.assertEqual(pages[0][0][0].identifier, "item200")
+
+    async def test_falls_back_to_advancedsearch_paging(self):
+        """
+        Test that advancedsearch paging is used when the scrape API fails
+        """
+        await self.make_service(scrape_items=None)
+        pages = [page async for page in self.service.iter_collection_films("feature_films", page_size=100)]
+
+        self.assertEqual([film.identifier for film in pages[0][0]], ["film0", "film1", "film2"])
+        self.assertIsNone(pages[0][1])
+        self.assertIn("advancedsearch", self.calls[-1])
+
+
+class TestStreamRoute(RouterTestCase):
+    """
+    Test cases for the NDJSON stream endpoint
+    """
+
+    def make_transport(self):
+        return make_upstream(self.calls, scrape_items=150)
+
+    def test_streams_ndjson(self):
+        """
+        Test that films and page cursors are streamed as NDJSON lines
+        """
+        response = self.client.get("/api/v1/collections/feature_films/items:stream?page_size=100")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        self.assertEqual(len([line for line in lines if "identifier" in line]), 150)
+        self.assertEqual([line["next_cursor"] for line in lines if "next_cursor" in line], ["100", None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+"""
+Tests for the thumbnail store and proxy
+"""
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api import router as router_module
+from app.core import thumbnails as thumbnails_module
+from app.core.archive_service import ArchiveService
+from app.core.thumbnails import ThumbnailStore
+from app.utils.http_client import HttpClient
+from tests.upstream import STORAGE_NODE, make_upstream
+
+
+class TestThumbnailStore(unittest.IsolatedAsyncioTestCase):
+    """
+    Test cases for the content-addressed thumbnail store
+    """
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ThumbnailStore(path=self.directory.name, widths=(160, 320))
+        self.fetches = []
+
+    async def asyncTearDown(self):
+        self.directory.cleanup()
+
+    def fetcher(self, data: bytes, media_type: str = "image/jpeg"):
+        async def fetch():
+            self.fetches.append(data)
+            return data, media_type
+        return fetch
+
+    async def test_image_is_fetched_once(self):
+        """
+        Test that a stored image is served without fetching it again
+        """
+        first = await self.store.get("https://archive.org/services/img/a", self.fetcher(b"image a"))
+        second = await self.store.get("https://archive.org/services/img/a", self.fetcher(b"image a"))
+
+        self.assertEqual(len(self.fetches), 1)
+        self.assertEqual(first, second)
+        with open(first.path, "rb") as file:
+            self.assertEqual(file.read(), b"image a")
+        self.assertEqual(first.media_type, "image/jpeg")
+
+    async def test_identical_images_share_their_file(self):
+        """
+        Test that images with the same content are stored once
+        """
+        first = await self.store.get("https://archive.org/services/img/a", self.fetcher(b"same"))
+        second = await self.store.get("https://archive.org/services/img/b", self.fetcher(b"same"))
+
+        self.assertEqual(first.path, second.path)
+        self.assertEqual(first.etag, second.etag)
+
+    async def test_expired_image_is_fetched_again(self):
+        """
+        Test that an image older than the TTL is fetched again, and still
+        served when upstream fails
+        """
+        self.store.ttl = 0
+        await self.store.get("https://archive.org/services/img/a", self.fetcher(b"old"))
+        updated = await self.store.get("https://archive.org/services/img/a", self.fetcher(b"new"))
+        with open(updated.path, "rb") as file:
+            self.assertEqual(file.read(), b"new")
+
+        async def failing():
+            raise ConnectionError("upstream down")
+
+        stale = await self.store.get("https://archive.org/services/img/a", failing)
+        self.assertEqual(stale, updated)
+        self.assertEqual(self.store.stats()["stale"], 1)
+
+    async def test_non_image_is_rejected(self):
+        """
+        Test that a response that is not an image is neither stored nor served
+        """
+        with self.assertRaises(ValueError):
+            await self.store.get("https://archive.org/download/a/a.mp4", self.fetcher(b"video", "video/mp4"))
+
+    def test_width_buckets(self):
+        """
+        Test that widths are rounded up to the nearest bucket
+        """
+        self.assertIsNone(self.store.bucket(None))
+        self.assertEqual(self.store.bucket(100), 160)
+        self.assertEqual(self.store.bucket(161), 320)
+        self.assertEqual(self.store.bucket(2000), 320)
+
+    async def test_variants_are_made_once(self):
+        """
+        Test that a resized variant is made once per bucket and format
+        """
+        resize = mock.Mock(return_value=b"resized")
+        with mock.patch.object(thumbnails_module, "Image", object()), \
+                mock.patch.object(ThumbnailStore, "_resize", resize):
+            first = await self.store.get("https://archive.org/services/img/a", self.fetcher(b"image a"), width=150, format="webp")
+            second = await self.store.get("https://archive.org/services/img/a", self.fetcher(b"image a"), width=100, format="webp")
+
+        self.assertEqual(resize.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(first.media_type, "image/webp")
+        self.assertTrue(first.etag.endswith('-160.webp"'))
+
+    async def test_pillow_resizes_images(self):
+        """
+        Test that Pillow scales images down to their bucket
+        """
+        if thumbnails_module.Image is None:
+            self.skipTest("Pillow is not installed")
+        image = io.BytesIO()
+        thumbnails_module.Image.new("RGB", (640, 480)).save(image, "PNG")
+
+        thumbnail = await self.store.get("https://archive.org/services/img/a", self.fetcher(image.getvalue(), "image/png"), width=300)
+
+        with thumbnails_module.Image.open(thumbnail.path) as resized:
+            self.assertEqual(resized.size, (320, 240))
+
+    async def test_least_recently_served_files_are_evicted(self):
+        """
+        Test that old files are removed once the store is over its size limit
+        """
+        self.store.objects.max_bytes = 10
+        first = await self.store.get("https://archive.org/services/img/a", self.fetcher(b"123456"))
+        os.utime(first.path, (0, 0))
+        second = await self.store.get("https://archive.org/services/img/b", self.fetcher(b"abcdef"))
+
+        self.assertFalse(os.path.exists(first.path))
+        self.assertTrue(os.path.exists(second.path))
+        self.assertEqual(self.store.stats()["evicted"], 1)
+
+
+class TestThumbnailRoute(unittest.TestCase):
+    """
+    Test cases for the thumbnail proxy endpoint
+    """
+
+    def setUp(self):
+        self.calls = []
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.service = ArchiveService(
+            http_client=HttpClient(transport=make_upstream(self.calls)),
+            thumbnails=ThumbnailStore(path=self.directory.name)
+        )
+        patcher = mock.patch.object(router_module, "archive_service", self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(app)
+
+    def test_thumbnail_urls_point_at_the_proxy(self):
+        """
+        Test that the thumbnail URLs of the models point at the proxy
+        """
+        films = self.client.get("/api/v1/collections/feature_films/items").json()
+        video = self.client.get("/api/v1/videos/video1").json()
+
+        self.assertEqual(films[0]["thumbnail_url"], "http://localhost:8000/api/v1/thumbnails/film0")
+        self.assertEqual(video["thumbnail_url"], "http://localhost:8000/api/v1/thumbnails/video1?file=video1_thumb.jpg")
+
+    def test_thumbnail_is_served_with_long_cache_headers(self):
+        """
+        Test that a thumbnail is served from the store with its ETag, and a
+        matching conditional request answers 304
+        """
+        response = self.client.get("/api/v1/thumbnails/video1?file=video1_thumb.jpg")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"image /download/video1/video1_thumb.jpg")
+        self.assertEqual(response.headers["content-type"], "image/jpeg")
+        self.assertIn("max-age=", response.headers["cache-control"])
+
+        revalidated = self.client.get("/api/v1/thumbnails/video1?file=video1_thumb.jpg", headers={"If-None-Match": response.headers["etag"]})
+        self.assertEqual(revalidated.status_code, 304)
+        # Fetched once, through the redirect to the storage node
+        self.assertEqual(self.calls, [
+            "https://archive.org/download/video1/video1_thumb.jpg",
+            f"{STORAGE_NODE}/download/video1/video1_thumb.jpg"
+        ])
+
+    def test_missing_thumbnail(self):
+        """
+        Test that a thumbnail missing upstream answers 404
+        """
+        response = self.client.get("/api/v1/thumbnails/missing1")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_file_names_cannot_leave_the_item(self):
+        """
+        Test that a file name with parent segments answers 404 without reaching upstream
+        """
+        response = self.client.get("/api/v1/thumbnails/video1", params={"file": "../../other/image.jpg"})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.calls, [])
+
+    def test_large_images_are_rejected(self):
+        """
+        Test that an image larger than the limit answers 404 and is not stored
+        """
+        with mock.patch.object(ThumbnailStore, "MAX_SOURCE_BYTES", 10):
+            response = self.client.get("/api/v1/thumbnails/video1?file=video1_thumb.jpg")
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.service.thumbnails.stats()["fetched"], 0)
+
+    def test_redirects_without_a_store(self):
+        """
+        Test that thumbnails redirect to upstream when the store is disabled
+        """
+        self.service.thumbnails = None
+        response = self.client.get("/api/v1/thumbnails/video1", follow_redirects=False)
+
+        self.assertEqual(response.status_code, 307)
+        self.assertEqual(response.headers["location"], "https://archive.org/services/img/video1")
+
+
+if __name__ == "__main__":
+    unittest.main()
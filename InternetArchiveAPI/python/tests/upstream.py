@@ -0,0 +1,68 @@
+"""
+Stubbed Internet Archive upstream shared by the tests
+"""
+import asyncio
+import httpx
+
+# Storage node item files and images are redirected to
+STORAGE_HOST = "ia800100.us.archive.org"
+STORAGE_NODE = f"https://{STORAGE_HOST}/0/items"
+
+
+def make_upstream(calls=None, delay=0.0, scrape_items=None):
+    """
+    Build a mock transport answering advancedsearch, metadata and image requests,
+    the latter redirected to a storage node like archive.org does,
+    optionally waiting `delay` seconds before each response. The scrape API
+    serves `scrape_items` items, or answers 404 when it is None.
+    """
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if delay:
+            await asyncio.sleep(delay)
+        if calls is not None:
+            calls.append(str(request.url))
+        if request.url.path.startswith("/metadata/"):
+            identifier, *part = request.url.path[len("/metadata/"):].split("/")
+            item = {
+                "metadata": {"identifier": identifier, "title": f"Title {identifier}"},
+                "files": [
+                    {"name": f"{identifier}_thumb.jpg", "format": "Thumbnail"},
+                    {"name": f"{identifier}.mp4", "format": "h.264"},
+                    {"name": f"{identifier}.ogv", "format": "Ogg Video"}
+                ]
+            }
+            # Sub-path reads such as /metadata/{id}/files return a single part
+            return httpx.Response(200, json={"result": item[part[0]]} if part else item)
+        if request.url.path.startswith(("/services/img/", "/download/")):
+            if "missing" in request.url.path:
+                return httpx.Response(404)
+            # Like archive.org, files are redirected to the storage node holding the item
+            return httpx.Response(302, headers={"Location": f"{STORAGE_NODE}{request.url.raw_path.decode()}"})
+        if request.url.host == STORAGE_HOST:
+            path = request.url.path[len("/0/items"):]
+            return httpx.Response(200, content=b"image " + path.encode(), headers={"Content-Type": "image/jpeg"})
+        if request.url.path.endswith("/scrape"):
+            if scrape_items is None:
+                return httpx.Response(404)
+            start = int(request.url.params.get("cursor", "0"))
+            end = start + int(request.url.params.get("count", "100"))
+            body = {"items": [{"identifier": f"item{i}", "title": f"Item {i}"} for i in range(start, min(end, scrape_items))]}
+            if end < scrape_items:
+                body["cursor"] = str(end)
+            return httpx.Response(200, json=body)
+        query = request.url.params.get("q", "")
+        if query.startswith("identifier:(missing"):
+            docs = []
+        elif query.startswith("identifier:"):
+            identifiers = query[len("identifier:("):-1].split(" OR ")
+            docs = [
+                {"identifier": identifier, "title": f"Title {identifier}"}
+                for identifier in identifiers if not identifier.startswith("missing")
+            ]
+        else:
+            docs = [{"identifier": f"film{i}", "title": f"Film {i}"} for i in range(3)]
+        return httpx.Response(200, json={
+            "responseHeader": {"params": {"qin": query, "fields": "identifier,title,description"}},
+            "response": {"numFound": len(docs), "start": 0, "docs": docs}
+        })
+    return httpx.MockTransport(handler)
\ No newline at end of file
@@ -53,4 +53,14 @@ export const getVideoDetails = async (identifier) => {
   }
 };
 
+export const getVideosDetails = async (identifiers) => {
+  try {
+    const response = await api.post('/videos:batch', { ids: identifiers });
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching video details batch:', error);
+    throw error;
+  }
+};
+
 export default api; 
\ No newline at end of file